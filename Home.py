@@ -1,5 +1,5 @@
 import streamlit as st
-from ui import inject
+from ui import inject, debug_panel
 
 st.set_page_config(page_title="PFM Retail Performance Suite", layout="wide")
 inject()
@@ -15,3 +15,5 @@ st.markdown(
 st.markdown("#### Tips")
 st.write("- Vul eerst `.streamlit/secrets.toml` met je API_URL en (optioneel) LIVE_URL.")
 st.write("- Alle API-calls zijn **POST** en gebruiken **herhaalde querykeys zonder `[]`**.")
+
+debug_panel()
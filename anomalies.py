@@ -0,0 +1,204 @@
+# anomalies.py
+# Batch-detectie van target-breaches en afwijkingen over alle shops tegelijk.
+# Baseline per shop x weekdag (x uur): mediaan en MAD over de vorige weken (exclusief de
+# rij zelf); elke rij krijgt een robuuste z-score. Het gescoorde frame wordt per periode
+# gecachet, targets/drempels zijn daarna alleen nog een filter. Eén exceptions-overzicht i.p.v.
+# N losse lookups per shop.
+import threading
+import time
+import warnings
+from datetime import date, timedelta
+from typing import Dict, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from hourly_diagnostics import HOURLY_SHOP_BATCH, load_profile
+from kpi_rollups import conversion_to_fraction
+from utils_pfmx import _ttl_for_period, expand_period, fetch_report, normalize_report_days_to_df, span
+
+SCORED_METRICS = ("count_in", "conversion_pct", "sales_per_visitor")
+BASELINE_WEEKS = 6
+MIN_HISTORY = 3       # minimaal aantal waarnemingen in een baselinegroep
+MAD_SCALE = 1.4826    # MAD -> sigma bij normale verdeling
+MEAN_AD_SCALE = 1.2533  # gemiddelde absolute afwijking -> sigma bij normale verdeling
+MIN_SIGMA_REL = 0.05  # sigma minimaal 5% van de baseline
+
+def _prepare(frame: pd.DataFrame, time_col: str) -> pd.DataFrame:
+    out = pd.DataFrame({
+        "shop_id": frame["shop_id"].astype("int64").to_numpy(),
+        "timestamp": pd.to_datetime(frame[time_col]).to_numpy(),
+        "count_in": pd.to_numeric(frame.get("count_in", np.nan), errors="coerce"),
+        "conversion_pct": conversion_to_fraction(frame["conversion_rate"]) * 100.0
+        if "conversion_rate" in frame else np.nan,
+        "sales_per_visitor": pd.to_numeric(frame.get("sales_per_visitor", np.nan), errors="coerce"),
+    })
+    # Gesloten uren/dagen (geen bezoekers) tellen niet mee in baseline of detectie
+    return out[out["count_in"].fillna(0) > 0].reset_index(drop=True)
+
+def _prior_windows(values: np.ndarray, group: np.ndarray, pos: np.ndarray, n_groups: int, window: int) -> np.ndarray:
+    """(rijen, window) matrix met per rij de vorige `window` waarnemingen in zijn groep (NaN-opgevuld)."""
+    length = int(pos.max()) + 1 if len(pos) else 0
+    grid = np.full((n_groups, window + length), np.nan)
+    grid[group, window + pos] = values
+    # Venster i beslaat grid[i : i+window] = waarnemingen i-window .. i-1: het punt zelf niet
+    win = np.lib.stride_tricks.sliding_window_view(grid, window, axis=1)
+    return win[group, pos]
+
+def score_frame(frame: pd.DataFrame, by_hour: bool, window: int = BASELINE_WEEKS) -> pd.DataFrame:
+    """
+    Voeg per metric <metric>_baseline (mediaan) en <metric>_z (robuuste z-score) toe.
+    Baseline = de `window` vorige waarnemingen in dezelfde groep (shop x weekdag [x uur]),
+    exclusief de rij zelf. z is NaN bij minder dan MIN_HISTORY waarnemingen of een
+    volledig vlakke historie (geen spreiding om tegen af te zetten).
+    frame: shop_id, timestamp, count_in, conversion_pct, sales_per_visitor.
+    """
+    ts = pd.DatetimeIndex(frame["timestamp"])
+    keys = [frame["shop_id"].to_numpy(), ts.dayofweek.to_numpy()]
+    if by_hour:
+        keys.append(ts.hour.to_numpy())
+    # Groep-id en positie in tijdsvolgorde binnen de groep
+    order = np.lexsort([ts.asi8, *reversed(keys)])
+    grouped = pd.DataFrame({f"k{i}": k[order] for i, k in enumerate(keys)})
+    group = np.empty(len(frame), dtype=np.int64)
+    pos = np.empty(len(frame), dtype=np.int64)
+    by = grouped.groupby(list(grouped.columns), sort=False)
+    group[order] = by.ngroup().to_numpy()
+    pos[order] = by.cumcount().to_numpy()
+    n_groups = int(group.max()) + 1 if len(group) else 0
+
+    out = frame.copy()
+    for m in SCORED_METRICS:
+        values = pd.to_numeric(frame[m], errors="coerce").to_numpy(dtype=np.float64)
+        if not len(values):
+            out[f"{m}_baseline"] = out[f"{m}_z"] = np.nan
+            continue
+        win = _prior_windows(values, group, pos, n_groups, window)
+        n = np.sum(~np.isnan(win), axis=1)
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)  # lege vensters (begin van de reeks)
+            median = np.nanmedian(win, axis=1)
+            dev = np.abs(win - median[:, None])
+            sigma = MAD_SCALE * np.nanmedian(dev, axis=1)
+            # MAD = 0 (meer dan de helft gelijk): val terug op de gemiddelde absolute afwijking
+            sigma = np.where(sigma > 0, sigma, MEAN_AD_SCALE * np.nanmean(dev, axis=1))
+        # Ondergrens t.o.v. het niveau: een paar procent verschuiving is geen afwijking
+        sigma = np.maximum(sigma, MIN_SIGMA_REL * np.abs(median))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            z = (values - median) / sigma
+        out[f"{m}_baseline"] = median
+        out[f"{m}_z"] = np.where((n >= MIN_HISTORY) & (sigma > 0), z, np.nan)
+    return out
+
+def _window(period: str, date_from: Optional[str], date_to: Optional[str], baseline_weeks: int) -> Tuple[date, date, date]:
+    if period == "date":
+        if not date_from or not date_to:
+            raise ValueError("Voor period='date' zijn 'date_from' en 'date_to' verplicht (YYYY-MM-DD).")
+        start, end = date.fromisoformat(date_from), date.fromisoformat(date_to)
+    else:
+        start, end = expand_period(period)
+    return start - timedelta(weeks=baseline_weeks), start, end
+
+_MEMO_SIZE = 16
+_memo: Dict[Tuple, Tuple[float, pd.DataFrame]] = {}
+_memo_lock = threading.Lock()
+
+def load_scored(
+    shop_ids: Sequence[int],
+    period: str = "last_week",
+    step: str = "hour",
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    baseline_weeks: int = BASELINE_WEEKS,
+) -> pd.DataFrame:
+    """
+    Gescoord frame voor alle shops in de gekozen periode, met een baseline over de
+    baseline_weeks daarvoor (plus de periode zelf). Eén gebatchte fetch per (shops,
+    periode, step) binnen de cache-TTL; behandel het resultaat als read-only.
+    """
+    if step not in ("hour", "day"):
+        raise ValueError(f"Onbekende step: {step!r} (verwacht 'hour' of 'day')")
+    ids = tuple(sorted({int(s) for s in shop_ids}))
+    base_start, start, end = _window(period, date_from, date_to, baseline_weeks)
+    key = (ids, step, base_start, start, end)
+    now = time.monotonic()
+    with _memo_lock:
+        hit = _memo.get(key)
+        if hit is not None and hit[0] > now:
+            return hit[1]
+
+    window = dict(period="date", date_from=base_start.isoformat(), date_to=end.isoformat())
+    if step == "hour":
+        _, hdf = load_profile(ids, **window)
+        frame = _prepare(hdf.reset_index(), "timestamp")
+    else:
+        payload = fetch_report(
+            data=list(ids),
+            data_output=["count_in", "conversion_rate", "sales_per_visitor", "turnover"],
+            shop_batch_size=HOURLY_SHOP_BATCH if len(ids) > HOURLY_SHOP_BATCH else None,
+            **window,
+        )
+        frame = _prepare(normalize_report_days_to_df(payload), "date")
+
+    with span("aggregate.anomalies", rows=len(frame)):
+        scored = score_frame(frame, by_hour=step == "hour", window=baseline_weeks)
+        scored = scored[scored["timestamp"] >= pd.Timestamp(start)].reset_index(drop=True)
+
+    with _memo_lock:
+        _memo[key] = (now + _ttl_for_period(period, date_to), scored)
+        if len(_memo) > _MEMO_SIZE:
+            _memo.pop(min(_memo, key=lambda k: _memo[k][0]), None)
+    return scored
+
+def exceptions(
+    scored: pd.DataFrame,
+    conv_target: Optional[float] = None,
+    spv_target: Optional[float] = None,
+    z_threshold: float = 3.5,
+) -> pd.DataFrame:
+    """
+    Lange tabel met één rij per (shop, timestamp, metric, type):
+      type 'target'  - conversie (%) < conv_target of SPV < spv_target
+      type 'hoog'/'laag' - |z| >= z_threshold t.o.v. dezelfde weekdag(/uur)
+    """
+    if scored.empty:
+        return pd.DataFrame(columns=["shop_id", "timestamp", "metric", "type", "value", "baseline", "z", "target"])
+    parts = []
+    for m in SCORED_METRICS:
+        value = scored[m].to_numpy()
+        z = scored[f"{m}_z"].to_numpy()
+        with np.errstate(invalid="ignore"):
+            anomalous = np.abs(z) >= z_threshold
+        target = {"conversion_pct": conv_target, "sales_per_visitor": spv_target}.get(m)
+        breach = value < target if target is not None else np.zeros(len(value), dtype=bool)
+        for kind, mask in (("target", breach), ("anomalie", anomalous)):
+            if not mask.any():
+                continue
+            sel = scored.loc[mask]
+            zs = z[mask]
+            parts.append(pd.DataFrame({
+                "shop_id": sel["shop_id"].to_numpy(),
+                "timestamp": sel["timestamp"].to_numpy(),
+                "metric": m,
+                "type": kind if kind == "target" else np.where(zs > 0, "hoog", "laag"),
+                "value": value[mask],
+                "baseline": sel[f"{m}_baseline"].to_numpy(),
+                "z": zs,
+                "target": np.nan if target is None else float(target),
+            }))
+    if not parts:
+        return exceptions(scored.iloc[:0])
+    out = pd.concat(parts, ignore_index=True)
+    return out.sort_values(["timestamp", "shop_id"], ascending=[False, True], ignore_index=True)
+
+def summarize(exc: pd.DataFrame) -> pd.DataFrame:
+    """Aantal exceptions per shop en type (breed), zwaarst getroffen shops eerst."""
+    if exc.empty:
+        return pd.DataFrame(columns=["shop_id", "target", "laag", "hoog", "totaal"])
+    counts = exc.groupby(["shop_id", "type"]).size().unstack("type", fill_value=0)
+    for col in ("target", "laag", "hoog"):
+        if col not in counts:
+            counts[col] = 0
+    counts = counts[["target", "laag", "hoog"]]
+    counts["totaal"] = counts.sum(axis=1)
+    return counts.sort_values("totaal", ascending=False).reset_index()
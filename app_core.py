@@ -0,0 +1,113 @@
+# app_core.py
+# Lichte kern die elke pagina (en Home) bij het opstarten nodig heeft: logger, secrets
+# en instrumentatie (spans/trace/versheid). Alleen stdlib - pandas, numpy, requests en
+# plotly worden hier bewust niet geïmporteerd, zodat Home en pagina-skeletten snel
+# renderen; zware modules laden pas in de tak die ze gebruikt (utils_pfmx, grafieken).
+# utils_pfmx her-exporteert alles hieronder, bestaande imports blijven werken.
+import logging
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger("pfm.utils")
+if not logger.handlers:
+    handler = logging.StreamHandler()
+    fmt = logging.Formatter("[%(levelname)s] %(asctime)s - %(message)s")
+    handler.setFormatter(fmt)
+    logger.addHandler(handler)
+logger.setLevel(logging.INFO)
+
+def _get_secret(key: str, default: Optional[str] = None) -> Optional[str]:
+    try:
+        import streamlit as st
+        return st.secrets.get(key, default)  # type: ignore[attr-defined]
+    except Exception:
+        return os.getenv(key, default)
+
+# -------------------- Instrumentatie --------------------
+# Lichtgewicht spans rond netwerk, JSON decode, normalisatie en aggregatie.
+# - procesbrede totalen per span (voor OpenMetrics export via utils_pfmx.metrics_text())
+# - per rerun een trace (start_trace/current_trace) voor het debug-paneel in ui.py
+
+_TRACE: "ContextVar[Optional[List[Dict[str, Any]]]]" = ContextVar("pfm_trace", default=None)
+# (cache key, stored_at, stale) per geserveerde report payload; gevuld door utils_pfmx
+_FRESHNESS: "ContextVar[Optional[List[Tuple[Any, float, bool]]]]" = ContextVar("pfm_freshness", default=None)
+
+class Metrics:
+    """Procesbrede span-timings en tellers (thread-safe)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.spans: Dict[str, Dict[str, float]] = {}
+        self.counters: Dict[Tuple[str, str], float] = {}
+
+    def observe(self, name: str, seconds: float) -> None:
+        with self._lock:
+            s = self.spans.setdefault(name, {"count": 0, "sum": 0.0, "max": 0.0})
+            s["count"] += 1
+            s["sum"] += seconds
+            s["max"] = max(s["max"], seconds)
+
+    def inc(self, counter: str, span_name: str, value: float = 1.0) -> None:
+        with self._lock:
+            key = (counter, span_name)
+            self.counters[key] = self.counters.get(key, 0.0) + value
+
+    def snapshot(self) -> Tuple[Dict[str, Dict[str, float]], Dict[Tuple[str, str], float]]:
+        with self._lock:
+            return {k: dict(v) for k, v in self.spans.items()}, dict(self.counters)
+
+METRICS = Metrics()
+
+def start_trace() -> List[Dict[str, Any]]:
+    """Begin een nieuwe trace (en versheidsregistratie) voor deze rerun; bovenaan een pagina."""
+    trace: List[Dict[str, Any]] = []
+    _TRACE.set(trace)
+    _FRESHNESS.set([])
+    return trace
+
+def current_trace() -> List[Dict[str, Any]]:
+    return list(_TRACE.get() or [])
+
+@contextmanager
+def span(name: str, **attrs: Any) -> Iterator[Dict[str, Any]]:
+    """
+    Meet de duur van een blok. De yielded dict kan worden aangevuld met
+    bytes/rows/hit; die worden ook als tellers bijgehouden.
+    """
+    rec: Dict[str, Any] = {"span": name, **attrs}
+    t0 = time.perf_counter()
+    try:
+        yield rec
+    finally:
+        seconds = time.perf_counter() - t0
+        rec["ms"] = round(seconds * 1000.0, 2)
+        METRICS.observe(name, seconds)
+        for counter in ("bytes", "rows"):
+            if isinstance(rec.get(counter), (int, float)):
+                METRICS.inc(f"{counter}_total", name, rec[counter])
+        if "hit" in rec:
+            METRICS.inc("cache_hits_total" if rec["hit"] else "cache_misses_total", name)
+        trace = _TRACE.get()
+        if trace is not None:
+            trace.append(rec)
+
+def timed(name: str) -> Callable:
+    """Decorator: span rond een functie; rows = len(resultaat) bij DataFrames."""
+    def deco(fn: Callable) -> Callable:
+        @wraps(fn)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            with span(name) as rec:
+                result = fn(*args, **kwargs)
+                # Geen pandas-import hier: als er een DataFrame terugkomt is pandas al geladen
+                pd = sys.modules.get("pandas")
+                if pd is not None and isinstance(result, pd.DataFrame):
+                    rec["rows"] = len(result)
+                return result
+        return wrapper
+    return deco
@@ -0,0 +1,329 @@
+# batch_export.py
+# Headless export van portfolio-KPI's (dagniveau) zonder UI: companies/shops x periodes.
+# Het werk wordt opgeknipt in jobs (company of shop-batch x datumvenster), parallel
+# opgehaald met een begrensd aantal workers en per job direct weggeschreven:
+#   parquet - map met één part-bestand per job (lees terug met pd.read_parquet(map))
+#   csv     - één bestand, per job aangevuld
+# Afgeronde jobs gaan naar een checkpoint (<out>.checkpoint, JSON lines); hetzelfde
+# commando opnieuw draaien gaat verder waar het gebleven was. Er staan nooit meer dan
+# ~2x workers job-resultaten tegelijk in het geheugen.
+#
+#   python batch_export.py --companies 1234 5678 --periods last_month last_quarter --out exports/kpis
+#   python batch_export.py --all-shops --periods this_year --format csv --out exports/kpis.csv
+#   python batch_export.py ... --restart          # checkpoint negeren en opnieuw beginnen
+import argparse
+import glob
+import hashlib
+import json
+import os
+import sys
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import date
+from typing import Any, Dict, List, Optional, Sequence
+
+import pandas as pd
+
+from utils_pfmx import (
+    FANOUT_MAX_WORKERS,
+    _date_windows,
+    _get_secret,
+    expand_period,
+    fetch_report,
+    logger,
+    normalize_report_days_to_df,
+    span,
+)
+
+EXPORT_OUTPUTS = ["turnover", "conversion_rate", "sales_per_visitor", "count_in"]
+EXPORT_WORKERS = int(_get_secret("EXPORT_WORKERS", str(FANOUT_MAX_WORKERS)))
+EXPORT_SHOP_BATCH = 50     # shops per call bij --shops/--all-shops/--regions
+EXPORT_WINDOW_DAYS = 31    # max dagen per call; lange periodes worden opgeknipt
+CHECKPOINT_VERSION = 1
+
+class ExportJob:
+    """Eén report call: een company of shop-batch over één datumvenster."""
+
+    def __init__(self, period: str, date_from: date, date_to: date,
+                 company: Optional[int] = None, shop_ids: Sequence[int] = ()):
+        self.period = period
+        self.date_from = date_from
+        self.date_to = date_to
+        self.company = company
+        self.shop_ids = list(shop_ids)
+        target = f"company={company}" if company is not None else "shops=" + ",".join(map(str, self.shop_ids))
+        self.key = f"{period}|{date_from.isoformat()}|{date_to.isoformat()}|{target}"
+        # Korte vorm voor logregels
+        if company is None and len(self.shop_ids) > 3:
+            target = f"shops={self.shop_ids[0]}..{self.shop_ids[-1]} ({len(self.shop_ids)})"
+        self.label = f"{period} {date_from.isoformat()}..{date_to.isoformat()} {target}"
+
+def plan_jobs(
+    periods: Sequence[str],
+    companies: Sequence[int] = (),
+    shop_ids: Sequence[int] = (),
+    today: Optional[date] = None,
+    shop_batch_size: int = EXPORT_SHOP_BATCH,
+    window_days: int = EXPORT_WINDOW_DAYS,
+) -> List[ExportJob]:
+    """
+    Deterministische joblijst (zelfde input + today = zelfde keys, nodig voor hervatten).
+    periods: benoemde periodes (zie expand_period) of 'YYYY-MM-DD:YYYY-MM-DD'.
+    """
+    today = today or date.today()
+    ids = sorted({int(s) for s in shop_ids})
+    batches = [ids[i:i + shop_batch_size] for i in range(0, len(ids), shop_batch_size)]
+    jobs = []
+    for period in periods:
+        if ":" in period:
+            start, end = (date.fromisoformat(p) for p in period.split(":", 1))
+        else:
+            start, end = expand_period(period, today)
+        for lo, hi in _date_windows(start, end, window_days):
+            jobs.extend(ExportJob(period, lo, hi, company=int(c)) for c in companies)
+            jobs.extend(ExportJob(period, lo, hi, shop_ids=batch) for batch in batches)
+    return jobs
+
+def _plan_hash(jobs: List[ExportJob], outputs: Sequence[str], fmt: str) -> str:
+    h = hashlib.sha1(f"{fmt}|{','.join(outputs)}".encode())
+    for job in jobs:
+        h.update(job.key.encode())
+    return h.hexdigest()[:16]
+
+class Checkpoint:
+    """
+    Append-only JSON lines: eerste regel is de header (plan, today), daarna één regel per
+    afgeronde job. Een half geschreven laatste regel (crash) wordt genegeerd.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.header: Optional[Dict[str, Any]] = None
+        self.done: Dict[str, Dict[str, Any]] = {}
+        try:
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        rec = json.loads(line)
+                    except ValueError:
+                        continue
+                    if self.header is None:
+                        self.header = rec
+                    elif "job" in rec:
+                        self.done[rec["job"]] = rec
+        except OSError:
+            pass
+
+    def start(self, header: Dict[str, Any]) -> None:
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with open(self.path, "w", encoding="utf-8") as f:
+            f.write(json.dumps(header) + "\n")
+        self.header, self.done = header, {}
+
+    def mark(self, job: ExportJob, **info: Any) -> None:
+        rec = {"job": job.key, **info}
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(rec) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self.done[job.key] = rec
+
+class _ParquetSink:
+    """Map met part-bestanden; elk part wordt atomair geschreven (tmp + rename)."""
+
+    def __init__(self, out: str, checkpoint: Checkpoint, restart: bool):
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise RuntimeError("Parquet export vereist pyarrow (pip install pyarrow) of gebruik --format csv.")
+        self.out = out
+        os.makedirs(out, exist_ok=True)
+        if restart:
+            for path in glob.glob(os.path.join(out, "part-*.parquet")):
+                os.remove(path)
+
+    def write(self, job: ExportJob, df: pd.DataFrame) -> Dict[str, Any]:
+        name = f"part-{hashlib.sha1(job.key.encode()).hexdigest()[:16]}.parquet"
+        path = os.path.join(self.out, name)
+        df.to_parquet(f"{path}.tmp", index=False)
+        os.replace(f"{path}.tmp", path)
+        return {"part": name}
+
+    def close(self) -> None:
+        pass
+
+class _CsvSink:
+    """Eén CSV; na elke job wordt de byte-offset gecheckpoint. Bij hervatten wordt alles
+    na de laatste gecheckpointe offset (half geschreven job) afgeknipt."""
+
+    def __init__(self, out: str, checkpoint: Checkpoint, restart: bool):
+        os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+        offset = 0 if restart else max((r.get("offset", 0) for r in checkpoint.done.values()), default=0)
+        self.f = open(out, "a+b")
+        self.f.truncate(offset)
+        self.f.seek(offset)
+
+    def write(self, job: ExportJob, df: pd.DataFrame) -> Dict[str, Any]:
+        df.to_csv(self.f, header=self.f.tell() == 0, index=False, date_format="%Y-%m-%d")
+        self.f.flush()
+        os.fsync(self.f.fileno())
+        return {"offset": self.f.tell()}
+
+    def close(self) -> None:
+        self.f.close()
+
+def _fetch_job(job: ExportJob, outputs: Sequence[str], labels: Dict[int, str],
+               shop_company: Dict[int, int]) -> pd.DataFrame:
+    payload = fetch_report(
+        data=job.shop_ids,
+        data_output=list(outputs),
+        company=job.company,
+        period="date",
+        date_from=job.date_from.isoformat(),
+        date_to=job.date_to.isoformat(),
+        # Eenmalige bulkdata: niet in de (in-memory) report cache parkeren
+        use_cache=False,
+    )
+    df = normalize_report_days_to_df(payload)
+    # Vaste kolommen en dtypes per job: CSV-kolommen en Parquet-schema blijven gelijk
+    out = pd.DataFrame({
+        "date": pd.to_datetime(df["date"]) if not df.empty else pd.Series(dtype="datetime64[ns]"),
+        "shop_id": df["shop_id"].astype("int64") if not df.empty else pd.Series(dtype="int64"),
+    })
+    out["store"] = out["shop_id"].map(labels).astype("string")
+    if job.company is not None:
+        out["company"] = pd.Series(job.company, index=out.index, dtype="Int64")
+    else:
+        # Shop-batch: company uit de registry (NA als die hem niet kent)
+        out["company"] = out["shop_id"].map(shop_company).astype("Int64")
+    out["period"] = job.period
+    for m in outputs:
+        out[m] = pd.to_numeric(df[m], errors="coerce").astype("float64") if m in df else float("nan")
+    return out
+
+def run_export(
+    jobs: List[ExportJob],
+    out: str,
+    fmt: str = "parquet",
+    outputs: Sequence[str] = EXPORT_OUTPUTS,
+    workers: int = EXPORT_WORKERS,
+    checkpoint: Optional[Checkpoint] = None,
+    restart: bool = False,
+    labels: Optional[Dict[int, str]] = None,
+    shop_company: Optional[Dict[int, int]] = None,
+) -> Dict[str, int]:
+    """
+    Voer de jobs uit (al afgeronde jobs uit het checkpoint worden overgeslagen).
+    Resultaten worden in voltooiingsvolgorde weggeschreven; hooguit 2x workers jobs
+    tegelijk onderweg. Mislukte jobs komen niet in het checkpoint en worden bij een
+    volgende run opnieuw geprobeerd.
+    """
+    checkpoint = checkpoint or Checkpoint(f"{out}.checkpoint")
+    labels = labels or {}
+    shop_company = shop_company or {}
+    sink = (_ParquetSink if fmt == "parquet" else _CsvSink)(out, checkpoint, restart)
+    todo = [job for job in jobs if job.key not in checkpoint.done]
+    stats = {"jobs": len(jobs), "skipped": len(jobs) - len(todo), "done": 0, "failed": 0, "rows": 0}
+    if stats["skipped"]:
+        logger.info("Hervatten: %d van %d jobs al klaar", stats["skipped"], len(jobs))
+    pending = iter(todo)
+    in_flight: Dict[Any, ExportJob] = {}
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="pfm-export") as pool:
+            while True:
+                while len(in_flight) < 2 * max(1, workers):
+                    job = next(pending, None)
+                    if job is None:
+                        break
+                    in_flight[pool.submit(_fetch_job, job, outputs, labels, shop_company)] = job
+                if not in_flight:
+                    break
+                finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for fut in finished:
+                    job = in_flight.pop(fut)
+                    try:
+                        df = fut.result()
+                    except Exception as e:
+                        stats["failed"] += 1
+                        logger.warning("Job mislukt (%s): %s", job.label, e)
+                        continue
+                    # Schrijven gebeurt alleen in deze thread: sink en checkpoint zijn niet thread-safe
+                    with span("export.write", rows=len(df)):
+                        info = sink.write(job, df) if len(df) else {}
+                    checkpoint.mark(job, rows=len(df), **info)
+                    stats["done"] += 1
+                    stats["rows"] += len(df)
+                    logger.info("[%d/%d] %s: %d rijen", stats["skipped"] + stats["done"] + stats["failed"],
+                                len(jobs), job.label, len(df))
+    finally:
+        sink.close()
+    return stats
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description="Headless export van portfolio-KPI's (dagniveau) naar Parquet/CSV.")
+    ap.add_argument("--companies", type=int, nargs="*", default=[],
+                    help="company-ids (één call per company per venster); shops daarvan vallen uit --shops/--regions/--all-shops")
+    ap.add_argument("--shops", type=int, nargs="*", default=[], help="shop-ids")
+    ap.add_argument("--all-shops", action="store_true", help="alle shops uit de shop-registry")
+    ap.add_argument("--regions", nargs="*", default=[], help="shops uit deze regio's (shop-registry)")
+    ap.add_argument("--periods", nargs="+", required=True,
+                    help="benoemde periodes (last_month, this_year, ...) of YYYY-MM-DD:YYYY-MM-DD")
+    ap.add_argument("--outputs", nargs="+", default=EXPORT_OUTPUTS)
+    ap.add_argument("--out", required=True, help="parquet: doelmap; csv: doelbestand")
+    ap.add_argument("--format", choices=["parquet", "csv"], default=None, help="standaard: csv als --out op .csv eindigt")
+    ap.add_argument("--workers", type=int, default=EXPORT_WORKERS)
+    ap.add_argument("--shop-batch", type=int, default=EXPORT_SHOP_BATCH)
+    ap.add_argument("--window-days", type=int, default=EXPORT_WINDOW_DAYS)
+    ap.add_argument("--restart", action="store_true", help="checkpoint negeren en de export opnieuw beginnen")
+    args = ap.parse_args(argv)
+    fmt = args.format or ("csv" if args.out.endswith(".csv") else "parquet")
+
+    if not (args.companies or args.shops or args.regions or args.all_shops):
+        ap.error("geef --companies, --shops, --regions of --all-shops op")
+
+    # Registry alleen voor shop-selecties (labels, company per shop); een export van
+    # alleen companies heeft geen werkende registry/agent-lookup nodig
+    shop_ids: set = set()
+    labels: Dict[int, str] = {}
+    shop_company: Dict[int, int] = {}
+    if args.shops or args.regions or args.all_shops:
+        from shop_mapping import get_registry
+        reg = get_registry()
+        shop_ids = set(args.shops) | set(reg.in_region(*args.regions))
+        if args.all_shops:
+            shop_ids |= set(reg.ids())
+        labels = {i: reg.label(i) for i in reg.ids()}
+        shop_company = {i: reg.get(i)["company"] for i in reg.ids() if reg.get(i)["company"] is not None}
+        # Shops die al in een gevraagde company zitten niet dubbel exporteren
+        covered = {i for i in shop_ids if shop_company.get(i) in set(args.companies)}
+        if covered:
+            logger.info("%d shops overgeslagen: al onderdeel van --companies", len(covered))
+            shop_ids -= covered
+
+    checkpoint = Checkpoint(f"{args.out}.checkpoint")
+    resume = checkpoint.header is not None and not args.restart
+    # Bij hervatten dezelfde 'vandaag' als de eerste run: anders schuiven this_month & co.
+    today = date.fromisoformat(checkpoint.header["today"]) if resume else date.today()
+    try:
+        jobs = plan_jobs(args.periods, args.companies, sorted(shop_ids), today, args.shop_batch, args.window_days)
+    except ValueError as e:
+        ap.error(str(e))
+    plan = _plan_hash(jobs, args.outputs, fmt)
+    if resume and checkpoint.header.get("plan") != plan:
+        logger.error("Checkpoint %s hoort bij een andere export; gebruik --restart of een andere --out.", checkpoint.path)
+        return 2
+    if not resume:
+        checkpoint.start({"version": CHECKPOINT_VERSION, "plan": plan, "today": today.isoformat(),
+                          "format": fmt, "jobs": len(jobs)})
+
+    logger.info("Export: %d jobs, %d parallel -> %s (%s)", len(jobs), args.workers, args.out, fmt)
+    stats = run_export(jobs, args.out, fmt, args.outputs, args.workers, checkpoint, restart=not resume,
+                       labels=labels, shop_company=shop_company)
+    logger.info("Klaar: %d jobs geschreven, %d overgeslagen, %d mislukt, %d rijen",
+                stats["done"], stats["skipped"], stats["failed"], stats["rows"])
+    if stats["failed"]:
+        logger.warning("Niet alles is geëxporteerd; draai hetzelfde commando opnieuw om te hervatten.")
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,95 @@
+# bench/bench_normalize.py
+# Vergelijkt de kolomgewijze normalize_report_days_to_df met de oude rij-voor-rij versie
+# op synthetische payloads, en stdlib json vs de snelle decoder (decode + normalize).
+# Gebruik:  python bench/bench_normalize.py [--rows 10000 100000 1000000] [--decode]
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from utils_pfmx import JSON_DECODER, load_report_json, normalize_report_days_to_df
+
+METRICS = ["turnover", "conversion_rate", "sales_per_visitor", "count_in"]
+
+def legacy_normalize_report_days_to_df(payload):
+    """De oorspronkelijke implementatie (dict per rij), als referentie."""
+    rows = []
+    data_block = payload.get("data") if isinstance(payload, dict) else None
+    if not isinstance(data_block, dict):
+        return pd.DataFrame()
+    for date_key, shop_map in data_block.items():
+        if not isinstance(shop_map, dict):
+            continue
+        for shop_id, entry in shop_map.items():
+            data_dict = entry.get("data", entry) if isinstance(entry, dict) else {}
+            row = {"date": date_key, "shop_id": int(shop_id)}
+            if isinstance(data_dict, dict):
+                row.update({k: v for k, v in data_dict.items()})
+            rows.append(row)
+    df = pd.DataFrame(rows)
+    if not df.empty:
+        df = df.sort_values(["shop_id", "date"]).reset_index(drop=True)
+    return df
+
+def synthetic_payload(n_rows, n_shops=500, seed=0):
+    rng = np.random.default_rng(seed)
+    n_days = max(1, n_rows // n_shops)
+    shops = [str(30000 + i) for i in range(min(n_shops, n_rows))]
+    start = date(2024, 1, 1)
+    data = {}
+    for d in range(n_days):
+        day = (start + timedelta(days=d)).isoformat()
+        vals = rng.random((len(shops), 4))
+        data[day] = {
+            sid: {"data": {
+                "turnover": round(float(v[0]) * 20000, 2),
+                "conversion_rate": round(float(v[1]) * 40, 2),
+                "sales_per_visitor": round(float(v[2]) * 60, 2),
+                "count_in": int(v[3] * 1500),
+            }}
+            for sid, v in zip(shops, vals)
+        }
+    return {"data": data}
+
+def best_of(fn, payload, repeat):
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        df = fn(payload)
+        times.append(time.perf_counter() - t0)
+    return min(times), df
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rows", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--decode", action="store_true", help="meet ook JSON decode + normalize vanaf bytes")
+    args = ap.parse_args()
+
+    print(f"{'rows':>10} {'legacy s':>10} {'columnar s':>11} {'speedup':>8} {'legacy MB':>10} {'columnar MB':>12}")
+    for n in args.rows:
+        payload = synthetic_payload(n)
+        t_old, df_old = best_of(legacy_normalize_report_days_to_df, payload, args.repeat)
+        t_new, df_new = best_of(normalize_report_days_to_df, payload, args.repeat)
+        assert len(df_old) == len(df_new)
+        assert np.allclose(df_old["turnover"].to_numpy(dtype=float), df_new["turnover"].to_numpy())
+        mb_old = df_old.memory_usage(deep=True).sum() / 1e6
+        mb_new = df_new.memory_usage(deep=True).sum() / 1e6
+        print(f"{len(df_new):>10} {t_old:>10.3f} {t_new:>11.3f} {t_old / t_new:>7.1f}x {mb_old:>10.1f} {mb_new:>12.1f}")
+
+    if args.decode:
+        print(f"\n{'rows':>10} {'json+norm s':>12} {JSON_DECODER + '+norm s':>14} {'speedup':>8}")
+        for n in args.rows:
+            raw = json.dumps(synthetic_payload(n)).encode()
+            t_std, _ = best_of(lambda b: normalize_report_days_to_df(json.loads(b)), raw, args.repeat)
+            t_fast, _ = best_of(lambda b: normalize_report_days_to_df(load_report_json(b)), raw, args.repeat)
+            print(f"{n:>10} {t_std:>12.3f} {t_fast:>14.3f} {t_std / t_fast:>7.1f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+# bench/bench_pages.py
+# End-to-end page-load benchmark tegen de lokale mock agent (bench/mock_agent.py).
+# Draait per pagina het datapad (fetch -> normalize -> aggregatie) en rapporteert
+# p50/p95 latency, bytes on the wire en piek-RSS.
+#
+#   python bench/bench_pages.py --shops 50 --latency-ms 200 --repeat 10
+#   python bench/bench_pages.py --warm          # met report cache en store (reruns)
+import argparse
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+import utils_pfmx
+from kpi_rollups import shop_kpis
+from mock_agent import MockAgent
+from report_store import ReportStore, sync_report
+from utils_pfmx import (
+    clear_report_cache,
+    fetch_report,
+    fetch_report_hourly,
+    normalize_report_days_to_df,
+    normalize_report_hourly_to_df,
+)
+
+OUTPUTS = ["conversion_rate", "sales_per_visitor", "count_in", "turnover"]
+
+def page_02_radar(shop_ids):
+    df = normalize_report_days_to_df(fetch_report(data=shop_ids, data_output=OUTPUTS, period="last_month"))
+    return len(shop_kpis(df))
+
+# Portfolio Benchmark leest via de Parquet-store (sync_report); de bench gebruikt een
+# tijdelijke store-map. Koud: per run een lege store; --warm: store blijft staan (alleen delta)
+STORE_DIR = tempfile.mkdtemp(prefix="pfm_bench_store_")
+STORE = ReportStore(STORE_DIR)
+
+def reset_store():
+    global STORE
+    shutil.rmtree(STORE_DIR, ignore_errors=True)
+    STORE = ReportStore(STORE_DIR)
+
+def page_03_benchmark(shop_ids):
+    df = sync_report(data=shop_ids, data_output=OUTPUTS, period="this_year", period_step="day", store=STORE)
+    return len(shop_kpis(df).sort_values("turnover", ascending=False))
+
+def page_04_roi(shop_ids, conv_uplift=5, margin=50, capex=1500):
+    df = normalize_report_days_to_df(fetch_report(data=shop_ids, data_output=OUTPUTS, period="last_month"))
+    base = shop_kpis(df).copy()
+    base["new_conv"] = (base["conv_frac"] + conv_uplift / 100.0).clip(upper=1.0)
+    base["new_spv"] = base["sales_per_visitor"] * (base["new_conv"] / base["conv_frac"]).replace([float("inf")], 1.0)
+    base["extra_gross_profit"] = (base["new_spv"] - base["sales_per_visitor"]) * base["count_in"] * (margin / 100.0)
+    base["payback_months"] = (capex / base["extra_gross_profit"]).replace([float("inf")], 0.0).clip(lower=0.0)
+    return len(base)
+
+def page_05_hourly(shop_ids):
+    hdf = normalize_report_hourly_to_df(fetch_report_hourly(data=shop_ids[:1], data_output=OUTPUTS, period="last_week"))
+    return len(hdf)
+
+SCENARIOS = {
+    "02_radar": page_02_radar,
+    "03_benchmark": page_03_benchmark,
+    "04_roi": page_04_roi,
+    "05_hourly": page_05_hourly,
+}
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0  # Linux: KB
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--shops", type=int, default=50)
+    ap.add_argument("--latency-ms", type=float, default=100.0)
+    ap.add_argument("--jitter-ms", type=float, default=50.0)
+    ap.add_argument("--repeat", type=int, default=5)
+    ap.add_argument("--warm", action="store_true", help="report cache niet legen tussen runs")
+    ap.add_argument("--only", nargs="*", choices=sorted(SCENARIOS), default=None)
+    args = ap.parse_args()
+
+    utils_pfmx.logger.setLevel("WARNING")
+    agent = MockAgent(n_shops=args.shops, latency_ms=args.latency_ms, jitter_ms=args.jitter_ms).start()
+    utils_pfmx.API_URL = agent.url
+    shop_ids = [30000 + i for i in range(args.shops)]
+
+    print(f"{'scenario':<14} {'p50 ms':>8} {'p95 ms':>8} {'calls':>6} {'KB/run':>9} {'peak RSS MB':>12}")
+    try:
+        for name in args.only or SCENARIOS:
+            fn = SCENARIOS[name]
+            times = []
+            req0, bytes0 = agent.requests, agent.bytes_sent
+            for _ in range(args.repeat):
+                if not args.warm:
+                    clear_report_cache()
+                    reset_store()
+                t0 = time.perf_counter()
+                fn(shop_ids)
+                times.append((time.perf_counter() - t0) * 1000.0)
+            calls = (agent.requests - req0) / args.repeat
+            kb = (agent.bytes_sent - bytes0) / args.repeat / 1024.0
+            p50, p95 = np.percentile(times, [50, 95])
+            print(f"{name:<14} {p50:>8.1f} {p95:>8.1f} {calls:>6.1f} {kb:>9.1f} {peak_rss_mb():>12.1f}")
+    finally:
+        agent.stop()
+        shutil.rmtree(STORE_DIR, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
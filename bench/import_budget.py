@@ -0,0 +1,94 @@
+# bench/import_budget.py
+# Import-tijd budget voor Home.py en alle pagina's. Per script, in een vers proces:
+# streamlit vooraf laden (zit altijd al in de server), dan de module-level imports van
+# het script plus inject() (de bootstrap die elke pagina draait) uitvoeren en meten.
+# Faalt (exit 1) als een script boven het budget zit of een verboden zware module
+# (plotly.express; voor Home ook pandas/numpy/requests/utils_pfmx) bij import laadt.
+#
+#   python bench/import_budget.py                    # standaardbudgetten
+#   python bench/import_budget.py --budget-ms 800 --home-budget-ms 100 --repeat 5
+import argparse
+import ast
+import glob
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+# Zware modules die pas in de tak die ze gebruikt geladen mogen worden
+FORBIDDEN = ["plotly.express"]
+HOME_FORBIDDEN = FORBIDDEN + ["pandas", "numpy", "requests", "utils_pfmx"]
+
+CHILD = """
+import json, sys, time
+sys.path.insert(0, {root!r})
+import streamlit
+before = set(sys.modules)
+t0 = time.perf_counter()
+{imports}
+ms = (time.perf_counter() - t0) * 1000.0
+print(json.dumps({{"ms": ms, "loaded": sorted(m for m in sys.modules if m not in before)}}))
+"""
+
+def bootstrap_source(path):
+    """Module-level imports (ook binnen try/if op topniveau) en inject()-calls als broncode."""
+    tree = ast.parse(open(path, encoding="utf-8").read(), filename=path)
+    out = []
+
+    def walk(body):
+        for node in body:
+            if isinstance(node, (ast.Import, ast.ImportFrom)):
+                out.append(ast.unparse(node))
+            elif isinstance(node, ast.Try):
+                # Optionele imports: in het kind ook optioneel laten
+                for stmt in node.body:
+                    if isinstance(stmt, (ast.Import, ast.ImportFrom)):
+                        out.append(f"try:\n    {ast.unparse(stmt)}\nexcept Exception:\n    pass")
+            elif isinstance(node, ast.If):
+                walk(node.body)
+            elif (isinstance(node, ast.Expr) and isinstance(node.value, ast.Call)
+                  and isinstance(node.value.func, ast.Name) and node.value.func.id == "inject"):
+                out.append(ast.unparse(node))
+    walk(tree.body)
+    return out
+
+def measure(path, repeat):
+    code = CHILD.format(root=ROOT, imports="\n".join(bootstrap_source(path)) or "pass")
+    runs = []
+    for _ in range(repeat):
+        res = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True)
+        if res.returncode != 0:
+            raise RuntimeError(f"{os.path.relpath(path, ROOT)}: import faalt\n{res.stderr.strip()}")
+        runs.append(json.loads(res.stdout.strip().splitlines()[-1]))
+    return statistics.median(r["ms"] for r in runs), set(runs[0]["loaded"])
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--budget-ms", type=float, default=1500.0, help="budget per pagina (ms)")
+    ap.add_argument("--home-budget-ms", type=float, default=150.0, help="budget voor Home.py (ms)")
+    ap.add_argument("--repeat", type=int, default=3, help="verse processen per script (mediaan)")
+    args = ap.parse_args()
+
+    scripts = [os.path.join(ROOT, "Home.py")] + sorted(glob.glob(os.path.join(ROOT, "pages", "*.py")))
+    failures = 0
+    print(f"{'script':<42}{'ms':>9}{'budget':>9}  status")
+    for path in scripts:
+        is_home = os.path.basename(path) == "Home.py"
+        budget = args.home_budget_ms if is_home else args.budget_ms
+        ms, loaded = measure(path, args.repeat)
+        heavy = [m for m in (HOME_FORBIDDEN if is_home else FORBIDDEN) if m in loaded]
+        problems = []
+        if ms > budget:
+            problems.append("te traag")
+        if heavy:
+            problems.append("laadt " + ", ".join(heavy))
+        failures += bool(problems)
+        status = "OK" if not problems else "FAIL: " + "; ".join(problems)
+        print(f"{os.path.relpath(path, ROOT):<42}{ms:>9.0f}{budget:>9.0f}  {status}")
+    sys.exit(1 if failures else 0)
+
+if __name__ == "__main__":
+    main()
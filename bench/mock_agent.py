@@ -0,0 +1,161 @@
+# bench/mock_agent.py
+# Lokale stand-in voor de vemcount agent: /get-report en /live-inside.
+# Accepteert dezelfde form-POST met herhaalde keys (data=1&data=2&data_output=...)
+# en genereert realistische, deterministische payloads.
+#
+#   python bench/mock_agent.py --port 8765 --shops 200 --latency-ms 150
+#   # en dan in .streamlit/secrets.toml: API_URL = "http://127.0.0.1:8765/get-report"
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+import zlib
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from utils_pfmx import expand_period
+
+DEFAULT_OUTPUTS = ["turnover", "conversion_rate", "sales_per_visitor", "count_in"]
+OPEN_HOURS = range(9, 22)
+
+def _metrics(rng, outputs, scale=1.0):
+    count_in = int(rng.integers(200, 1500) * scale)
+    conv = float(rng.uniform(0.12, 0.38))
+    spv = float(rng.uniform(8.0, 55.0))
+    values = {
+        "count_in": count_in,
+        "conversion_rate": round(conv * 100, 2),
+        "sales_per_visitor": round(spv, 2),
+        "turnover": round(count_in * spv, 2),
+    }
+    return {k: values.get(k, round(float(rng.random()) * 100, 2)) for k in outputs}
+
+def generate_report(params, n_shops=50, base_shop=30000, today=None):
+    """Bouw een report payload uit de geparste form-params (lijst van (key, value))."""
+    multi = {}
+    for k, v in params:
+        multi.setdefault(k, []).append(v)
+    shops = [int(s) for s in multi.get("data", [])] or [base_shop + i for i in range(n_shops)]
+    outputs = multi.get("data_output") or DEFAULT_OUTPUTS
+    period = (multi.get("period") or ["this_month"])[0]
+    step = (multi.get("period_step") or ["day"])[0]
+    if period == "date":
+        start = date.fromisoformat(multi["date_from"][0])
+        end = date.fromisoformat(multi["date_to"][0])
+    else:
+        start, end = expand_period(period, today)
+
+    data = {}
+    d = start
+    while d <= end:
+        day_key = d.isoformat()
+        if step == "hour":
+            hours = {}
+            for h in OPEN_HOURS:
+                hours[f"{h:02d}:00"] = {
+                    str(s): {"data": _metrics(np.random.default_rng(zlib.crc32(f"{s}{day_key}{h}".encode())), outputs, 0.1)}
+                    for s in shops
+                }
+            data[day_key] = hours
+        else:
+            data[day_key] = {
+                str(s): {"data": _metrics(np.random.default_rng(zlib.crc32(f"{s}{day_key}".encode())), outputs)}
+                for s in shops
+            }
+        d += timedelta(days=1)
+    return {"data": data, "period": period, "period_step": step}
+
+def generate_live(params):
+    shops = [int(v) for k, v in params if k == "data"]
+    rng = np.random.default_rng(int(time.time() // 30))
+    return {"data": {
+        str(s): {
+            "occupancy": int(rng.integers(0, 80)),
+            "in_store": int(rng.integers(0, 80)),
+            "enter": int(rng.integers(0, 30)),
+            "exit": int(rng.integers(0, 30)),
+        }
+        for s in shops
+    }}
+
+class MockAgent:
+    """Threaded HTTP server; houdt requests en bytes on the wire bij."""
+
+    def __init__(self, host="127.0.0.1", port=0, n_shops=50, latency_ms=0.0, jitter_ms=0.0):
+        self.n_shops = n_shops
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.requests = 0
+        self.bytes_sent = 0
+        self._lock = threading.Lock()
+        agent = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length") or 0)).decode()
+                params = parse_qsl(body, keep_blank_values=True)
+                path = urlsplit(self.path).path.rstrip("/")
+                delay = agent.latency_ms + (np.random.uniform(0, agent.jitter_ms) if agent.jitter_ms else 0.0)
+                if delay:
+                    time.sleep(delay / 1000.0)
+                if path == "/get-report":
+                    payload = generate_report(params, n_shops=agent.n_shops)
+                elif path == "/live-inside":
+                    payload = generate_live(params)
+                else:
+                    self.send_error(404)
+                    return
+                raw = json.dumps(payload).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(raw)))
+                self.end_headers()
+                self.wfile.write(raw)
+                with agent._lock:
+                    agent.requests += 1
+                    agent.bytes_sent += len(raw)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/get-report"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8765)
+    ap.add_argument("--shops", type=int, default=50, help="aantal shops bij company-calls zonder data")
+    ap.add_argument("--latency-ms", type=float, default=0.0)
+    ap.add_argument("--jitter-ms", type=float, default=0.0)
+    args = ap.parse_args()
+    agent = MockAgent(args.host, args.port, args.shops, args.latency_ms, args.jitter_ms)
+    print(f"Mock agent op {agent.url} (live: /live-inside)")
+    try:
+        agent.server.serve_forever()
+    except KeyboardInterrupt:
+        agent.stop()
+
+if __name__ == "__main__":
+    main()
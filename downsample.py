@@ -0,0 +1,122 @@
+# downsample.py
+# Server-side downsampling voor lange tijdreeksen vóór Plotly: LTTB (largest triangle
+# three buckets) of min/max per bucket, begrensd op de pixelbreedte van de grafiek.
+# Resultaten worden per (dataversie, kolommen, zoombereik, breedte) gecachet, zodat
+# reruns en heen-en-weer zoomen geen herberekening kosten.
+import threading
+from collections import OrderedDict
+from typing import Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from utils_pfmx import _get_secret, span
+
+CHART_WIDTH_PX = int(_get_secret("CHART_WIDTH_PX", "800"))
+_MEMO_SIZE = 64
+_memo: "OrderedDict[Tuple, pd.DataFrame]" = OrderedDict()
+_memo_lock = threading.Lock()
+
+def _as_float(x: np.ndarray) -> np.ndarray:
+    if np.issubdtype(x.dtype, np.datetime64):
+        return x.astype("datetime64[ns]").astype(np.int64).astype(np.float64)
+    return x.astype(np.float64)
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    """
+    Indices van de LTTB-selectie (eerste en laatste punt blijven altijd staan).
+    x oplopend; NaN in y telt als 0 voor de driehoeksoppervlakte.
+    """
+    n = len(y)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    xf = _as_float(np.asarray(x))
+    yf = np.nan_to_num(np.asarray(y, dtype=np.float64))
+    # n_out - 2 buckets tussen eerste en laatste punt
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    out = np.empty(n_out, dtype=np.int64)
+    out[0], out[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], max(edges[i + 1], edges[i] + 1)
+        nlo, nhi = edges[i + 1], edges[i + 2] if i + 2 < len(edges) else n
+        nhi = max(nhi, nlo + 1)
+        # Gemiddelde van de volgende bucket als derde hoekpunt
+        cx, cy = xf[nlo:nhi].mean(), yf[nlo:nhi].mean()
+        bx, by = xf[lo:hi], yf[lo:hi]
+        area = np.abs((xf[a] - cx) * (by - yf[a]) - (xf[a] - bx) * (cy - yf[a]))
+        a = lo + int(area.argmax())
+        out[i + 1] = a
+    return out
+
+def minmax_indices(y: np.ndarray, n_out: int) -> np.ndarray:
+    """Per bucket de index van min en max (2 punten per bucket), in tijdvolgorde."""
+    n = len(y)
+    buckets = max(1, n_out // 2)
+    if n <= n_out or buckets >= n:
+        return np.arange(n)
+    yf = np.asarray(y, dtype=np.float64)
+    edges = np.linspace(0, n, buckets + 1).astype(np.int64)
+    size = int(np.diff(edges).max())
+    # Buckets opvullen tot gelijke lengte zodat argmin/argmax in één keer kan
+    idx = edges[:-1, None] + np.arange(size)[None, :]
+    valid = idx < edges[1:, None]
+    idx = np.minimum(idx, n - 1)
+    vals = yf[idx]
+    lo = np.where(valid, np.nan_to_num(vals, nan=np.inf), np.inf).argmin(axis=1)
+    hi = np.where(valid, np.nan_to_num(vals, nan=-np.inf), -np.inf).argmax(axis=1)
+    rows = np.arange(buckets)
+    picks = np.concatenate([idx[rows, lo], idx[rows, hi], [0, n - 1]])
+    return np.unique(picks)
+
+def _version(df: pd.DataFrame, cols: Sequence[str]) -> int:
+    return int(pd.util.hash_pandas_object(df[list(cols)], index=False).sum())
+
+def downsample(
+    df: pd.DataFrame,
+    x: str,
+    ys: Sequence[str],
+    width_px: Optional[int] = None,
+    method: str = "lttb",
+    x_range: Optional[Tuple] = None,
+) -> pd.DataFrame:
+    """
+    Beperk df tot ~width_px punten per reeks (LTTB) of 2 per pixelkolom (minmax).
+    - df moet op x gesorteerd zijn (normalizers leveren dat al)
+    - x_range=(van, tot): eerst inzoomen (binary search), dan downsamplen
+    - meerdere ys: unie van de geselecteerde indices, zodat elke reeks zijn pieken houdt
+    Resultaat is gecachet per dataversie/zoom/breedte; behandel het als read-only.
+    """
+    width_px = width_px or CHART_WIDTH_PX
+    if method not in ("lttb", "minmax"):
+        raise ValueError(f"Onbekende methode: {method!r} (verwacht 'lttb' of 'minmax')")
+    ys = [c for c in ys if c in df.columns]
+    if df.empty or not ys:
+        return df
+    key = (_version(df, [x, *ys]), x, tuple(ys), width_px, method, x_range)
+    with _memo_lock:
+        hit = _memo.get(key)
+        if hit is not None:
+            _memo.move_to_end(key)
+            return hit
+
+    with span("downsample", rows=len(df)) as rec:
+        view = df
+        if x_range is not None:
+            xs = df[x].to_numpy()
+            lo = np.searchsorted(xs, np.asarray(x_range[0], dtype=xs.dtype), side="left")
+            hi = np.searchsorted(xs, np.asarray(x_range[1], dtype=xs.dtype), side="right")
+            view = df.iloc[lo:hi]
+        n_out = width_px if method == "lttb" else 2 * width_px
+        if len(view) > n_out:
+            xs = view[x].to_numpy()
+            picks = [lttb_indices(xs, view[c].to_numpy(), n_out) if method == "lttb"
+                     else minmax_indices(view[c].to_numpy(), n_out) for c in ys]
+            view = view.iloc[np.unique(np.concatenate(picks))]
+        rec["points"] = len(view)
+
+    with _memo_lock:
+        _memo[key] = view
+        while len(_memo) > _MEMO_SIZE:
+            _memo.popitem(last=False)
+    return view
@@ -0,0 +1,87 @@
+# formatting.py
+# Gedeelde EU-notatie (1.234,56) voor KPI-kaarten en tabellen.
+# Tabellen blijven numeriek: de notatie zit in een Styler (of column_config bij heel
+# grote tabellen), zodat sorteren op getallen blijft werken en er geen string-kolommen
+# per cel opgebouwd worden.
+from typing import Dict, Optional, Tuple
+
+import pandas as pd
+import streamlit as st
+
+# Styler rendert elke cel in Python; boven deze grens schakelen we over op
+# column_config (client-side formattering, zonder duizendtalscheiding).
+STYLER_MAX_CELLS = 50_000
+
+_EU = str.maketrans({",": ".", ".": ","})
+
+def _eu_number(v, decimals: int) -> str:
+    return f"{float(v):,.{decimals}f}".translate(_EU)
+
+def fmt_eur(v, decimals: int = 0) -> str:
+    """€1.234 / €12,50; ongeldige waarden -> €0."""
+    try:
+        return "€" + _eu_number(v, decimals)
+    except (TypeError, ValueError):
+        return "€0"
+
+def fmt_pct(v, decimals: int = 1) -> str:
+    """12,3%; ongeldige waarden -> 0%."""
+    try:
+        return _eu_number(v, decimals) + "%"
+    except (TypeError, ValueError):
+        return "0%"
+
+def fmt_num(v, decimals: int = 1) -> str:
+    """1.234,5; ongeldige waarden -> 0."""
+    try:
+        return _eu_number(v, decimals)
+    except (TypeError, ValueError):
+        return "0"
+
+def fmt_int(v) -> str:
+    """1.234; ongeldige waarden -> 0."""
+    try:
+        return _eu_number(v, 0)
+    except (TypeError, ValueError):
+        return "0"
+
+def _parse_spec(spec: str) -> Tuple[str, int]:
+    # "eur2" -> ("eur", 2), "pct" -> ("pct", 1), "int" -> ("int", 0)
+    kind = spec.rstrip("0123456789")
+    digits = spec[len(kind):]
+    if kind not in ("eur", "pct", "int", "num"):
+        raise ValueError(f"Onbekend formaat: {spec!r} (verwacht eur/pct/int/num + decimalen)")
+    default = {"eur": 0, "pct": 1, "int": 0, "num": 2}[kind]
+    return kind, int(digits) if digits else default
+
+_PATTERNS = {"eur": "€{:,.%df}", "pct": "{:,.%df}%%", "int": "{:,.%df}", "num": "{:,.%df}"}
+_PRINTF = {"eur": "€ %%.%df", "pct": "%%.%df%%%%", "int": "%%.%df", "num": "%%.%df"}
+
+def style_eu(df: pd.DataFrame, formats: Dict[str, str], na_rep: str = "–"):
+    """
+    Styler met EU-notatie per kolom, bv. {"turnover": "eur0", "conversion_pct": "pct1",
+    "count_in": "int"}. De onderliggende kolommen blijven numeriek.
+    """
+    styler = df.style
+    for col, spec in formats.items():
+        if col not in df.columns:
+            continue
+        kind, decimals = _parse_spec(spec)
+        styler = styler.format(_PATTERNS[kind] % decimals, subset=[col], thousands=".", decimal=",", na_rep=na_rep)
+    return styler
+
+def column_config_eu(formats: Dict[str, str]) -> Dict[str, "st.column_config.NumberColumn"]:
+    """column_config-variant van style_eu (printf, geformatteerd in de browser)."""
+    out = {}
+    for col, spec in formats.items():
+        kind, decimals = _parse_spec(spec)
+        out[col] = st.column_config.NumberColumn(format=_PRINTF[kind] % decimals)
+    return out
+
+def eu_dataframe(df: pd.DataFrame, formats: Dict[str, str], column_config: Optional[dict] = None, **kwargs):
+    """st.dataframe met EU-notatie; kiest Styler of column_config op basis van tabelgrootte."""
+    if df.size <= STYLER_MAX_CELLS:
+        return st.dataframe(style_eu(df, formats), column_config=column_config, **kwargs)
+    config = column_config_eu({c: s for c, s in formats.items() if c in df.columns})
+    config.update(column_config or {})
+    return st.dataframe(df, column_config=config, **kwargs)
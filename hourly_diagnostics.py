@@ -0,0 +1,205 @@
+# hourly_diagnostics.py
+# Uur-diagnostiek voor meerdere shops tegelijk: één (parallelle) hourly fetch per periode,
+# daarna dichte arrays (shop x weekdag x uur) waar heatmaps, piekuren en
+# bezettingsgaten direct uit gelezen worden. Wisselen van store = indexeren, geen POST.
+import threading
+import time
+from typing import Dict, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from utils_pfmx import _ttl_for_period, fetch_report_hourly, normalize_report_hourly_to_df, span
+from kpi_rollups import conversion_to_fraction
+
+WEEKDAYS = ["ma", "di", "wo", "do", "vr", "za", "zo"]
+HOURS = 24
+HOURLY_OUTPUTS = ["count_in", "conversion_rate", "sales_per_visitor", "turnover"]
+METRICS = ("count_in", "conversion_pct", "sales_per_visitor", "turnover")
+HOURLY_SHOP_BATCH = 10  # shops per hourly POST; batches gaan parallel via de fan-out
+
+class HourlyProfile:
+    """
+    Dichte weekdag x uur profielen per shop. Sommen (bezoekers, omzet, conversies) en
+    het aantal waargenomen dagen per cel; gemiddelden worden daaruit afgeleid:
+      count_in / turnover  - gemiddelde per dag voor die weekdag+uur
+      conversion_pct       - bezoekers-gewogen conversie (%)
+      sales_per_visitor    - omzet / bezoekers
+    Arrays hebben shape (n_shops, 7, 24); shop_ids geeft de volgorde van as 0.
+    """
+
+    def __init__(self, shop_ids: Sequence[int], visitors, turnover, converted, days):
+        self.shop_ids = np.asarray(shop_ids, dtype=np.int64)
+        self._pos = {int(s): i for i, s in enumerate(self.shop_ids)}
+        self.visitors = visitors
+        self.turnover_sum = turnover
+        self.converted = converted
+        self.days = days
+        with np.errstate(divide="ignore", invalid="ignore"):
+            self.count_in = np.where(days > 0, visitors / days, np.nan)
+            self.turnover = np.where(days > 0, turnover / days, np.nan)
+            self.conversion_pct = np.where(visitors > 0, converted / visitors * 100.0, np.nan)
+            self.sales_per_visitor = np.where(visitors > 0, turnover / visitors, np.nan)
+
+    def __len__(self) -> int:
+        return len(self.shop_ids)
+
+    def index_of(self, shop_id: int) -> int:
+        try:
+            return self._pos[int(shop_id)]
+        except KeyError:
+            raise ValueError(f"Shop {shop_id} zit niet in dit profiel") from None
+
+    def _metric(self, metric: str) -> np.ndarray:
+        if metric not in METRICS:
+            raise ValueError(f"Onbekende metric: {metric!r} (verwacht één van {', '.join(METRICS)})")
+        return getattr(self, metric)
+
+    def heatmap(self, shop_id: int, metric: str = "count_in", hours: Optional[range] = None) -> pd.DataFrame:
+        """Weekdag x uur tabel voor één shop (standaard alleen uren met data)."""
+        grid = self._metric(metric)[self.index_of(shop_id)]
+        if hours is None:
+            hours = self.open_hours()
+        return pd.DataFrame(grid[:, list(hours)], index=pd.Index(WEEKDAYS, name="weekday"),
+                            columns=pd.Index(list(hours), name="hour"))
+
+    def open_hours(self) -> range:
+        """Kleinste aaneengesloten uurrange met bezoekers over alle shops."""
+        active = np.flatnonzero(self.visitors.sum(axis=(0, 1)) > 0)
+        return range(int(active[0]), int(active[-1]) + 1) if active.size else range(HOURS)
+
+    def peak_hours(self, metric: str = "count_in", top: int = 3) -> pd.DataFrame:
+        """Top-N weekdag/uur cellen per shop (gesorteerd binnen de shop)."""
+        flat = np.nan_to_num(self._metric(metric).reshape(len(self), -1), nan=-np.inf)
+        top = min(top, flat.shape[1])
+        idx = np.argpartition(-flat, top - 1, axis=1)[:, :top]
+        vals = np.take_along_axis(flat, idx, axis=1)
+        order = np.argsort(-vals, axis=1)
+        idx = np.take_along_axis(idx, order, axis=1)
+        vals = np.take_along_axis(vals, order, axis=1)
+        keep = np.isfinite(vals).ravel()
+        return pd.DataFrame({
+            "shop_id": np.repeat(self.shop_ids, top),
+            "rank": np.tile(np.arange(1, top + 1), len(self)),
+            "weekday": np.asarray(WEEKDAYS)[(idx // HOURS).ravel()],
+            "hour": (idx % HOURS).ravel(),
+            metric: vals.ravel(),
+        })[keep].reset_index(drop=True)
+
+    def staffing_gaps(self, busy_quantile: float = 0.75, min_gap_pp: float = 2.0) -> pd.DataFrame:
+        """
+        Drukke uren (bezoekers >= busy_quantile van de shop) waar de conversie minstens
+        min_gap_pp procentpunt onder de mediaan van de shop ligt: kandidaat-onderbezetting.
+        lost_turnover = bezoekers/dag * conversiegat * gemiddelde bon (omzet/conversies).
+        """
+        visitors = self.count_in
+        conv = self.conversion_pct
+        flat_v = visitors.reshape(len(self), -1)
+        flat_c = conv.reshape(len(self), -1)
+        with np.errstate(invalid="ignore"):
+            busy_cut = np.nanquantile(np.where(flat_v > 0, flat_v, np.nan), busy_quantile, axis=1)
+            conv_median = np.nanmedian(flat_c, axis=1)
+            gap = conv_median[:, None] - flat_c
+            mask = (flat_v >= busy_cut[:, None]) & (gap >= min_gap_pp)
+            converted = self.converted.reshape(len(self), -1).sum(axis=1)
+            atv = np.where(converted > 0, self.turnover_sum.reshape(len(self), -1).sum(axis=1) / converted, 0.0)
+        shop_idx, cell = np.nonzero(mask)
+        lost = flat_v[shop_idx, cell] * gap[shop_idx, cell] / 100.0 * atv[shop_idx]
+        out = pd.DataFrame({
+            "shop_id": self.shop_ids[shop_idx],
+            "weekday": np.asarray(WEEKDAYS)[cell // HOURS],
+            "hour": cell % HOURS,
+            "count_in": flat_v[shop_idx, cell],
+            "conversion_pct": flat_c[shop_idx, cell],
+            "shop_median_pct": conv_median[shop_idx],
+            "conv_gap_pp": gap[shop_idx, cell],
+            "lost_turnover": lost,
+        })
+        return out.sort_values("lost_turnover", ascending=False, ignore_index=True)
+
+def build_profile(hdf: pd.DataFrame, shop_ids: Optional[Sequence[int]] = None) -> HourlyProfile:
+    """
+    Profiel uit normalize_report_hourly_to_df (MultiIndex shop_id, timestamp).
+    shop_ids bepaalt de volgorde (en neemt shops zonder data mee als lege rijen).
+    """
+    with span("aggregate.hourly_profile", rows=0 if hdf is None else len(hdf)) as rec:
+        if shop_ids is None:
+            shop_ids = sorted(int(s) for s in hdf.index.get_level_values("shop_id").unique()) if len(hdf) else []
+        shop_ids = np.asarray(list(shop_ids), dtype=np.int64)
+        shape = (len(shop_ids), 7, HOURS)
+        if hdf is None or hdf.empty or not len(shop_ids):
+            zeros = np.zeros(shape)
+            return HourlyProfile(shop_ids, zeros, zeros.copy(), zeros.copy(), zeros.copy())
+
+        shops = hdf.index.get_level_values("shop_id").astype("int64").to_numpy()
+        stamps = pd.DatetimeIndex(hdf.index.get_level_values("timestamp"))
+        pos = pd.Index(shop_ids).get_indexer(shops)
+        known = pos >= 0
+        shop_pos = pos[known]
+        weekday = stamps.dayofweek.to_numpy()[known]
+        hour = stamps.hour.to_numpy()[known]
+        flat = (shop_pos * 7 + weekday) * HOURS + hour
+        size = len(shop_ids) * 7 * HOURS
+
+        def col(name):
+            if name not in hdf.columns:
+                return np.zeros(int(known.sum()))
+            return np.nan_to_num(pd.to_numeric(hdf[name], errors="coerce").to_numpy(dtype=np.float64)[known])
+
+        visitors = col("count_in")
+        turnover = col("turnover")
+        if "conversion_rate" in hdf.columns:
+            conv = np.nan_to_num(conversion_to_fraction(hdf["conversion_rate"]).to_numpy()[known])
+        else:
+            conv = np.zeros_like(visitors)
+        if "turnover" not in hdf.columns and "sales_per_visitor" in hdf.columns:
+            turnover = col("sales_per_visitor") * visitors
+
+        # Eén rij per (shop, uur), dus rijen per cel = aantal waargenomen dagen
+        days = np.bincount(flat, minlength=size)
+        dense = [np.bincount(flat, weights=w, minlength=size).reshape(shape)
+                 for w in (visitors, turnover, conv * visitors)]
+        rec["cells"] = size
+        return HourlyProfile(shop_ids, dense[0], dense[1], dense[2], days.reshape(shape).astype(np.float64))
+
+_MEMO_SIZE = 16
+_memo: Dict[Tuple, Tuple[float, HourlyProfile, pd.DataFrame]] = {}
+_memo_lock = threading.Lock()
+
+def load_profile(
+    shop_ids: Sequence[int],
+    period: str = "last_week",
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    shop_batch_size: int = HOURLY_SHOP_BATCH,
+) -> Tuple[HourlyProfile, pd.DataFrame]:
+    """
+    Haal uurdata voor alle shops op (gebatcht + parallel via fetch_report_hourly) en
+    bouw het profiel. Eén keer per (shops, periode) binnen de cache-TTL van die periode;
+    daarna zijn heatmaps/piekuren per store alleen nog array-indexering.
+    Geeft (profiel, uurframe) terug; behandel beide als read-only.
+    """
+    ids = tuple(sorted({int(s) for s in shop_ids}))
+    key = (ids, period, date_from, date_to)
+    now = time.monotonic()
+    with _memo_lock:
+        hit = _memo.get(key)
+        if hit is not None and hit[0] > now:
+            return hit[1], hit[2]
+    payload = fetch_report_hourly(
+        data=list(ids),
+        data_output=HOURLY_OUTPUTS,
+        period=period,
+        date_from=date_from,
+        date_to=date_to,
+        shop_batch_size=shop_batch_size if len(ids) > shop_batch_size else None,
+    )
+    hdf = normalize_report_hourly_to_df(payload)
+    profile = build_profile(hdf, ids)
+    with _memo_lock:
+        _memo[key] = (now + _ttl_for_period(period, date_to), profile, hdf)
+        if len(_memo) > _MEMO_SIZE:
+            # Verlopen eerst, anders de oudste
+            oldest = min(_memo, key=lambda k: _memo[k][0])
+            _memo.pop(oldest, None)
+    return profile, hdf
@@ -0,0 +1,122 @@
+# kpi_rollups.py
+# Centrale KPI-rollups per shop (en optioneel per periode) voor Radar, Benchmark en ROI.
+# Eén keer berekenen per dataversie; pagina's lezen hieruit i.p.v. zelf te groupby'en.
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Hashable, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from utils_pfmx import _get_secret, span
+
+# Eenheid van conversion_rate in de API: "percent", "fraction" of "auto" (per kolom bepalen)
+CONVERSION_UNIT = _get_secret("CONVERSION_UNIT", "auto")
+
+_MEMO_SIZE = 32
+_memo: "OrderedDict[Tuple, pd.DataFrame]" = OrderedDict()
+_memo_lock = threading.Lock()
+# Alleen deze kolommen bepalen de rollup (en dus de dataversie)
+_KPI_COLUMNS = ("shop_id", "date", "turnover", "count_in", "conversion_rate", "sales_per_visitor")
+
+def conversion_to_fraction(values: pd.Series, unit: Optional[str] = None) -> pd.Series:
+    """
+    Conversie naar fractie (0..1). De eenheid geldt voor de hele kolom, nooit per rij:
+    een uur met 0,8% conversie (0.8 in procenten) is geen 80%. Met unit/CONVERSION_UNIT
+    "auto" is de kolom in procenten zodra één waarde > 1 is.
+    """
+    v = pd.to_numeric(values, errors="coerce").astype("float64")
+    unit = unit or CONVERSION_UNIT
+    if unit == "auto":
+        top = v.max()
+        unit = "percent" if pd.notna(top) and top > 1.0 else "fraction"
+    if unit == "percent":
+        v = v / 100.0
+    elif unit != "fraction":
+        raise ValueError(f"Onbekende conversie-eenheid: {unit!r} (verwacht percent, fraction of auto)")
+    return pd.Series(v.to_numpy(), index=values.index, dtype="float64")
+
+def _data_version(df: pd.DataFrame) -> str:
+    # Inhoudshash over de ruwe bytes van de KPI-kolommen (numeriek, dus geen hash per rij);
+    # zelfde data (ook uit een nieuwe fetch) -> zelfde rollup
+    h = hashlib.sha1()
+    for col in _KPI_COLUMNS:
+        if col in df:
+            arr = df[col].to_numpy()
+            if arr.dtype == object:
+                arr = pd.util.hash_pandas_object(df[col], index=False).to_numpy()
+            h.update(col.encode())
+            h.update(np.ascontiguousarray(arr).tobytes())
+    return h.hexdigest()
+
+def _compute(df: pd.DataFrame, freq: Optional[str]) -> pd.DataFrame:
+    work = pd.DataFrame({
+        "shop_id": df["shop_id"].astype("int64"),
+        "turnover": pd.to_numeric(df.get("turnover", 0.0), errors="coerce").fillna(0.0),
+        "count_in": pd.to_numeric(df.get("count_in", 0.0), errors="coerce").fillna(0.0),
+        "conv_frac_day": conversion_to_fraction(df["conversion_rate"]) if "conversion_rate" in df else np.nan,
+        "spv_day": pd.to_numeric(df["sales_per_visitor"], errors="coerce") if "sales_per_visitor" in df else np.nan,
+    })
+    # Bezoekers-gewogen conversie: sum(conv * bezoekers) / sum(bezoekers), alleen over dagen
+    # mét conversie (anders tellen hun bezoekers in de noemer en drukken ze de conversie)
+    work["converted"] = work["conv_frac_day"] * work["count_in"]
+    work["conv_visitors"] = work["count_in"].where(work["conv_frac_day"].notna(), 0.0)
+    keys = ["shop_id"]
+    if freq:
+        work["period"] = pd.to_datetime(df["date"]).dt.to_period(freq).dt.start_time
+        keys.append("period")
+
+    out = work.groupby(keys, sort=True).agg(
+        turnover=("turnover", "sum"),
+        count_in=("count_in", "sum"),
+        converted=("converted", "sum"),
+        conv_visitors=("conv_visitors", "sum"),
+        conversion_rate_mean=("conv_frac_day", "mean"),
+        sales_per_visitor_mean=("spv_day", "mean"),
+        days=("turnover", "size"),
+    ).reset_index()
+
+    visitors = out["count_in"].to_numpy()
+    conv_visitors = out["conv_visitors"].to_numpy()
+    with np.errstate(divide="ignore", invalid="ignore"):
+        conv = np.where(conv_visitors > 0, out["converted"].to_numpy() / conv_visitors, out["conversion_rate_mean"].to_numpy())
+        spv = np.where(visitors > 0, out["turnover"].to_numpy() / visitors, out["sales_per_visitor_mean"].to_numpy())
+    out["conv_frac"] = np.nan_to_num(conv)
+    out["conversion_pct"] = out["conv_frac"] * 100.0
+    out["sales_per_visitor"] = np.nan_to_num(spv)
+    out["conversion_rate_mean"] = out["conversion_rate_mean"] * 100.0
+    return out.drop(columns=["converted", "conv_visitors"])
+
+def shop_kpis(df: pd.DataFrame, freq: Optional[str] = None, version: Optional[Hashable] = None) -> pd.DataFrame:
+    """
+    KPI's per shop (freq=None) of per shop x periode (freq='W', 'M', ...) uit een dagframe
+    van normalize_report_days_to_df. Kolommen:
+      shop_id, [period], turnover, count_in, days,
+      conv_frac / conversion_pct  - bezoekers-gewogen conversie
+      sales_per_visitor           - omzet / bezoekers
+      conversion_rate_mean (%) / sales_per_visitor_mean - oude gemiddelden van dagratio's
+    Resultaat is gememoized per dataversie; behandel het als read-only. Geef version mee
+    als de pagina al weet welke payload df is (utils_pfmx.served_version()), dan hoeft df
+    niet gehasht te worden.
+    """
+    if df is None or df.empty or "shop_id" not in df:
+        return pd.DataFrame()
+    with span("aggregate.shop_kpis") as rec:
+        data_key: Any = ("v", version) if version is not None else ("h", _data_version(df))
+        key = (data_key, tuple(c for c in _KPI_COLUMNS if c in df), freq)
+        with _memo_lock:
+            hit = _memo.get(key)
+            if hit is not None:
+                _memo.move_to_end(key)
+        rec["hit"] = hit is not None
+        if hit is not None:
+            rec["rows"] = len(hit)
+            return hit
+        out = _compute(df, freq)
+        with _memo_lock:
+            _memo[key] = out
+            while len(_memo) > _MEMO_SIZE:
+                _memo.popitem(last=False)
+        rec["rows"] = len(out)
+        return out
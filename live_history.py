@@ -0,0 +1,153 @@
+# live_history.py
+# Begrensde ringbuffers (NumPy) met live samples per shop:
+# (timestamp, occupancy, in_store, enter, exit). Vaste geheugenkosten, O(1) append
+# en goedkope window-aggregaten (binary search op tijd), zodat Store Live Ops een
+# trend kan tonen zonder extra report call.
+import threading
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+FIELDS = ("occupancy", "in_store", "enter", "exit")
+ENTER_WINDOW = 300  # live-inside geeft enter/exit over de laatste 5 minuten
+
+class LiveRingBuffer:
+    """Ringbuffer voor één shop; capacity samples, 24 bytes per sample."""
+
+    def __init__(self, capacity: int = 2880):
+        self.capacity = capacity
+        self._ts = np.zeros(capacity, dtype=np.float64)
+        self._values = np.full((len(FIELDS), capacity), np.nan, dtype=np.float32)
+        self._start = 0
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def append(self, ts: float, **values: Optional[float]) -> None:
+        if self._size and ts <= self._ts[(self._start + self._size - 1) % self.capacity]:
+            return  # zelfde of oudere snapshot nogmaals aangeboden
+        if self._size < self.capacity:
+            pos = (self._start + self._size) % self.capacity
+            self._size += 1
+        else:
+            pos = self._start
+            self._start = (self._start + 1) % self.capacity
+        self._ts[pos] = ts
+        for i, field in enumerate(FIELDS):
+            v = values.get(field)
+            self._values[i, pos] = np.nan if v is None else v
+
+    def _phys(self, i: int) -> int:
+        return (self._start + i) % self.capacity
+
+    def _first_at_or_after(self, ts: float) -> int:
+        # Binary search over logische posities (tijd is oplopend)
+        lo, hi = 0, self._size
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._ts[self._phys(mid)] < ts:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def _slice(self, lo: int, hi: int) -> Tuple[np.ndarray, np.ndarray]:
+        if hi <= lo:
+            return self._ts[:0], self._values[:, :0]
+        a, b = self._phys(lo), self._phys(hi - 1) + 1
+        if a < b:
+            return self._ts[a:b], self._values[:, a:b]
+        return (np.concatenate([self._ts[a:], self._ts[:b]]),
+                np.concatenate([self._values[:, a:], self._values[:, :b]], axis=1))
+
+    def latest_ts(self) -> Optional[float]:
+        return float(self._ts[self._phys(self._size - 1)]) if self._size else None
+
+    def window(self, seconds: float, now: Optional[float] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """(timestamps, values[len(FIELDS), n]) van de samples in de laatste `seconds`."""
+        if not self._size:
+            return self._slice(0, 0)
+        now = now if now is not None else self.latest_ts()
+        lo = self._first_at_or_after(now - seconds)
+        return self._slice(lo, self._size)
+
+    def peak(self, field: str, seconds: float, now: Optional[float] = None) -> float:
+        _, values = self.window(seconds, now)
+        col = values[FIELDS.index(field)]
+        return float(np.nanmax(col)) if col.size and not np.isnan(col).all() else 0.0
+
+    def entries(self, seconds: float = 900, now: Optional[float] = None, field: str = "enter") -> float:
+        """
+        Som van enter (of exit) over de laatste `seconds`. Elke sample telt de
+        voorgaande 5 minuten, dus we nemen niet-overlappende samples terug in de tijd.
+        """
+        if not self._size:
+            return 0.0
+        now = now if now is not None else self.latest_ts()
+        row = FIELDS.index(field)
+        total = 0.0
+        t = now
+        while t > now - seconds:
+            idx = self._first_at_or_after(t + 1e-9) - 1  # laatste sample met ts <= t
+            if idx < 0:
+                break
+            v = self._values[row, self._phys(idx)]
+            total += 0.0 if np.isnan(v) else float(v)
+            t = self._ts[self._phys(idx)] - ENTER_WINDOW
+        return total
+
+    def to_frame(self, seconds: Optional[float] = None) -> pd.DataFrame:
+        ts, values = self.window(seconds) if seconds is not None else self._slice(0, self._size)
+        df = pd.DataFrame({f: values[i] for i, f in enumerate(FIELDS)})
+        local_tz = datetime.now().astimezone().tzinfo
+        df.insert(0, "timestamp", pd.to_datetime(ts, unit="s", utc=True).tz_convert(local_tz))
+        return df
+
+class LiveHistory:
+    """Ringbuffer per shop, gevoed met genormaliseerde live-inside snapshots."""
+
+    def __init__(self, capacity: int = 2880):
+        self.capacity = capacity
+        self._buffers: Dict[int, LiveRingBuffer] = {}
+        self._lock = threading.Lock()
+
+    def ingest(self, ts: float, df: pd.DataFrame) -> None:
+        if df is None or df.empty or "shop_id" not in df.columns:
+            return
+        cols = {f: pd.to_numeric(df[f], errors="coerce").to_numpy() if f in df.columns else None for f in FIELDS}
+        shops = pd.to_numeric(df["shop_id"], errors="coerce").to_numpy()
+        with self._lock:
+            for i, shop in enumerate(shops):
+                if np.isnan(shop):
+                    continue
+                buf = self._buffers.get(int(shop))
+                if buf is None:
+                    buf = self._buffers[int(shop)] = LiveRingBuffer(self.capacity)
+                buf.append(ts, **{f: (None if c is None else c[i]) for f, c in cols.items()})
+
+    def get(self, shop_id: int) -> Optional[LiveRingBuffer]:
+        with self._lock:
+            return self._buffers.get(shop_id)
+
+    def summary(self, shop_id: int, entries_window: float = 900, peak_window: float = 3600) -> Dict[str, float]:
+        """Entries over de laatste 15 min en piekbezetting over het laatste uur (standaard)."""
+        buf = self.get(shop_id)
+        if buf is None:
+            return {"entries": 0.0, "exits": 0.0, "peak_occupancy": 0.0, "samples": 0}
+        with self._lock:
+            return {
+                "entries": buf.entries(entries_window),
+                "exits": buf.entries(entries_window, field="exit"),
+                "peak_occupancy": buf.peak("occupancy", peak_window),
+                "samples": len(buf),
+            }
+
+    def frame(self, shop_id: int, seconds: Optional[float] = None) -> pd.DataFrame:
+        buf = self.get(shop_id)
+        if buf is None:
+            return pd.DataFrame(columns=["timestamp", *FIELDS])
+        with self._lock:
+            return buf.to_frame(seconds)
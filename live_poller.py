@@ -0,0 +1,130 @@
+# live_poller.py
+# Eén achtergrond-poller per serverproces voor /live-inside.
+# Alle shops uit SHOP_NAME_MAP gaan in één gebatchte call per interval; pagina's
+# lezen de laatste snapshot i.p.v. zelf te callen, dus N kijkers = 1 upstream call.
+import threading
+import time
+from collections import deque
+from typing import Deque, List, Optional, Tuple
+
+import pandas as pd
+
+from live_history import LiveHistory
+from shop_mapping import SHOP_NAME_MAP
+from utils_pfmx import _get_secret, fetch_live_locations, logger, normalize_live_to_df
+
+LIVE_POLL_INTERVAL = float(_get_secret("LIVE_POLL_INTERVAL", "30"))
+LIVE_HISTORY = int(_get_secret("LIVE_HISTORY", "240"))  # snapshots (2 uur bij 30s)
+LIVE_SERIES_CAPACITY = int(_get_secret("LIVE_SERIES_CAPACITY", "2880"))  # samples per shop (24 uur bij 30s)
+
+class LivePoller:
+    """
+    Achtergrondthread die live-inside periodiek ververst.
+    - latest(): (timestamp, DataFrame) van de laatste geslaagde poll
+    - history(): ringbuffer met de laatste `history` snapshots
+    - series: LiveHistory met per shop een compacte tijdreeks (occupancy/enter/exit)
+    - subscribe(): heartbeat van een kijker; zonder kijkers (idle_after) pauzeert de poller
+    """
+
+    def __init__(
+        self,
+        shop_ids: List[int],
+        interval: float = LIVE_POLL_INTERVAL,
+        history: int = LIVE_HISTORY,
+        idle_after: Optional[float] = None,
+    ):
+        self.shop_ids = list(shop_ids)
+        self.interval = interval
+        self.idle_after = idle_after if idle_after is not None else 10 * interval
+        self._history: Deque[Tuple[float, pd.DataFrame]] = deque(maxlen=history)
+        self.series = LiveHistory(capacity=LIVE_SERIES_CAPACITY)
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._last_seen = 0.0
+        self.version = 0
+        self.last_error: Optional[str] = None
+
+    # ---- lifecycle ----
+    def start(self) -> None:
+        with self._cond:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="pfm-live-poller", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        with self._cond:
+            self._cond.notify_all()
+
+    def subscribe(self) -> "LivePoller":
+        self._last_seen = time.monotonic()
+        self.start()
+        with self._cond:
+            self._cond.notify_all()  # wakker maken als hij idle was
+        return self
+
+    # ---- data ----
+    def poll_once(self) -> None:
+        try:
+            payload = fetch_live_locations(shop_ids=self.shop_ids)
+            df = normalize_live_to_df(payload)
+        except Exception as e:
+            self.last_error = str(e)
+            logger.warning("Live poll mislukt: %s", e)
+            return
+        ts = time.time()
+        self.series.ingest(ts, df)
+        with self._cond:
+            self._history.append((ts, df))
+            self.version += 1
+            self.last_error = None
+            self._cond.notify_all()
+
+    def latest(self, shop_id: Optional[int] = None) -> Tuple[Optional[float], pd.DataFrame]:
+        with self._cond:
+            if not self._history:
+                return None, pd.DataFrame()
+            ts, df = self._history[-1]
+        if shop_id is not None and "shop_id" in df.columns:
+            df = df[df["shop_id"] == shop_id].reset_index(drop=True)
+        return ts, df
+
+    def history(self) -> List[Tuple[float, pd.DataFrame]]:
+        with self._cond:
+            return list(self._history)
+
+    def wait_for_update(self, after_version: int, timeout: Optional[float] = None) -> int:
+        """Blokkeer tot er een snapshot nieuwer dan after_version is (of timeout)."""
+        with self._cond:
+            self._cond.wait_for(lambda: self.version > after_version or self._stop.is_set(), timeout=timeout)
+            return self.version
+
+    # ---- loop ----
+    def _idle(self) -> bool:
+        return time.monotonic() - self._last_seen > self.idle_after
+
+    def _run(self) -> None:
+        logger.info("Live poller gestart: %d shops, elke %.0fs", len(self.shop_ids), self.interval)
+        while not self._stop.is_set():
+            if self._idle():
+                with self._cond:
+                    self._cond.wait_for(lambda: not self._idle() or self._stop.is_set())
+                continue
+            started = time.monotonic()
+            self.poll_once()
+            self._stop.wait(max(0.0, self.interval - (time.monotonic() - started)))
+        logger.info("Live poller gestopt")
+
+_poller: Optional[LivePoller] = None
+_poller_lock = threading.Lock()
+
+def get_live_poller() -> LivePoller:
+    """Procesbrede poller voor alle shops in SHOP_NAME_MAP (lazy gestart bij subscribe)."""
+    global _poller
+    with _poller_lock:
+        if _poller is None:
+            _poller = LivePoller(list(SHOP_NAME_MAP.keys()))
+        return _poller
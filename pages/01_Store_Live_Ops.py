@@ -1,14 +1,16 @@
 # pages/01_Store_Live_Ops.py
-import sys
-import os
+# plotly.express wordt pas geïmporteerd in de takken die een grafiek tekenen (scheelt
+# ~0,15 s per cold start); de app-map staat al op sys.path (streamlit run vanuit de root).
+from datetime import datetime
 import streamlit as st
 import pandas as pd
-import plotly.express as px
-
-#Zorg dat de main map in sys.path staat
-sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 from shop_mapping import SHOP_NAME_TO_ID, SHOP_ID_TO_NAME
-from utils_pfmx import fetch_live_locations, fetch_report, normalize_report_days_to_df
+from utils_pfmx import fetch_report, normalize_report_days_to_df, span
+from ui import inject, debug_enabled, debug_panel
+from formatting import fmt_eur, fmt_pct
+from kpi_rollups import conversion_to_fraction
+from downsample import CHART_WIDTH_PX, downsample
+from live_poller import get_live_poller
 
 # Hourly helpers zijn optioneel; app blijft werken als ze ontbreken
 try:
@@ -18,20 +20,10 @@ except Exception:
     HAS_HOURLY = False
 
 st.set_page_config(page_title="Store Live Ops", layout="wide")
+inject()
 
 st.title("Store Live Ops")
 
-# Debug: toon afgeleide live-URL uit secrets
-try:
-    from urllib.parse import urlsplit
-    api = st.secrets.get("API_URL", "")
-    if api:
-        p = urlsplit(api.strip())
-        live_url_dbg = f"{p.scheme}://{p.netloc}/live-inside"
-        st.caption(f"Live endpoint: {live_url_dbg}")
-except Exception:
-    pass
-
 # -------------------- Controls --------------------
 c1, c2, c3, c4 = st.columns([2, 1.2, 1.2, 1.6])
 with c1:
@@ -66,49 +58,41 @@ if mode in ("Dag", "Uur"):
 st.divider()
 
 # -------------------- Helpers --------------------
-def eur(v, decimals=0):
-    try:
-        v = float(v)
-        s = f"{v:,.{decimals}f}"
-        s = s.replace(",", "@").replace(".", ",").replace("@", ".")
-        return "€" + s
-    except Exception:
-        return "€0"
-
-def conv_to_pct(x):
-    try:
-        x = float(x)
-        return x * 100.0 if x <= 1.0 else x
-    except Exception:
-        return 0.0
-
-def fmt_pct(v, decimals=1):
-    try:
-        v = float(v)
-        s = f"{v:,.{decimals}f}"
-        s = s.replace(",", "@").replace(".", ",").replace("@", ".")
-        return s + "%"
-    except Exception:
-        return "0%"
+def conv_to_pct(values):
+    # Eenheid per kolom (niet per rij) bepalen: zie kpi_rollups.conversion_to_fraction
+    return (conversion_to_fraction(values) * 100.0).fillna(0.0)
+
+def chart_frame(plot_df, x, ys, key):
+    """Begrensde chart-data: optioneel zoombereik (lange reeksen) en LTTB tot de grafiekbreedte."""
+    x_range = None
+    ts = plot_df[x]
+    if len(plot_df) > CHART_WIDTH_PX and ts.iloc[-1] - ts.iloc[0] > pd.Timedelta(days=2):
+        lo, hi = ts.iloc[0].to_pydatetime(), ts.iloc[-1].to_pydatetime()
+        zoom = st.slider("Zoom", min_value=lo, max_value=hi, value=(lo, hi), format="DD-MM HH:mm", key=key)
+        if zoom != (lo, hi):
+            x_range = (pd.Timestamp(zoom[0]), pd.Timestamp(zoom[1]))
+    return downsample(plot_df, x, ys, x_range=x_range)
 
 # -------------------- Render --------------------
-if mode == "Live":
-    st.subheader("Live bezetting (occupancy)")
+def render_live():
     try:
-        payload = fetch_live_locations(shop_ids=[shop_id])
-
-        # Normaliseer payload voorzichtig naar DataFrame
-        if isinstance(payload, dict) and "data" in payload and isinstance(payload["data"], dict):
-            df = pd.DataFrame.from_dict(payload["data"], orient="index").reset_index().rename(columns={"index": "shop_id"})
-        elif isinstance(payload, dict):
-            df = pd.DataFrame([payload])
-        else:
-            df = pd.DataFrame(payload)
-
+        # Gedeelde poller: één gebatchte live-inside call per interval voor alle kijkers
+        poller = get_live_poller().subscribe()
+        ts, df = poller.latest(shop_id)
+        if ts is None:
+            poller.wait_for_update(0, timeout=15)
+            ts, df = poller.latest(shop_id)
+        if ts is None:
+            st.warning(f"Nog geen live data{': ' + poller.last_error if poller.last_error else ''}.")
+            return
+
+        st.caption(f"Stand van {datetime.fromtimestamp(ts):%H:%M:%S} (ververst elke {poller.interval:.0f}s)")
         st.dataframe(df, use_container_width=True)
 
         # Metrics (alleen tonen als kolommen bestaan)
         m1, m2, m3, m4 = st.columns(4)
+        if df.empty:
+            return
         if "occupancy" in df.columns:
             val = df["occupancy"].iloc[0]
             m1.metric("Occupancy", f"{int(val) if pd.notna(val) else 0}")
@@ -122,9 +106,34 @@ if mode == "Live":
             val = df["exit"].iloc[0]
             m4.metric("Exit (5m)", f"{int(val) if pd.notna(val) else 0}")
 
+        # Trend uit de ringbuffer van de poller (geen extra API call)
+        hist = poller.series.frame(shop_id, seconds=4 * 3600)
+        if len(hist) > 1:
+            summ = poller.series.summary(shop_id)
+            h1, h2 = st.columns(2)
+            h1.metric("Binnen (15m)", f"{int(summ['entries'])}")
+            h2.metric("Piek occupancy (1u)", f"{int(summ['peak_occupancy'])}")
+            import plotly.express as px
+            fig = px.line(hist, x="timestamp", y="occupancy", title="Occupancy (laatste uren)")
+            st.plotly_chart(fig, use_container_width=True)
+
     except Exception as e:
         st.error(f"Live call failed: {e}")
 
+if mode == "Live":
+    st.subheader("Live bezetting (occupancy)")
+    if debug_enabled():
+        # Afgeleide live-URL alleen in debug (geen secrets-probing bij elke import)
+        try:
+            from utils_pfmx import _derive_live_url_from_api
+            st.caption(f"Live endpoint: {_derive_live_url_from_api()}")
+        except RuntimeError as e:
+            st.caption(f"Live endpoint: {e}")
+    auto = st.toggle("Auto-refresh", value=True)
+    # st.fragment herlaadt alleen dit blok; oudere Streamlit heeft experimental_fragment
+    fragment = getattr(st, "fragment", None) or getattr(st, "experimental_fragment")
+    fragment(run_every=get_live_poller().interval if auto else None)(render_live)()
+
 elif mode == "Dag":
     st.subheader("Dag KPI's")
     try:
@@ -134,6 +143,8 @@ elif mode == "Dag":
             source="shops",
             period=period,
             period_step="day",
+            # Lopende periode: alleen de nieuwe dag(en) ophalen en mergen
+            incremental=period != "date",
         )
         if period == "date":
             if not date_from or not date_to:
@@ -151,27 +162,30 @@ elif mode == "Dag":
             st.dataframe(df, use_container_width=True)
 
             latest = df.iloc[-1]
-            conv = conv_to_pct(latest.get("conversion_rate", 0))
+            conv = float(conv_to_pct(df["conversion_rate"]).iloc[-1]) if "conversion_rate" in df else 0.0
             spv = float(latest.get("sales_per_visitor", 0) or 0)
             tnr = float(latest.get("turnover", 0) or 0)
             cnt = int(latest.get("count_in", 0) or 0)
 
             c1, c2, c3, c4 = st.columns(4)
             c1.metric("Conversie", fmt_pct(conv), delta="OK" if conv >= conv_target else "Onder target")
-            c2.metric("SPV", eur(spv, 2), delta="OK" if spv >= spv_target else "Onder target")
+            c2.metric("SPV", fmt_eur(spv, 2), delta="OK" if spv >= spv_target else "Onder target")
             c3.metric("Bezoekers", f"{cnt:,}".replace(",", "."))
-            c4.metric("Omzet", eur(tnr, 0))
+            c4.metric("Omzet", fmt_eur(tnr, 0))
 
             # Trendplot
             plot_df = df.copy()
-            plot_df["conv_pct"] = plot_df["conversion_rate"].apply(conv_to_pct)
-            fig = px.line(
-                plot_df,
-                x="date",
-                y=["sales_per_visitor", "conv_pct"],
-                title="Trend: SPV en Conversie (%)"
-            )
-            st.plotly_chart(fig, use_container_width=True)
+            plot_df["conv_pct"] = conv_to_pct(plot_df["conversion_rate"])
+            chart_df = chart_frame(plot_df, "date", ["sales_per_visitor", "conv_pct"], key="zoom_dag")
+            with span("render.chart"):
+                import plotly.express as px
+                fig = px.line(
+                    chart_df,
+                    x="date",
+                    y=["sales_per_visitor", "conv_pct"],
+                    title="Trend: SPV en Conversie (%)"
+                )
+                st.plotly_chart(fig, use_container_width=True)
 
     except Exception as e:
         st.error(f"Report call failed: {e}")
@@ -187,6 +201,8 @@ elif mode == "Uur":
                 data_output=["turnover", "conversion_rate", "sales_per_visitor", "count_in"],
                 source="shops",
                 period=period,
+                # Lopende periode: alleen de nieuwe dag(en) ophalen en mergen
+                incremental=period != "date",
             )
             if period == "date":
                 if not date_from or not date_to:
@@ -203,20 +219,19 @@ elif mode == "Uur":
             else:
                 st.dataframe(hdf, use_container_width=True)
 
-                plot_df = hdf.copy()
+                # Index is (shop_id, timestamp); timestamp is al datetime64
+                plot_df = hdf.reset_index()
                 if "conversion_rate" in plot_df.columns:
-                    plot_df["conv_pct"] = plot_df["conversion_rate"].apply(conv_to_pct)
-                if "timestamp" in plot_df.columns:
-                    plot_df["x"] = plot_df["date"].astype(str) + " " + plot_df["timestamp"].astype(str)
-                else:
-                    plot_df["x"] = plot_df["date"].astype(str)
+                    plot_df["conv_pct"] = conv_to_pct(plot_df["conversion_rate"])
 
+                chart_df = chart_frame(plot_df, "timestamp", ["sales_per_visitor", "conv_pct"], key="zoom_uur")
+                import plotly.express as px
                 lc, rc = st.columns(2)
-                with lc:
-                    fig1 = px.line(plot_df, x="x", y="sales_per_visitor", title="SPV per uur")
+                with lc, span("render.chart"):
+                    fig1 = px.line(chart_df, x="timestamp", y="sales_per_visitor", title="SPV per uur")
                     st.plotly_chart(fig1, use_container_width=True)
-                with rc:
-                    fig2 = px.line(plot_df, x="x", y="conv_pct", title="Conversie (%) per uur")
+                with rc, span("render.chart"):
+                    fig2 = px.line(chart_df, x="timestamp", y="conv_pct", title="Conversie (%) per uur")
                     st.plotly_chart(fig2, use_container_width=True)
 
                 latest = plot_df.iloc[-1]
@@ -227,11 +242,13 @@ elif mode == "Uur":
 
                 m1, m2, m3, m4 = st.columns(4)
                 m1.metric("Conversie (laatste uur)", fmt_pct(conv), delta="OK" if conv >= conv_target else "Onder target")
-                m2.metric("SPV (laatste uur)", eur(spv, 2), delta="OK" if spv >= spv_target else "Onder target")
+                m2.metric("SPV (laatste uur)", fmt_eur(spv, 2), delta="OK" if spv >= spv_target else "Onder target")
                 m3.metric("Bezoekers (uur)", f"{cnt:,}".replace(",", "."))
-                m4.metric("Omzet (uur)", eur(tnr, 0))
+                m4.metric("Omzet (uur)", fmt_eur(tnr, 0))
 
         except Exception as e:
             st.error(f"Hourly call failed: {e}")
 
 st.caption("POST + herhaalde keys (zonder []) | Live = /live-inside (source=locations) | Report = /get-report (source=shops)")
+
+debug_panel()
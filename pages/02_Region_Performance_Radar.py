@@ -1,8 +1,8 @@
 import streamlit as st
 import pandas as pd
-import plotly.express as px
-from ui import inject
-from utils_pfmx import fetch_report, normalize_report_days_to_df
+from ui import inject, debug_panel, freshness_notice, select_stores
+from utils_pfmx import fetch_report, normalize_report_days_to_df, served_version, span
+from kpi_rollups import shop_kpis
 from shop_mapping import SHOP_OPTIONS
 
 st.set_page_config(page_title="Region Performance Radar", layout="wide")
@@ -10,8 +10,7 @@ inject()
 
 st.title("Region Performance Radar")
 
-stores = st.multiselect("Select stores", options=list(SHOP_OPTIONS.keys()), default=list(SHOP_OPTIONS.keys()))
-shop_ids = [SHOP_OPTIONS[s] for s in stores]
+stores, shop_ids = select_stores()
 
 col1, col2 = st.columns(2)
 with col1:
@@ -27,32 +26,31 @@ if shop_ids:
             source="shops",
             period="last_month",
             period_step="day",
+            stale_while_revalidate=True,
         )
         df = normalize_report_days_to_df(payload)
+        freshness_notice()
         if df.empty:
             st.warning("Geen data gevonden.")
         else:
-            # Aggregatie per shop
-            agg = df.groupby("shop_id").agg({
-                "conversion_rate":"mean",
-                "sales_per_visitor":"mean",
-                "count_in":"sum",
-                "turnover":"sum"
-            }).reset_index()
+            # Aggregatie per shop (bezoekers-gewogen conversie, SPV = omzet / bezoekers)
+            agg = shop_kpis(df, version=served_version()).copy()
             name_map = {v:k for k,v in SHOP_OPTIONS.items()}
             agg["store"] = agg["shop_id"].map(name_map)
-            # Conversie in % als nodig
-            agg["conversion_pct"] = agg["conversion_rate"].apply(lambda x: x*100 if (isinstance(x,(int,float)) and x<=1) else x)
             st.dataframe(agg[["store","conversion_pct","sales_per_visitor","count_in","turnover"]], use_container_width=True)
 
-            fig = px.scatter(
-                agg, x="conversion_pct", y="sales_per_visitor", size="count_in", hover_name="store",
-                title="Conversie vs SPV (bubble ~ bezoekers)"
-            )
-            fig.add_hline(y=spv_target, line_dash="dot")
-            fig.add_vline(x=conv_target, line_dash="dot")
-            st.plotly_chart(fig, use_container_width=True)
+            with span("render.chart"):
+                import plotly.express as px  # lazy: alleen als er getekend wordt
+                fig = px.scatter(
+                    agg, x="conversion_pct", y="sales_per_visitor", size="count_in", hover_name="store",
+                    title="Conversie vs SPV (bubble ~ bezoekers)"
+                )
+                fig.add_hline(y=spv_target, line_dash="dot")
+                fig.add_vline(x=conv_target, line_dash="dot")
+                st.plotly_chart(fig, use_container_width=True)
     except Exception as e:
         st.error(f"Report call failed: {e}")
 else:
     st.info("Selecteer minimaal één store.")
+
+debug_panel()
@@ -1,7 +1,10 @@
 import streamlit as st
 import pandas as pd
-from ui import inject
-from utils_pfmx import fetch_report, normalize_report_days_to_df
+from ui import inject, debug_panel, freshness_notice, select_stores
+from report_store import sync_report
+from period_compare import compare_periods
+from kpi_rollups import shop_kpis
+from formatting import eu_dataframe
 from shop_mapping import SHOP_OPTIONS
 
 st.set_page_config(page_title="Portfolio Benchmark", layout="wide")
@@ -9,44 +12,52 @@ inject()
 
 st.title("Portfolio Benchmark")
 
-stores = list(SHOP_OPTIONS.keys())
-selected = st.multiselect("Select stores", stores, default=stores)
-shop_ids = [SHOP_OPTIONS[s] for s in selected]
+selected, shop_ids = select_stores()
 
-period = st.selectbox("Periode", ["last_month","this_month","last_quarter","this_year"], index=0)
+c1, c2 = st.columns(2)
+with c1:
+    period = st.selectbox("Periode", ["last_month","this_month","last_quarter","this_year"], index=0)
+with c2:
+    compare = st.selectbox("Vergelijk met", ["Geen", "Vorige periode", "Vorig jaar"], index=0)
+reference = {"Vorige periode": "previous", "Vorig jaar": "last_year"}.get(compare)
 
 if shop_ids:
     try:
-        payload = fetch_report(
-            data=shop_ids,
-            data_output=["conversion_rate","sales_per_visitor","turnover","count_in"],
-            source="shops",
-            period=period,
-            period_step="day",
-        )
-        df = normalize_report_days_to_df(payload)
+        # Afgesloten dagen komen uit de lokale store; alleen de delta gaat naar de agent
+        if reference:
+            cmp = compare_periods(data=shop_ids, period=period, reference=reference, stale_while_revalidate=True)
+            df = cmp.current
+        else:
+            df = sync_report(
+                data=shop_ids,
+                data_output=["conversion_rate","sales_per_visitor","turnover","count_in"],
+                period=period,
+                period_step="day",
+                stale_while_revalidate=True,
+            )
+        freshness_notice()
         if df.empty:
             st.warning("Geen data gevonden.")
         else:
             # KPI's per winkel
-            kpi = df.groupby("shop_id").agg(
-                conversion_rate=("conversion_rate","mean"),
-                sales_per_visitor=("sales_per_visitor","mean"),
-                turnover=("turnover","sum"),
-                count_in=("count_in","sum")
-            ).reset_index()
             name_map = {v:k for k,v in SHOP_OPTIONS.items()}
+            cols = ["store","conversion_pct","sales_per_visitor","count_in","turnover"]
+            formats = {"conversion_pct": "pct1", "sales_per_visitor": "eur2", "turnover": "eur0", "count_in": "int"}
+            if reference:
+                ref_from, ref_to = cmp.reference_window
+                st.caption(f"Referentie: {ref_from:%d-%m-%Y} t/m {ref_to:%d-%m-%Y}")
+                kpi = cmp.shops.copy()
+                cols += ["turnover_pct", "count_in_pct", "conversion_pct_delta", "sales_per_visitor_pct"]
+                formats.update({"turnover_pct": "pct1", "count_in_pct": "pct1",
+                                "conversion_pct_delta": "num1", "sales_per_visitor_pct": "pct1"})
+            else:
+                kpi = shop_kpis(df).copy()
             kpi["store"] = kpi["shop_id"].map(name_map)
-            kpi["conversion_pct"] = kpi["conversion_rate"].apply(lambda x: x*100 if (isinstance(x,(int,float)) and x<=1) else x)
-            kpi = kpi[["store","conversion_pct","sales_per_visitor","count_in","turnover"]].sort_values("turnover", ascending=False)
-            # EU-format
-            kpi["conversion_pct"] = kpi["conversion_pct"].map(lambda v: f"{v:,.1f}%".replace(",", "@").replace(".", ",").replace("@","."))
-            kpi["sales_per_visitor"] = kpi["sales_per_visitor"].map(lambda v: f"€{v:,.2f}".replace(",", "@").replace(".", ",").replace("@","."))
-            kpi["turnover"] = kpi["turnover"].map(lambda v: f"€{v:,.0f}".replace(",", "@").replace(".", ",").replace("@","."))
-            kpi["count_in"] = kpi["count_in"].map(lambda v: f"{int(v):,}".replace(",", "."))
-
-            st.dataframe(kpi, use_container_width=True)
+            kpi = kpi[cols].sort_values("turnover", ascending=False)
+            eu_dataframe(kpi, formats, use_container_width=True)
     except Exception as e:
         st.error(f"Report call failed: {e}")
 else:
     st.info("Selecteer minimaal één store.")
+
+debug_panel()
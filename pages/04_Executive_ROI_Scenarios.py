@@ -1,7 +1,11 @@
 import streamlit as st
+import numpy as np
 import pandas as pd
-from ui import inject, kpi
-from utils_pfmx import fetch_report, normalize_report_days_to_df
+from ui import inject, kpi, debug_panel, freshness_notice, select_stores
+from utils_pfmx import fetch_report, normalize_report_days_to_df, served_version, span
+from kpi_rollups import shop_kpis
+from formatting import eu_dataframe, fmt_eur, fmt_num, fmt_pct
+from roi_scenarios import ScenarioBase, monte_carlo, scenario_grid
 from shop_mapping import SHOP_OPTIONS
 
 st.set_page_config(page_title="Executive ROI Scenarios", layout="wide")
@@ -9,9 +13,7 @@ inject()
 
 st.title("Executive ROI Scenarios")
 
-stores = list(SHOP_OPTIONS.keys())
-selected = st.multiselect("Select stores", stores, default=stores)
-shop_ids = [SHOP_OPTIONS[s] for s in selected]
+selected, shop_ids = select_stores()
 
 st.subheader("Assumpties")
 colA, colB, colC = st.columns(3)
@@ -32,50 +34,83 @@ if shop_ids:
             source="shops",
             period="last_month",
             period_step="day",
+            stale_while_revalidate=True,
         )
         df = normalize_report_days_to_df(payload)
+        freshness_notice()
         if df.empty:
             st.warning("Geen data gevonden.")
         else:
-            base = df.groupby("shop_id").agg(
-                conversion_rate=("conversion_rate","mean"),
-                sales_per_visitor=("sales_per_visitor","mean"),
-                turnover=("turnover","sum"),
-                count_in=("count_in","sum")
-            ).reset_index()
+            # conv_frac is al een (bezoekers-gewogen) fractie; sliders rekenen alleen op deze basis
+            base = shop_kpis(df, version=served_version()).copy()
             name_map = {v:k for k,v in SHOP_OPTIONS.items()}
             base["store"] = base["shop_id"].map(name_map)
-            # normalize conversion to fraction
-            base["conv_frac"] = base["conversion_rate"].apply(lambda x: x if (isinstance(x,(int,float)) and x<=1) else x/100.0)
-            uplift_frac = conv_uplift/100.0
-            base["new_conv"] = (base["conv_frac"] + uplift_frac).clip(upper=1.0)
-            # new sales per visitor ~ proportional to conversion uplift (simplistic)
-            base["new_spv"] = base["sales_per_visitor"] * (base["new_conv"]/base["conv_frac"]).replace([float('inf')], 1.0)
-            base["extra_turnover"] = (base["new_spv"] - base["sales_per_visitor"]) * base["count_in"]
-            base["extra_gross_profit"] = base["extra_turnover"] * (margin/100.0)
-            # costs per month, estimate payback months
-            monthly_cost = opex + (capex/12.0)
-            base["payback_months"] = (capex / base["extra_gross_profit"]).replace([float('inf')], 0.0).clip(lower=0.0)
+            roi_base = ScenarioBase.from_kpis(base)
+            grid = scenario_grid(
+                roi_base,
+                uplifts=np.arange(1, 21) / 100.0,
+                margins=np.arange(10, 91, 5) / 100.0,
+                capexes=[capex],
+                opexes=[opex],
+            )
+            # Huidig scenario: exact punt (marge-slider heeft stap 1, het grid stap 5)
+            point = scenario_grid(roi_base, [conv_uplift/100.0], [margin/100.0], [capex], [opex]).point(
+                conv_uplift/100.0, margin/100.0, capex, opex)
+            tbl = base[["store","conversion_pct","sales_per_visitor","count_in","turnover"]].copy()
+            for col in ["extra_turnover","extra_gross_profit","net_profit","payback_months"]:
+                tbl[col] = point[col].to_numpy()
+            tbl[["extra_turnover","extra_gross_profit"]] = tbl[["extra_turnover","extra_gross_profit"]].clip(lower=0.0)
+            tbl["payback_months"] = tbl["payback_months"].replace(np.inf, np.nan)  # nooit terugverdiend
+            eu_dataframe(
+                tbl.sort_values("extra_gross_profit", ascending=False),
+                {"turnover": "eur0", "sales_per_visitor": "eur2", "extra_turnover": "eur0",
+                 "extra_gross_profit": "eur0", "net_profit": "eur0", "count_in": "int",
+                 "conversion_pct": "pct1", "payback_months": "num1"},
+                use_container_width=True,
+            )
 
-            # Format
-            tbl = base[["store","conversion_rate","sales_per_visitor","count_in","turnover","extra_turnover","extra_gross_profit","payback_months"]].copy()
-            def eur(v, decimals=0):
-                fmt = f"€{{:,.{decimals}f}}".format(v).replace(",", "@").replace(".", ",").replace("@",".")
-                return fmt
-            tbl["turnover"] = tbl["turnover"].map(lambda v: eur(v,0))
-            tbl["sales_per_visitor"] = tbl["sales_per_visitor"].map(lambda v: eur(v,2))
-            tbl["extra_turnover"] = tbl["extra_turnover"].map(lambda v: eur(max(v,0),0))
-            tbl["extra_gross_profit"] = tbl["extra_gross_profit"].map(lambda v: eur(max(v,0),0))
-            tbl["count_in"] = tbl["count_in"].map(lambda v: f"{int(v):,}".replace(",", "."))
-            tbl["conversion_rate"] = base["conversion_rate"].apply(lambda x: x*100 if (isinstance(x,(int,float)) and x<=1) else x).map(lambda v: f"{v:,.1f}%".replace(",", "@").replace(".", ",").replace("@","."))
+            total_extra = float(point["extra_gross_profit"].sum())
+            c1,c2 = st.columns(2)
+            with c1: kpi("Totale extra brutowinst / mnd", fmt_eur(total_extra,0), "good" if total_extra>0 else "bad")
+            with c2: kpi("CAPEX totaal", fmt_eur(capex*len(shop_ids),0), "neutral")
 
-            st.dataframe(tbl.sort_values("extra_gross_profit", ascending=False), use_container_width=True)
+            st.subheader("Gevoeligheid: uplift x marge (portfolio)")
+            metric = st.radio("Waarde", ["Payback (maanden)", "Netto extra winst / mnd"], horizontal=True)
+            value = "payback" if metric.startswith("Payback") else "net"
+            sens = grid.sensitivity(capex, opex, value=value)
+            if value == "payback":
+                sens = sens.replace(np.inf, np.nan)
+            with span("render.chart"):
+                import plotly.express as px  # lazy: alleen als er getekend wordt
+                fig = px.imshow(
+                    sens,
+                    labels={"x": "Brutomarge (%)", "y": "Uplift (procentpunt)", "color": metric},
+                    aspect="auto",
+                    color_continuous_scale="RdYlGn_r" if value == "payback" else "RdYlGn",
+                    origin="lower",
+                )
+                st.plotly_chart(fig, use_container_width=True)
 
-            total_extra = float(base["extra_gross_profit"].sum())
-            c1,c2 = st.columns(2)
-            with c1: kpi("Totale extra brutowinst / mnd", eur(total_extra,0), "good" if total_extra>0 else "bad")
-            with c2: kpi("CAPEX totaal", eur(capex*len(shop_ids),0), "neutral")
+            st.subheader("Onzekerheid in uplift (Monte Carlo)")
+            # Eigen key: de band van de gebruiker blijft staan als de uplift-slider verschuift;
+            # startwaarde rond de uplift, binnen de grenzen van de slider
+            if "mc_uplift_band" not in st.session_state:
+                st.session_state["mc_uplift_band"] = (max(conv_uplift-3, 0), min(conv_uplift+3, 20))
+            u_low, u_high = st.slider("Uplift bandbreedte (procentpunt)", 0, 20, step=1, key="mc_uplift_band")
+            horizon = st.number_input("Payback-horizon (maanden)", min_value=1, value=12, step=1)
+            mc = monte_carlo(
+                roi_base,
+                u_low/100.0, min(max(conv_uplift, u_low), u_high)/100.0, u_high/100.0,
+                margin/100.0, capex, opex, horizon_months=horizon,
+            )
+            m1, m2, m3 = st.columns(3)
+            with m1: kpi("Netto extra winst / mnd (P5–P95)", f"{fmt_eur(mc['net_pct'][5])} – {fmt_eur(mc['net_pct'][95])}", "neutral")
+            with m2: kpi("Payback mediaan (maanden)", fmt_num(mc["payback_pct"][50], 1) if np.isfinite(mc["payback_pct"][50]) else "n.v.t.", "neutral")
+            with m3: kpi(f"Kans op payback < {horizon} mnd", fmt_pct(mc["p_payback_within_horizon"]*100.0, 0),
+                         "good" if mc["p_payback_within_horizon"] >= 0.5 else "bad")
     except Exception as e:
         st.error(f"Report call failed: {e}")
 else:
     st.info("Selecteer minimaal één store.")
+
+debug_panel()
@@ -1,7 +1,9 @@
 import streamlit as st
 import pandas as pd
-from ui import inject
-from utils_pfmx import fetch_report_hourly, normalize_report_hourly_to_df
+from ui import inject, debug_panel, select_stores
+from utils_pfmx import span
+from hourly_diagnostics import load_profile
+from formatting import eu_dataframe
 from shop_mapping import SHOP_OPTIONS
 
 st.set_page_config(page_title="Hourly Diagnostics", layout="wide")
@@ -9,29 +11,76 @@ inject()
 
 st.title("Hourly Diagnostics")
 
-store = st.selectbox("Store", list(SHOP_OPTIONS.keys()))
-shop_id = SHOP_OPTIONS[store]
+selected, shop_ids = select_stores("Stores")
+name_map = {v:k for k,v in SHOP_OPTIONS.items()}
 
 period = st.selectbox("Periode", ["today","yesterday","this_week","last_week","this_month","last_month","date"], index=3)
 
-date_from = st.text_input("date_from (YYYY-MM-DD)", value="")
-date_to = st.text_input("date_to (YYYY-MM-DD)", value="")
-
-if st.button("Fetch hourly"):
-    kwargs = dict(
-        data=[shop_id],
-        data_output=["turnover","conversion_rate","sales_per_visitor","count_in"],
-        source="shops",
-        period=period,
-    )
-    if period == "date":
-        kwargs["date_from"] = date_from or None
-        kwargs["date_to"] = date_to or None
+date_from = date_to = None
+if period == "date":
+    d1, d2 = st.columns(2)
+    with d1:
+        date_from = st.text_input("date_from (YYYY-MM-DD)", value="") or None
+    with d2:
+        date_to = st.text_input("date_to (YYYY-MM-DD)", value="") or None
 
+if shop_ids:
     try:
-        payload = fetch_report_hourly(**kwargs)
-        df = normalize_report_hourly_to_df(payload)
-        st.write("Rows:", len(df))
-        st.dataframe(df, use_container_width=True)
+        # Eén (parallelle) hourly fetch voor alle geselecteerde stores; store/metric wisselen = geen POST
+        with st.spinner("Uurdata ophalen..."):
+            profile, hdf = load_profile(shop_ids, period=period, date_from=date_from, date_to=date_to)
+        if hdf.empty:
+            st.warning("Geen data gevonden.")
+        else:
+            c1, c2 = st.columns(2)
+            with c1:
+                store = st.selectbox("Store", selected)
+            with c2:
+                metric_label = st.radio(
+                    "Metric",
+                    ["Bezoekers", "Conversie (%)", "SPV (€)", "Omzet (€)"],
+                    horizontal=True,
+                )
+            metric = {"Bezoekers": "count_in", "Conversie (%)": "conversion_pct",
+                      "SPV (€)": "sales_per_visitor", "Omzet (€)": "turnover"}[metric_label]
+
+            heat = profile.heatmap(SHOP_OPTIONS[store], metric)
+            with span("render.chart"):
+                import plotly.express as px  # lazy: alleen als er getekend wordt
+                fig = px.imshow(
+                    heat,
+                    labels={"x": "Uur", "y": "Weekdag", "color": metric_label},
+                    aspect="auto",
+                    color_continuous_scale="Purples",
+                    title=f"{store}: {metric_label} per weekdag x uur (gemiddeld per dag)",
+                )
+                st.plotly_chart(fig, use_container_width=True)
+
+            st.subheader("Piekuren (bezoekers)")
+            peaks = profile.peak_hours("count_in", top=3)
+            peaks.insert(0, "store", peaks["shop_id"].map(name_map))
+            eu_dataframe(peaks.drop(columns=["shop_id"]), {"count_in": "int"}, use_container_width=True, hide_index=True)
+
+            st.subheader("Mogelijke onderbezetting")
+            st.caption("Drukke uren (top 25% bezoekers van de store) met conversie ≥ 2 procentpunt onder de mediaan van die store.")
+            gaps = profile.staffing_gaps()
+            if gaps.empty:
+                st.success("Geen opvallende conversiegaten in drukke uren.")
+            else:
+                gaps.insert(0, "store", gaps["shop_id"].map(name_map))
+                eu_dataframe(
+                    gaps.drop(columns=["shop_id"]),
+                    {"count_in": "int", "conversion_pct": "pct1", "shop_median_pct": "pct1",
+                     "conv_gap_pp": "num1", "lost_turnover": "eur0"},
+                    use_container_width=True,
+                    hide_index=True,
+                )
+
+            with st.expander(f"Ruwe uurdata ({len(hdf)} rijen)"):
+                st.dataframe(hdf.reset_index(), use_container_width=True)
     except Exception as e:
         st.error(f"Hourly call failed: {e}")
+else:
+    st.info("Selecteer minimaal één store.")
+
+debug_panel()
@@ -0,0 +1,65 @@
+import streamlit as st
+import pandas as pd
+from ui import inject, debug_panel, select_stores
+from anomalies import exceptions, load_scored, summarize
+from formatting import eu_dataframe
+from shop_mapping import SHOP_OPTIONS
+
+st.set_page_config(page_title="Exceptions", layout="wide")
+inject()
+
+st.title("Exceptions")
+st.caption("Target-breaches en afwijkingen t.o.v. dezelfde weekdag (en uur) over de afgelopen weken, voor alle geselecteerde stores tegelijk.")
+
+selected, shop_ids = select_stores()
+
+c1, c2, c3 = st.columns(3)
+with c1:
+    period = st.selectbox("Periode", ["today","yesterday","this_week","last_week","this_month","last_month"], index=3)
+with c2:
+    granularity = st.radio("Niveau", ["Uur", "Dag"], horizontal=True)
+with c3:
+    z_threshold = st.slider("Afwijkingsdrempel (robuuste z)", 2.0, 6.0, 3.5, 0.5)
+
+t1, t2 = st.columns(2)
+with t1:
+    conv_target = st.slider("Conversie target (%)", 5, 50, 25, 1)
+with t2:
+    spv_target = st.slider("SPV target (€)", 0, 200, 30, 1)
+
+if shop_ids:
+    try:
+        with st.spinner("Data ophalen en scoren..."):
+            scored = load_scored(shop_ids, period=period, step="hour" if granularity == "Uur" else "day")
+        # Targets/drempel filteren alleen het gecachete gescoorde frame
+        exc = exceptions(scored, conv_target=conv_target, spv_target=spv_target, z_threshold=z_threshold)
+        if exc.empty:
+            st.success("Geen exceptions in deze periode.")
+        else:
+            name_map = {v:k for k,v in SHOP_OPTIONS.items()}
+            summ = summarize(exc)
+            summ.insert(0, "store", summ["shop_id"].map(name_map))
+            st.subheader("Per store")
+            st.dataframe(summ.drop(columns=["shop_id"]), use_container_width=True, hide_index=True)
+
+            st.subheader(f"Alle exceptions ({len(exc)})")
+            f1, f2 = st.columns(2)
+            with f1:
+                types = st.multiselect("Type", ["target", "laag", "hoog"], default=["target", "laag", "hoog"])
+            with f2:
+                metrics = st.multiselect("Metric", ["conversion_pct", "sales_per_visitor", "count_in"],
+                                         default=["conversion_pct", "sales_per_visitor", "count_in"])
+            view = exc[exc["type"].isin(types) & exc["metric"].isin(metrics)].copy()
+            view.insert(0, "store", view["shop_id"].map(name_map))
+            eu_dataframe(
+                view.drop(columns=["shop_id"]),
+                {"value": "num2", "baseline": "num2", "z": "num1", "target": "num0"},
+                use_container_width=True,
+                hide_index=True,
+            )
+    except Exception as e:
+        st.error(f"Report call failed: {e}")
+else:
+    st.info("Selecteer minimaal één store.")
+
+debug_panel()
@@ -0,0 +1,147 @@
+# period_compare.py
+# Periode-over-periode vergelijking (vorige periode / vorig jaar) bovenop de report store.
+# Beide vensters gaan in één sync_windows: wat al op schijf staat wordt hergebruikt,
+# alleen ontbrekende (of nog lopende) dagen worden opgehaald - vensters die aansluiten of
+# dicht bij elkaar liggen in één call. Eenmaal opgeslagen kost een YoY-vergelijking alleen
+# nog de delta van vandaag en de STORE_GRACE_DAYS ervoor.
+from datetime import date, timedelta
+from typing import List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from kpi_rollups import conversion_to_fraction, shop_kpis
+from report_store import sync_windows
+from utils_pfmx import expand_period, span
+
+DEFAULT_OUTPUTS = ["turnover", "conversion_rate", "sales_per_visitor", "count_in"]
+COMPARE_METRICS = ("turnover", "count_in", "conversion_pct", "sales_per_visitor")
+
+# Kalendereenheid per benoemde periode; "vorige periode" schuift één eenheid terug
+_PERIOD_MONTHS = {"this_month": 1, "last_month": 1, "this_quarter": 3, "last_quarter": 3,
+                  "this_year": 12, "last_year": 12}
+_PERIOD_DAYS = {"today": 1, "yesterday": 1, "this_week": 7, "last_week": 7}
+
+def _shift_months(d: date, months: int) -> date:
+    y, m = divmod(d.year * 12 + d.month - 1 - months, 12)
+    m += 1
+    last = (date(y + (m == 12), m % 12 + 1, 1) - timedelta(days=1)).day
+    # Maandeinde blijft maandeinde (30 sep -> 31 aug); anders dag clampen (31 mrt -> 28 feb)
+    if (d + timedelta(days=1)).day == 1:
+        return date(y, m, last)
+    return date(y, m, min(d.day, last))
+
+def reference_window(start: date, end: date, period: str, reference: str = "previous") -> Tuple[date, date]:
+    """
+    Referentievenster voor (start, end):
+      previous       - één kalendereenheid terug (maand/kwartaal/jaar/week/dag), anders het
+                       even lange venster direct ervoor
+      last_year      - 52 weken terug (zelfde weekdagen)
+      last_year_date - zelfde kalenderdata vorig jaar
+    """
+    length = (end - start).days
+    if reference == "previous":
+        if period in _PERIOD_MONTHS:
+            # Per kalendermaand schuiven: last_month = hele vorige maand, this_month = zelfde dagen
+            return _shift_months(start, _PERIOD_MONTHS[period]), _shift_months(end, _PERIOD_MONTHS[period])
+        elif period in _PERIOD_DAYS:
+            ref_start = start - timedelta(days=_PERIOD_DAYS[period])
+        else:
+            ref_start = start - timedelta(days=length + 1)
+    elif reference == "last_year":
+        ref_start = start - timedelta(weeks=52)
+    elif reference == "last_year_date":
+        return _shift_months(start, 12), _shift_months(end, 12)
+    else:
+        raise ValueError(f"Onbekende referentie: {reference!r} (verwacht previous, last_year of last_year_date)")
+    return ref_start, ref_start + timedelta(days=length)
+
+class PeriodComparison:
+    """
+    Resultaat van compare_periods.
+      current / reference - dagframes (normalize_report_days_to_df vorm) per venster
+      daily   - uitgelijnde (shop, dag) rijen: <m>, <m>_ref, <m>_delta, <m>_pct
+      shops   - shop_kpis van beide vensters naast elkaar met dezelfde delta-kolommen
+    """
+
+    def __init__(self, windows: List[Tuple[date, date]], current: pd.DataFrame, reference: pd.DataFrame):
+        self.window, self.reference_window = windows
+        self.current = current
+        self.reference = reference
+        self.daily = _align_daily(current, reference, self.window[0], self.reference_window[0])
+        self.shops = _compare_kpis(shop_kpis(current), shop_kpis(reference))
+
+def _deltas(out: pd.DataFrame, metrics) -> pd.DataFrame:
+    for m in metrics:
+        if m not in out or f"{m}_ref" not in out:
+            continue
+        cur = out[m].to_numpy(dtype=np.float64)
+        ref = out[f"{m}_ref"].to_numpy(dtype=np.float64)
+        out[f"{m}_delta"] = cur - ref
+        with np.errstate(divide="ignore", invalid="ignore"):
+            out[f"{m}_pct"] = np.where(ref != 0, (cur - ref) / np.abs(ref) * 100.0, np.nan)
+    return out
+
+def _day_frame(df: pd.DataFrame, start: date) -> pd.DataFrame:
+    if df.empty:
+        return pd.DataFrame(columns=["shop_id", "day", *COMPARE_METRICS])
+    out = pd.DataFrame({
+        "shop_id": df["shop_id"].astype("int64").to_numpy(),
+        # Dag-offset t.o.v. de start van het venster: de uitlijningssleutel
+        "day": (pd.to_datetime(df["date"]) - pd.Timestamp(start)).dt.days.to_numpy(),
+        "date": pd.to_datetime(df["date"]).to_numpy(),
+    })
+    for m in ("turnover", "count_in", "sales_per_visitor"):
+        if m in df:
+            out[m] = pd.to_numeric(df[m], errors="coerce").to_numpy()
+    if "conversion_rate" in df:
+        out["conversion_pct"] = conversion_to_fraction(df["conversion_rate"]).to_numpy() * 100.0
+    return out
+
+def _align_daily(current: pd.DataFrame, reference: pd.DataFrame, cur_start: date, ref_start: date) -> pd.DataFrame:
+    cur = _day_frame(current, cur_start)
+    ref = _day_frame(reference, ref_start).rename(columns=lambda c: c if c in ("shop_id", "day") else f"{c}_ref")
+    out = cur.merge(ref, on=["shop_id", "day"], how="left", sort=True)
+    return _deltas(out, COMPARE_METRICS)
+
+def _compare_kpis(cur: pd.DataFrame, ref: pd.DataFrame) -> pd.DataFrame:
+    if cur.empty:
+        return cur
+    cols = ["shop_id", *COMPARE_METRICS]
+    ref = ref[cols] if not ref.empty else pd.DataFrame(columns=cols)
+    out = cur[cols].merge(ref.rename(columns={m: f"{m}_ref" for m in COMPARE_METRICS}), on="shop_id", how="left")
+    return _deltas(out, COMPARE_METRICS)
+
+def compare_periods(
+    *,
+    data: List[int],
+    data_output: Optional[List[str]] = None,
+    period: str = "this_month",
+    reference: str = "previous",
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    today: Optional[date] = None,
+    stale_while_revalidate: bool = False,
+) -> PeriodComparison:
+    """
+    Vergelijk een periode met de vorige periode of vorig jaar (zie reference_window).
+    Lopende periodes (this_month, ...) worden vergeleken met hetzelfde aantal dagen in de
+    referentie (month-to-date vs. dezelfde dagen vorige maand).
+    """
+    today = today or date.today()
+    if period == "date":
+        if not date_from or not date_to:
+            raise ValueError("Voor period='date' zijn 'date_from' en 'date_to' verplicht (YYYY-MM-DD).")
+        start, end = date.fromisoformat(date_from), date.fromisoformat(date_to)
+    else:
+        start, end = expand_period(period, today)
+    windows = [(start, end), reference_window(start, end, period, reference)]
+    current, ref = sync_windows(
+        data=data,
+        data_output=data_output or DEFAULT_OUTPUTS,
+        windows=windows,
+        today=today,
+        stale_while_revalidate=stale_while_revalidate,
+    )
+    with span("aggregate.compare", rows=len(current) + len(ref)):
+        return PeriodComparison(windows, current, ref)
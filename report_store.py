@@ -0,0 +1,315 @@
+# report_store.py
+# Lokale Parquet-store voor historische report data.
+# Afgesloten dagen (ouder dan STORE_GRACE_DAYS) veranderen niet meer; die worden één
+# keer opgehaald en daarna van schijf gelezen. sync_report haalt alleen de
+# ontbrekende, nog lopende of recente dagen op bij de agent.
+#
+# Layout:  {root}/{day|hour}/{outputs-hash}/shop_id={id}/month={YYYY-MM}/data.parquet
+#                                                                    .../covered.json
+import hashlib
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+from datetime import date, timedelta
+from typing import Dict, List, Optional, Set, Tuple
+
+import pandas as pd
+
+from utils_pfmx import (
+    FANOUT_MAX_WORKERS,
+    LATE_DATA_GRACE_DAYS,
+    _get_secret,
+    expand_period,
+    fetch_report,
+    fetch_report_hourly,
+    logger,
+    normalize_report_days_to_df,
+    normalize_report_hourly_to_df,
+)
+
+# pyarrow is optioneel; zonder pyarrow valt sync_report terug op een gewone fetch
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    HAS_PARQUET = True
+except ImportError:
+    pa = None
+    pq = None
+    HAS_PARQUET = False
+
+STORE_DIR = _get_secret("REPORT_STORE_DIR", ".pfm_store")
+# Tellers en omzet van dag D komen vaak nog na middernacht binnen: dagen binnen deze
+# marge worden wel opgeslagen maar niet als compleet gemarkeerd (volgende sync haalt ze opnieuw)
+STORE_GRACE_DAYS = LATE_DATA_GRACE_DAYS
+
+def _outputs_key(data_output: List[str]) -> str:
+    return hashlib.sha1(",".join(sorted(set(data_output))).encode()).hexdigest()[:12]
+
+def _months(start: date, end: date) -> List[str]:
+    out = []
+    cur = start.replace(day=1)
+    while cur <= end:
+        out.append(f"{cur.year:04d}-{cur.month:02d}")
+        cur = (cur + timedelta(days=32)).replace(day=1)
+    return out
+
+def _days(start: date, end: date) -> List[date]:
+    return [start + timedelta(days=i) for i in range((end - start).days + 1)]
+
+class ReportStore:
+    """
+    Parquet-store per (granulariteit, set data_outputs), gepartitioneerd op shop_id/maand.
+    Per partitie houdt covered.json bij welke afgesloten dagen volledig zijn opgehaald.
+    """
+
+    def __init__(self, root: str = STORE_DIR):
+        self.root = root
+        self._lock = threading.Lock()
+        # part_dir -> (hash van de laatst geschreven rijen, mtime_ns van data.parquet): de open
+        # dagen komen elke rerun opnieuw binnen, ongewijzigd herschrijven slaan we over
+        self._written: Dict[str, Tuple[str, int]] = {}
+
+    def _partition_dir(self, kind: str, outputs: str, shop_id: int, month: str) -> str:
+        return os.path.join(self.root, kind, outputs, f"shop_id={shop_id}", f"month={month}")
+
+    def _read_covered(self, part_dir: str) -> Set[str]:
+        try:
+            with open(os.path.join(part_dir, "covered.json"), encoding="utf-8") as f:
+                return set(json.load(f))
+        except (OSError, ValueError):
+            return set()
+
+    def covered_days(self, kind: str, data_output: List[str], shop_id: int, start: date, end: date) -> Set[date]:
+        outputs = _outputs_key(data_output)
+        out: Set[date] = set()
+        for month in _months(start, end):
+            for d in self._read_covered(self._partition_dir(kind, outputs, shop_id, month)):
+                day = date.fromisoformat(d)
+                if start <= day <= end:
+                    out.add(day)
+        return out
+
+    @staticmethod
+    def _mtime(path: str) -> int:
+        try:
+            return os.stat(path).st_mtime_ns
+        except OSError:
+            return -1
+
+    def _read_partition(self, part_dir: str) -> pd.DataFrame:
+        path = os.path.join(part_dir, "data.parquet")
+        if not os.path.exists(path):
+            return pd.DataFrame()
+        return pq.read_table(path, memory_map=True).to_pandas()
+
+    def write(self, kind: str, data_output: List[str], df: pd.DataFrame, closed_days: Dict[int, Set[date]]) -> None:
+        """
+        Schrijf een long frame (kolommen 'date' of 'timestamp', 'shop_id', metrics) weg.
+        Bestaande rijen voor dezelfde dagen worden vervangen; closed_days worden als compleet gemarkeerd.
+        """
+        outputs = _outputs_key(data_output)
+        time_col = "timestamp" if kind == "hour" else "date"
+        frame = df.copy()
+        if not frame.empty:
+            frame["_day"] = frame[time_col].dt.normalize()
+            frame["_month"] = frame[time_col].dt.strftime("%Y-%m")
+        with self._lock:
+            keys: Set[Tuple[int, str]] = set()
+            if not frame.empty:
+                keys.update(zip(frame["shop_id"].astype(int), frame["_month"]))
+            for shop_id, days in closed_days.items():
+                keys.update((shop_id, f"{d.year:04d}-{d.month:02d}") for d in days)
+            for shop_id, month in sorted(keys):
+                part_dir = self._partition_dir(kind, outputs, shop_id, month)
+                os.makedirs(part_dir, exist_ok=True)
+                if not frame.empty:
+                    new = frame[(frame["shop_id"].astype(int) == shop_id) & (frame["_month"] == month)]
+                else:
+                    new = frame
+                if not new.empty:
+                    rows = new.drop(columns=["_day", "_month"])
+                    sig = hashlib.sha1(pd.util.hash_pandas_object(rows, index=False).to_numpy().tobytes()).hexdigest()
+                    path = os.path.join(part_dir, "data.parquet")
+                    if self._written.get(part_dir) != (sig, self._mtime(path)):
+                        old = self._read_partition(part_dir)
+                        if not old.empty:
+                            old = old[~old[time_col].dt.normalize().isin(new["_day"].unique())]
+                        merged = pd.concat([old, rows], ignore_index=True)
+                        merged = merged.sort_values(time_col).reset_index(drop=True)
+                        tmp = os.path.join(part_dir, "data.parquet.tmp")
+                        pq.write_table(pa.Table.from_pandas(merged, preserve_index=False), tmp)
+                        os.replace(tmp, path)
+                        self._written[part_dir] = (sig, self._mtime(path))
+                done = {d.isoformat() for d in closed_days.get(shop_id, set()) if f"{d.year:04d}-{d.month:02d}" == month}
+                if done:
+                    covered = self._read_covered(part_dir)
+                    if done <= covered:
+                        continue
+                    covered |= done
+                    tmp = os.path.join(part_dir, "covered.json.tmp")
+                    with open(tmp, "w", encoding="utf-8") as f:
+                        json.dump(sorted(covered), f)
+                    os.replace(tmp, os.path.join(part_dir, "covered.json"))
+
+    def read(self, kind: str, data_output: List[str], shop_ids: List[int], start: date, end: date) -> pd.DataFrame:
+        outputs = _outputs_key(data_output)
+        time_col = "timestamp" if kind == "hour" else "date"
+        parts = []
+        for shop_id in shop_ids:
+            for month in _months(start, end):
+                part = self._read_partition(self._partition_dir(kind, outputs, shop_id, month))
+                if not part.empty:
+                    parts.append(part)
+        if not parts:
+            return pd.DataFrame()
+        df = pd.concat(parts, ignore_index=True)
+        day = df[time_col].dt.normalize()
+        df = df[(day >= pd.Timestamp(start)) & (day <= pd.Timestamp(end))]
+        return df.sort_values(["shop_id", time_col]).reset_index(drop=True)
+
+REPORT_STORE = ReportStore()
+
+def _normalize(kind: str, payload: Dict) -> pd.DataFrame:
+    if kind == "hour":
+        return normalize_report_hourly_to_df(payload).reset_index()
+    return normalize_report_days_to_df(payload)
+
+def _to_output(kind: str, df: pd.DataFrame) -> pd.DataFrame:
+    if df.empty:
+        return df
+    df = df.assign(shop_id=df["shop_id"].astype("int32"))
+    if kind == "hour":
+        return df.assign(shop_id=pd.Categorical(df["shop_id"])).set_index(["shop_id", "timestamp"]).sort_index()
+    return df
+
+# Bereiken met een gat van hooguit zoveel dagen gaan in één call: een paar extra dagen
+# ophalen (en opslaan) is goedkoper dan een extra round-trip.
+MERGE_GAP_DAYS = 14
+
+def _merge_ranges(ranges: List[Tuple[date, date]], max_gap_days: int = MERGE_GAP_DAYS) -> List[Tuple[date, date]]:
+    # Overlappende, aansluitende of dicht bij elkaar liggende bereiken samenvoegen
+    merged: List[Tuple[date, date]] = []
+    for lo, hi in sorted(ranges):
+        if merged and lo <= merged[-1][1] + timedelta(days=max_gap_days + 1):
+            merged[-1] = (merged[-1][0], max(merged[-1][1], hi))
+        else:
+            merged.append((lo, hi))
+    return merged
+
+def sync_windows(
+    *,
+    data: List[int],
+    data_output: List[str],
+    windows: List[Tuple[date, date]],
+    period_step: str = "day",
+    store: Optional[ReportStore] = None,
+    today: Optional[date] = None,
+    stale_while_revalidate: bool = False,
+) -> List[pd.DataFrame]:
+    """
+    Zoals sync_report, maar voor meerdere datumvensters tegelijk (bv. huidige periode +
+    referentie). Per shop wordt per venster het ontbrekende bereik bepaald; bereiken die
+    overlappen of aansluiten gaan samen, en shops met dezelfde bereiken delen één
+    delta-call. Geeft per venster een frame terug (zelfde vorm als sync_report).
+    """
+    kind = "hour" if period_step == "hour" else "day"
+    today = today or date.today()
+    fetch = fetch_report_hourly if kind == "hour" else fetch_report
+
+    def _fetch(shops: List[int], lo: date, hi: date, swr: bool, use_cache: bool = True) -> pd.DataFrame:
+        kwargs = dict(data=shops, data_output=data_output, period="date",
+                      date_from=lo.isoformat(), date_to=hi.isoformat(),
+                      stale_while_revalidate=swr, use_cache=use_cache)
+        if kind == "day":
+            kwargs["period_step"] = "day"
+        return _normalize(kind, fetch(**kwargs))
+
+    if not HAS_PARQUET:
+        # Zonder store: één fetch per samengevoegd bereik (de report cache doet de rest)
+        out = []
+        fetched = {r: _fetch(list(data), *r, stale_while_revalidate) for r in _merge_ranges(list(windows))}
+        for lo, hi in windows:
+            frame = next(f for (a, b), f in fetched.items() if a <= lo and hi <= b)
+            col = frame["timestamp"] if kind == "hour" else frame.get("date")
+            if col is not None and not frame.empty:
+                day = pd.to_datetime(col).dt.normalize()
+                frame = frame[(day >= pd.Timestamp(lo)) & (day <= pd.Timestamp(hi))]
+            out.append(_to_output(kind, frame))
+        return out
+
+    store = store or REPORT_STORE
+    per_shop: Dict[int, Tuple[Tuple[date, date], ...]] = {}
+    for shop_id in data:
+        todo = []
+        for lo, hi in windows:
+            covered = store.covered_days(kind, data_output, shop_id, lo, hi)
+            missing = [d for d in _days(lo, hi) if d not in covered]
+            if missing:
+                todo.append((missing[0], missing[-1]))
+        if todo:
+            per_shop[shop_id] = tuple(_merge_ranges(todo))
+
+    # Shops met hetzelfde ontbrekende bereik delen één delta-call
+    ranges: Dict[Tuple[date, date], List[int]] = {}
+    for shop_id, todo in per_shop.items():
+        for r in todo:
+            ranges.setdefault(r, []).append(shop_id)
+    jobs = sorted(ranges.items())
+    for (delta_from, delta_to), shops in jobs:
+        logger.info("Store delta: %d shops, %s t/m %s", len(shops), delta_from, delta_to)
+    # Nooit stale-while-revalidate voor wat we opslaan, en de report cache overslaan zodra
+    # het bereik dagen bevat die als compleet gemarkeerd worden: een payload uit de tijd dat
+    # die dagen nog binnen de grace-marge vielen zou anders voorgoed bevroren worden.
+    # Bereiken met alleen open dagen (de gewone rerun-delta) mogen uit de cache komen.
+    closed_before = today - timedelta(days=STORE_GRACE_DAYS)
+    args = [(shops, lo, hi, False, lo >= closed_before) for (lo, hi), shops in jobs]
+    if len(jobs) > 1:
+        # Verschillende bereiken (bv. YoY met ongelijke dekking) parallel, zoals de fan-out
+        # in utils_pfmx; schrijven blijft in deze thread
+        workers = max(1, min(FANOUT_MAX_WORKERS, len(jobs)))
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(copy_context().run, _fetch, *a) for a in args]
+            frames = [f.result() for f in futures]
+    else:
+        frames = [_fetch(*a) for a in args]
+    for ((delta_from, delta_to), shops), df in zip(jobs, frames):
+        # Alleen afgesloten dagen als compleet markeren; vandaag en de grace-dagen blijven open
+        closed = {s: {d for d in _days(delta_from, delta_to) if d < closed_before} for s in shops}
+        store.write(kind, data_output, df, closed)
+
+    return [_to_output(kind, store.read(kind, data_output, list(data), lo, hi)) for lo, hi in windows]
+
+def sync_report(
+    *,
+    data: List[int],
+    data_output: List[str],
+    period: str = "this_month",
+    period_step: str = "day",
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    store: Optional[ReportStore] = None,
+    today: Optional[date] = None,
+    stale_while_revalidate: bool = False,
+) -> pd.DataFrame:
+    """
+    Report data voor shops x periode, aangevuld vanuit de lokale store.
+    Haalt alleen het datumbereik op dat voor een shop nog ontbreekt of nog
+    open is (vandaag en de STORE_GRACE_DAYS ervoor) - één delta-call per uniek bereik - schrijft dat weg en leest het
+    gevraagde bereik van schijf. Geeft hetzelfde frame als de normalizers
+    (dag: long frame; uur: MultiIndex (shop_id, timestamp)).
+    stale_while_revalidate geldt alleen zonder pyarrow (gewone fetch); delta-calls die
+    in de store belanden halen altijd verse data op.
+    """
+    today = today or date.today()
+    if period == "date":
+        if not date_from or not date_to:
+            raise ValueError("Voor period='date' zijn 'date_from' en 'date_to' verplicht (YYYY-MM-DD).")
+        start, end = date.fromisoformat(date_from), date.fromisoformat(date_to)
+    else:
+        start, end = expand_period(period, today)
+    return sync_windows(
+        data=data, data_output=data_output, windows=[(start, end)], period_step=period_step,
+        store=store, today=today, stale_while_revalidate=stale_while_revalidate,
+    )[0]
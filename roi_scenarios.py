@@ -0,0 +1,175 @@
+# roi_scenarios.py
+# Vectorized ROI-scenario's voor Executive ROI: per-shop basis-KPI's (uit shop_kpis)
+# gebroadcast tegen een grid van uplift x marge x capex x opex, plus Monte Carlo op
+# een onzekere uplift. Puur NumPy op de al opgehaalde data: geen extra API-calls.
+#
+# Model (per shop, per maand):
+#   new_conv     = min(conv + uplift, 1)
+#   new_spv      = spv * new_conv / conv          (conv == 0 -> geen effect)
+#   extra_profit = (new_spv - spv) * bezoekers * marge
+#   net          = extra_profit - opex
+#   payback      = capex / net   (maanden; inf als net <= 0)
+from typing import Dict, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from utils_pfmx import span
+
+class ScenarioBase:
+    """Per-shop basis als NumPy-arrays (conv als fractie, spv in €, bezoekers per periode)."""
+
+    def __init__(self, shop_id, conv, spv, visitors, months: float = 1.0):
+        self.shop_id = np.asarray(shop_id)
+        self.conv = np.clip(np.asarray(conv, dtype=np.float64), 0.0, 1.0)
+        self.spv = np.asarray(spv, dtype=np.float64)
+        # Bezoekers per maand, zodat opex/payback in maanden kloppen
+        self.visitors = np.asarray(visitors, dtype=np.float64) / max(months, 1e-9)
+
+    @classmethod
+    def from_kpis(cls, kpis: pd.DataFrame, months: float = 1.0) -> "ScenarioBase":
+        """Uit shop_kpis(df): conv_frac, sales_per_visitor, count_in."""
+        return cls(
+            kpis["shop_id"].to_numpy(),
+            kpis["conv_frac"].fillna(0.0).to_numpy(),
+            kpis["sales_per_visitor"].fillna(0.0).to_numpy(),
+            kpis["count_in"].fillna(0.0).to_numpy(),
+            months=months,
+        )
+
+    def __len__(self) -> int:
+        return len(self.conv)
+
+    def extra_turnover(self, uplift) -> np.ndarray:
+        """
+        Extra omzet per maand, shape (n_shops, *uplift.shape). uplift is een fractie
+        (0.05 = +5 procentpunt) en mag elke vorm hebben.
+        """
+        u = np.asarray(uplift, dtype=np.float64)
+        expand = (slice(None),) + (None,) * u.ndim
+        conv, spv, visitors = self.conv[expand], self.spv[expand], self.visitors[expand]
+        new_conv = np.minimum(conv + u, 1.0)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            ratio = np.where(conv > 0, new_conv / conv, 1.0)
+        return spv * (ratio - 1.0) * visitors
+
+def payback_months(capex, net) -> np.ndarray:
+    """capex / net met inf waar net <= 0 (nooit terugverdiend)."""
+    capex = np.asarray(capex, dtype=np.float64)
+    net = np.asarray(net, dtype=np.float64)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(net > 0, capex / net, np.inf)
+
+class ScenarioGrid:
+    """
+    Resultaat van scenario_grid. Assen: uplift (U), margin (M), capex (C), opex (O).
+      extra_turnover  (S, U)        extra omzet per shop per maand
+      extra_profit    (S, U, M)     extra brutowinst per shop per maand
+      portfolio_net   (U, M, O)     som over shops van extra_profit - opex
+      portfolio_payback (U, M, C, O) totale capex / portfolio_net
+    shop_payback() geeft de volledige (S, U, M, C, O) kubus op aanvraag.
+    """
+
+    def __init__(self, base: ScenarioBase, uplifts, margins, capexes, opexes):
+        self.base = base
+        self.uplifts = np.asarray(uplifts, dtype=np.float64)
+        self.margins = np.asarray(margins, dtype=np.float64)
+        self.capexes = np.asarray(capexes, dtype=np.float64)
+        self.opexes = np.asarray(opexes, dtype=np.float64)
+
+        self.extra_turnover = base.extra_turnover(self.uplifts)
+        self.extra_profit = self.extra_turnover[:, :, None] * self.margins[None, None, :]
+        n = len(base)
+        self.portfolio_profit = self.extra_profit.sum(axis=0)
+        self.portfolio_net = self.portfolio_profit[:, :, None] - n * self.opexes[None, None, :]
+        self.portfolio_payback = payback_months(
+            n * self.capexes[None, None, :, None], self.portfolio_net[:, :, None, :]
+        )
+
+    def shop_payback(self) -> np.ndarray:
+        net = self.extra_profit[..., None] - self.opexes  # (S, U, M, O)
+        return payback_months(self.capexes[None, None, None, :, None], net[:, :, :, None, :])
+
+    def _index(self, axis: np.ndarray, value: float) -> int:
+        return int(np.abs(axis - value).argmin())
+
+    def point(self, uplift: float, margin: float, capex: float, opex: float) -> pd.DataFrame:
+        """Per-shop tabel voor één scenario (dichtstbijzijnde gridpunt)."""
+        u, m = self._index(self.uplifts, uplift), self._index(self.margins, margin)
+        c, o = self._index(self.capexes, capex), self._index(self.opexes, opex)
+        extra_profit = self.extra_profit[:, u, m]
+        net = extra_profit - self.opexes[o]
+        return pd.DataFrame({
+            "shop_id": self.base.shop_id,
+            "extra_turnover": self.extra_turnover[:, u],
+            "extra_gross_profit": extra_profit,
+            "net_profit": net,
+            "payback_months": payback_months(self.capexes[c], net),
+        })
+
+    def sensitivity(self, capex: float, opex: float, value: str = "payback") -> pd.DataFrame:
+        """Uplift x marge tabel (portfolio) bij vaste capex/opex; value='payback' of 'net'."""
+        c, o = self._index(self.capexes, capex), self._index(self.opexes, opex)
+        if value == "payback":
+            data = self.portfolio_payback[:, :, c, o]
+        elif value == "net":
+            data = self.portfolio_net[:, :, o]
+        else:
+            raise ValueError(f"Onbekende waarde: {value!r} (verwacht 'payback' of 'net')")
+        return pd.DataFrame(
+            data,
+            index=pd.Index(np.round(self.uplifts * 100.0, 2), name="uplift_pp"),
+            columns=pd.Index(np.round(self.margins * 100.0, 1), name="margin_pct"),
+        )
+
+def scenario_grid(
+    base: ScenarioBase,
+    uplifts: Sequence[float],
+    margins: Sequence[float],
+    capexes: Sequence[float],
+    opexes: Sequence[float],
+) -> ScenarioGrid:
+    """
+    Evalueer alle combinaties in één keer. uplifts en margins als fractie
+    (0.05 = 5 procentpunt, 0.5 = 50% marge), capex in € per shop, opex in € per shop per maand.
+    """
+    with span("roi.grid", rows=len(base) * len(uplifts) * len(margins) * len(capexes) * len(opexes)):
+        return ScenarioGrid(base, uplifts, margins, capexes, opexes)
+
+def monte_carlo(
+    base: ScenarioBase,
+    uplift_low: float,
+    uplift_mode: float,
+    uplift_high: float,
+    margin: float,
+    capex: float,
+    opex: float,
+    n: int = 10_000,
+    horizon_months: float = 12.0,
+    seed: Optional[int] = 0,
+) -> Dict[str, object]:
+    """
+    Monte Carlo over een onzekere uplift (driehoeksverdeling low/mode/high, fracties).
+    Eén uplift-trekking per simulatie voor het hele portfolio. Geeft percentielen van de
+    portfolio-netto winst en payback, en de kans op payback binnen horizon_months.
+    """
+    if not uplift_low <= uplift_mode <= uplift_high:
+        raise ValueError("Uplift moet voldoen aan low <= mode <= high")
+    with span("roi.monte_carlo", rows=n * len(base)):
+        rng = np.random.default_rng(seed)
+        if uplift_high > uplift_low:
+            samples = rng.triangular(uplift_low, uplift_mode, uplift_high, size=n)
+        else:
+            samples = np.full(n, uplift_low)
+        shops = len(base)
+        net = base.extra_turnover(samples).sum(axis=0) * margin - shops * opex  # (n,)
+        payback = payback_months(shops * capex, net)
+        quantiles = [5, 50, 95]
+        return {
+            "uplift": samples,
+            "net": net,
+            "payback": payback,
+            "net_pct": dict(zip(quantiles, np.percentile(net, quantiles))),
+            "payback_pct": dict(zip(quantiles, np.percentile(payback, quantiles))),
+            "p_payback_within_horizon": float(np.mean(payback <= horizon_months)),
+        }
@@ -1,16 +1,267 @@
+# shop_mapping.py
+# Shop-registry: welke shops er zijn, met naam, regio en company.
+# Bronnen (in volgorde):
+#   1. SHOP_REGISTRY_FILE (json-lijst of csv met id,name,region,company) - leidend
+#   2. schijfcache (<REPORT_STORE_DIR>/shops.json) zolang jonger dan SHOP_REGISTRY_TTL
+#   3. de agent voor SHOP_COMPANY (SHOPS_URL als die er is, anders ontdekking via een
+#      report call op company over de laatste SHOP_DISCOVERY_DAYS dagen, zodat een shop
+#      die gisteren dicht was niet wegvalt); resultaat gaat naar de schijfcache
+#   4. DEFAULT_SHOPS hieronder
+# SHOP_NAME_MAP / SHOP_ID_TO_NAME / SHOP_NAME_TO_ID / SHOP_OPTIONS blijven bestaan en
+# worden lazy uit de registry afgeleid (pas bij eerste gebruik geladen, per registry
+# één keer opgebouwd).
+import bisect
+import csv
+import json
+import os
+import threading
+import time
+from datetime import date, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from utils_pfmx import _get_secret, _safe_post, fetch_report, load_report_json, logger
+
 # Bron: jij gaf ID -> Naam
-SHOP_NAME_MAP = {
-    32224: "Amersfoort",
-    31977: "Amsterdam",
-    31831: "Den Bosch",
-    32872: "Haarlem",
-    32319: "Leiden",
-    32871: "Maastricht",
-    30058: "Nijmegen",
-    32320: "Rotterdam",
-    32204: "Venlo"
-}
-
-# Handige afgeleiden:
-SHOP_ID_TO_NAME = SHOP_NAME_MAP
-SHOP_NAME_TO_ID = {v: k for k, v in SHOP_NAME_MAP.items()}
+DEFAULT_SHOPS = [
+    {"id": 32224, "name": "Amersfoort"},
+    {"id": 31977, "name": "Amsterdam"},
+    {"id": 31831, "name": "Den Bosch"},
+    {"id": 32872, "name": "Haarlem"},
+    {"id": 32319, "name": "Leiden"},
+    {"id": 32871, "name": "Maastricht"},
+    {"id": 30058, "name": "Nijmegen"},
+    {"id": 32320, "name": "Rotterdam"},
+    {"id": 32204, "name": "Venlo"},
+]
+
+SHOP_REGISTRY_FILE = _get_secret("SHOP_REGISTRY_FILE", "shops.json")
+SHOP_REGISTRY_CACHE = os.path.join(_get_secret("REPORT_STORE_DIR", ".pfm_store"), "shops.json")
+SHOP_REGISTRY_TTL = int(_get_secret("SHOP_REGISTRY_TTL", str(24 * 3600)))
+SHOP_COMPANY = _get_secret("SHOP_COMPANY", None)
+SHOPS_URL = _get_secret("SHOPS_URL", None)
+SHOP_DISCOVERY_DAYS = int(_get_secret("SHOP_DISCOVERY_DAYS", "35"))
+
+def _clean(raw: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    # Accepteer id/shop_id en name/shop_name; lege regio/company -> None
+    try:
+        shop_id = int(raw.get("id", raw.get("shop_id")))
+    except (TypeError, ValueError):
+        return None
+    name = str(raw.get("name") or raw.get("shop_name") or f"Shop {shop_id}").strip()
+    region = (str(raw.get("region")).strip() or None) if raw.get("region") is not None else None
+    company = raw.get("company")
+    try:
+        company = int(company) if company not in (None, "") else None
+    except (TypeError, ValueError):
+        company = None
+    return {"id": shop_id, "name": name, "region": region, "company": company}
+
+class ShopRegistry:
+    """
+    Geïndexeerde shoplijst: O(1) op id en naam, lijsten per regio/company en
+    prefix-zoeken (bisect op gesorteerde namen) voor de store-selectors.
+    """
+
+    def __init__(self, shops: Iterable[Dict[str, Any]], source: str = "default"):
+        self.source = source
+        self._by_id: Dict[int, Dict[str, Any]] = {}
+        for raw in shops:
+            shop = _clean(raw)
+            if shop is not None:
+                self._by_id[shop["id"]] = shop
+        self._by_region: Dict[str, List[int]] = {}
+        self._by_company: Dict[int, List[int]] = {}
+        self._labels: Dict[int, str] = {}
+        names: Dict[str, List[int]] = {}
+        for shop in self._by_id.values():
+            names.setdefault(shop["name"].casefold(), []).append(shop["id"])
+            if shop["region"]:
+                self._by_region.setdefault(shop["region"], []).append(shop["id"])
+            if shop["company"] is not None:
+                self._by_company.setdefault(shop["company"], []).append(shop["id"])
+        # Label = naam; bij dubbele namen (meerdere companies) met id erachter
+        for ids in names.values():
+            for shop_id in ids:
+                name = self._by_id[shop_id]["name"]
+                self._labels[shop_id] = name if len(ids) == 1 else f"{name} ({shop_id})"
+        self._by_label = {label.casefold(): shop_id for shop_id, label in self._labels.items()}
+        self._sorted: List[Tuple[str, int]] = sorted((label.casefold(), i) for i, label in self._labels.items())
+        self._keys = [k for k, _ in self._sorted]
+        self._compat: Dict[str, Dict[Any, Any]] = {}
+
+    def __len__(self) -> int:
+        return len(self._by_id)
+
+    def __contains__(self, shop_id: int) -> bool:
+        return shop_id in self._by_id
+
+    def get(self, shop_id: int) -> Optional[Dict[str, Any]]:
+        return self._by_id.get(shop_id)
+
+    def label(self, shop_id: int) -> str:
+        return self._labels.get(shop_id, f"Shop {shop_id}")
+
+    def id_for(self, label: str) -> Optional[int]:
+        return self._by_label.get(label.casefold())
+
+    def ids(self) -> List[int]:
+        return list(self._by_id)
+
+    def regions(self) -> List[str]:
+        return sorted(self._by_region)
+
+    def companies(self) -> List[int]:
+        return sorted(self._by_company)
+
+    def in_region(self, *regions: str) -> List[int]:
+        return [i for r in regions for i in self._by_region.get(r, [])]
+
+    def in_company(self, *companies: int) -> List[int]:
+        return [i for c in companies for i in self._by_company.get(c, [])]
+
+    def search(self, prefix: str, limit: Optional[int] = 20) -> List[int]:
+        """Shop-ids waarvan het label met prefix begint (hoofdletterongevoelig, alfabetisch)."""
+        key = prefix.casefold()
+        lo = bisect.bisect_left(self._keys, key)
+        out = []
+        for k, shop_id in self._sorted[lo:]:
+            if not k.startswith(key) or (limit is not None and len(out) >= limit):
+                break
+            out.append(shop_id)
+        return out
+
+    def options(self, shop_ids: Optional[Iterable[int]] = None) -> Dict[str, int]:
+        """{label: id} alfabetisch, voor st.selectbox/multiselect."""
+        wanted = None if shop_ids is None else set(shop_ids)
+        return {label: shop_id for label, shop_id in
+                sorted(((self._labels[i], i) for i in self._by_id if wanted is None or i in wanted),
+                       key=lambda x: x[0].casefold())}
+
+    def to_records(self) -> List[Dict[str, Any]]:
+        return list(self._by_id.values())
+
+    def compat(self, name: str) -> Dict[Any, Any]:
+        """De oude module-dicts (SHOP_NAME_MAP e.d.), eenmalig per registry opgebouwd; niet muteren."""
+        out = self._compat.get(name)
+        if out is None:
+            if name in ("SHOP_NAME_MAP", "SHOP_ID_TO_NAME"):
+                out = {i: self.label(i) for i in self.ids()}
+            elif name == "SHOP_NAME_TO_ID":
+                out = {self.label(i): i for i in self.ids()}
+            elif name == "SHOP_OPTIONS":
+                out = self.options()
+            else:
+                raise KeyError(name)
+            self._compat[name] = out
+        return out
+
+# ---- laden ----
+def _read_file(path: str) -> Optional[List[Dict[str, Any]]]:
+    if not path or not os.path.exists(path):
+        return None
+    try:
+        if path.endswith(".csv"):
+            with open(path, newline="", encoding="utf-8") as f:
+                return list(csv.DictReader(f))
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError) as e:
+        logger.warning("Shopbestand %s onleesbaar: %s", path, e)
+        return None
+    if isinstance(data, dict):
+        data = data.get("shops", [])
+    return data if isinstance(data, list) else None
+
+def _read_cache(path: str, max_age: Optional[float]) -> Optional[List[Dict[str, Any]]]:
+    try:
+        with open(path, encoding="utf-8") as f:
+            cached = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if max_age is not None and time.time() - float(cached.get("fetched_at", 0)) > max_age:
+        return None
+    return cached.get("shops")
+
+def _write_cache(path: str, shops: List[Dict[str, Any]]) -> None:
+    try:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp = f"{path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"fetched_at": time.time(), "shops": shops}, f)
+        os.replace(tmp, path)
+    except OSError as e:
+        logger.warning("Shopcache niet weggeschreven: %s", e)
+
+def fetch_company_shops(company: int, known: Optional[Dict[int, Dict[str, Any]]] = None) -> List[Dict[str, Any]]:
+    """
+    Shops van een company via de agent. Met SHOPS_URL: POST company=<id>, verwacht een
+    lijst (of {"shops": [...]}) met id/name/region. Zonder: ontdek de shop-ids uit een
+    report call op company (count_in over de laatste SHOP_DISCOVERY_DAYS dagen t/m
+    gisteren); namen/regio's komen dan uit `known`.
+    """
+    known = known or {}
+    if SHOPS_URL:
+        resp = _safe_post(SHOPS_URL, [("company", str(company))])
+        data = load_report_json(resp.content)
+        rows = data.get("shops", data.get("data", [])) if isinstance(data, dict) else data
+        shops = [s for s in (_clean(r) for r in rows or []) if s is not None]
+    else:
+        yesterday = date.today() - timedelta(days=1)
+        payload = fetch_report(data=[], data_output=["count_in"], company=company, period="date",
+                               date_from=(yesterday - timedelta(days=SHOP_DISCOVERY_DAYS - 1)).isoformat(),
+                               date_to=yesterday.isoformat())
+        ids = set()
+        for day in (payload.get("data") or {}).values():
+            if isinstance(day, dict):
+                ids.update(int(k) for k in day if str(k).isdigit())
+        shops = [{"id": i, "name": f"Shop {i}", "region": None, "company": company} for i in sorted(ids)]
+    for shop in shops:
+        base = known.get(shop["id"])
+        if base:
+            shop["name"] = shop["name"] if not shop["name"].startswith("Shop ") else base["name"]
+            shop["region"] = shop["region"] or base.get("region")
+        shop["company"] = shop["company"] if shop["company"] is not None else company
+    return shops
+
+def load_registry(refresh: bool = False) -> ShopRegistry:
+    """Bouw de registry uit de eerste beschikbare bron (zie module-docstring)."""
+    rows = _read_file(SHOP_REGISTRY_FILE)
+    if rows is not None:
+        return ShopRegistry(rows, source=SHOP_REGISTRY_FILE)
+    if not refresh:
+        cached = _read_cache(SHOP_REGISTRY_CACHE, SHOP_REGISTRY_TTL)
+        if cached:
+            return ShopRegistry(cached, source="cache")
+    if SHOP_COMPANY:
+        known = {s["id"]: s for s in (_clean(r) for r in DEFAULT_SHOPS) if s}
+        try:
+            shops = fetch_company_shops(int(SHOP_COMPANY), known)
+            if shops:
+                _write_cache(SHOP_REGISTRY_CACHE, shops)
+                return ShopRegistry(shops, source="agent")
+        except Exception as e:
+            logger.warning("Shops ophalen bij agent mislukt: %s", e)
+        stale = _read_cache(SHOP_REGISTRY_CACHE, None)
+        if stale:
+            return ShopRegistry(stale, source="cache (verlopen)")
+    return ShopRegistry(DEFAULT_SHOPS, source="default")
+
+_registry: Optional[ShopRegistry] = None
+_registry_lock = threading.Lock()
+
+def get_registry(refresh: bool = False) -> ShopRegistry:
+    """Procesbrede registry (lazy geladen; refresh=True herlaadt bij de bron)."""
+    global _registry
+    with _registry_lock:
+        if _registry is None or refresh:
+            _registry = load_registry(refresh=refresh)
+        return _registry
+
+# Handige afgeleiden (compatibel met de oude dicts), lazy via de registry. Eerst de naam
+# checken: de import machinery vraagt ook om o.a. __path__, dat mag de registry niet laden.
+_COMPAT_NAMES = ("SHOP_NAME_MAP", "SHOP_ID_TO_NAME", "SHOP_NAME_TO_ID", "SHOP_OPTIONS")
+
+def __getattr__(name: str):
+    if name not in _COMPAT_NAMES:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    return get_registry().compat(name)
@@ -1,6 +1,14 @@
 import streamlit as st
 
 def inject():
+    # Nieuwe trace per rerun voor het debug-paneel; optioneel metrics-endpoint.
+    # Alleen app_core: Home en pagina-skeletten laden zo geen pandas/requests.
+    from app_core import _get_secret, start_trace
+    start_trace()
+    port = _get_secret("METRICS_PORT", None)
+    if port:
+        from utils_pfmx import start_metrics_server
+        start_metrics_server(int(port))
     css = '''
     <style>
       .pfm-card { border-radius:16px; padding:16px; background:#F9F7FB; border:1px solid #EEE; }
@@ -22,3 +30,112 @@ def kpi(label, value, state="neutral"):
     </div>
     '''
     st.markdown(html, unsafe_allow_html=True)
+
+def freshness_notice():
+    """
+    Toon de "as of" tijd van de data in deze rerun. Bij stale data (stale-while-revalidate)
+    pollt een klein fragment tot de achtergrond-refresh klaar is en herlaadt dan de pagina.
+    """
+    from datetime import datetime
+    from utils_pfmx import data_freshness, refresh_pending
+    info = data_freshness()
+    if info["as_of"] is None:
+        return
+    as_of = datetime.fromtimestamp(info["as_of"])
+    if not info["stale"]:
+        st.caption(f"Data van {as_of:%d-%m %H:%M}")
+        return
+    keys = info["keys"]
+    if not refresh_pending(keys):
+        st.caption(f"Data van {as_of:%d-%m %H:%M} (verversen mislukt, probeert het later opnieuw)")
+        return
+    st.caption(f"Data van {as_of:%d-%m %H:%M} — nieuwere data wordt op de achtergrond opgehaald…")
+    fragment = getattr(st, "fragment", None) or getattr(st, "experimental_fragment")
+
+    @fragment(run_every=2)
+    def _wait_for_refresh():
+        if not refresh_pending(keys):
+            st.rerun()
+
+    _wait_for_refresh()
+
+# Kleine registry: standaard alles geselecteerd; groter: leeg beginnen (geen portfolio-brede
+# fetch bij de eerste load) en filteren op regio/company/zoekterm
+DEFAULT_SELECT_MAX = 12
+
+def select_stores(label="Select stores", key=None):
+    """
+    Store-multiselect uit de shop-registry, met regio- en companyfilter (als de registry
+    die kent) en prefix-zoeken. Bij meer dan DEFAULT_SELECT_MAX shops start de selectie leeg.
+    Geeft (labels, shop_ids) terug.
+    """
+    from shop_mapping import get_registry
+    reg = get_registry()
+    key = key or "stores"
+    candidates = None
+
+    def narrow(ids):
+        return set(ids) if candidates is None else candidates & set(ids)
+
+    regions, companies = reg.regions(), reg.companies()
+    if regions or companies:
+        fc = st.columns(2)
+        if regions:
+            with fc[0]:
+                chosen = st.multiselect("Regio", regions, default=[], key=f"{key}_regions")
+            if chosen:
+                candidates = narrow(reg.in_region(*chosen))
+        if companies:
+            with fc[1]:
+                chosen = st.multiselect("Company", companies, default=[], key=f"{key}_companies",
+                                        format_func=lambda c: f"Company {c}")
+            if chosen:
+                candidates = narrow(reg.in_company(*chosen))
+    if len(reg) > DEFAULT_SELECT_MAX:
+        prefix = st.text_input("Zoek store", value="", key=f"{key}_search").strip()
+        if prefix:
+            candidates = narrow(reg.search(prefix, limit=None))
+
+    # Al gekozen stores blijven kiesbaar als een filter/zoekterm ze buitensluit
+    selected_before = [reg.id_for(s) for s in st.session_state.get(key, [])]
+    visible = reg.options(None if candidates is None else candidates | {i for i in selected_before if i is not None})
+    labels = list(visible.keys())
+    default = labels if len(reg) <= DEFAULT_SELECT_MAX else []
+    if key in st.session_state:
+        selected = st.multiselect(label, labels, key=key)
+    else:
+        selected = st.multiselect(label, labels, default=default, key=key)
+    return selected, [visible[s] for s in selected]
+
+def debug_enabled():
+    """Debug-paneel is opt-in: ?debug=1 in de URL of PFM_DEBUG in secrets/env."""
+    from app_core import _get_secret
+    try:
+        if st.query_params.get("debug") in ("1", "true"):
+            return True
+    except Exception:
+        pass
+    return str(_get_secret("PFM_DEBUG", "") or "").lower() in ("1", "true")
+
+def debug_panel():
+    """Sidebar met de timing-breakdown van deze rerun (netwerk, decode, normalize, aggregatie, render)."""
+    if not debug_enabled():
+        return
+    import pandas as pd
+    from utils_pfmx import current_trace, http_stats, metrics_text, report_cache_stats
+    with st.sidebar.expander("⏱ Timings (deze rerun)", expanded=True):
+        trace = current_trace()
+        if trace:
+            df = pd.DataFrame(trace)
+            st.dataframe(df, use_container_width=True, hide_index=True)
+            totals = df.groupby("span")["ms"].sum().sort_values(ascending=False)
+            st.caption(" | ".join(f"{k}: {v:,.0f} ms" for k, v in totals.items()))
+        else:
+            st.caption("Geen spans in deze rerun.")
+        cache = report_cache_stats()
+        http = http_stats()
+        st.caption(
+            f"Cache: {cache['hits']} hits / {cache['misses']} misses, {cache['bytes']/1e6:.1f} MB | "
+            f"HTTP p50 {http['p50_s']*1000:.0f} ms, p95 {http['p95_s']*1000:.0f} ms, retries {http['retries']}"
+        )
+        st.code(metrics_text(), language="text")
@@ -1,17 +1,59 @@
-import os
-import logging
-from typing import List, Optional, Dict, Any, Tuple, Union
+import asyncio
+import json
+import random
+import threading
+import time
+import weakref
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar, copy_context
+from functools import partial
+from datetime import date, datetime, timedelta, timezone
+from email.utils import parsedate_to_datetime
+from typing import List, Optional, Dict, Any, Tuple, Union, Awaitable, AsyncIterator, Callable, Iterator
 import requests
+from requests.adapters import HTTPAdapter
+import numpy as np
 import pandas as pd
-from urllib.parse import urlsplit
+from urllib.parse import urlsplit, urlencode
 
-logger = logging.getLogger("pfm.utils")
-if not logger.handlers:
-    handler = logging.StreamHandler()
-    fmt = logging.Formatter("[%(levelname)s] %(asctime)s - %(message)s")
-    handler.setFormatter(fmt)
-    logger.addHandler(handler)
-logger.setLevel(logging.INFO)
+# httpx is optioneel; zonder httpx draaien de async varianten de sync calls in threads
+try:
+    import httpx
+    HAS_HTTPX = True
+except ImportError:
+    httpx = None
+    HAS_HTTPX = False
+
+# Snelle JSON decoders zijn optioneel (orjson > msgspec > stdlib json)
+try:
+    import orjson
+    _fast_loads: Optional[Callable[[bytes], Any]] = orjson.loads
+    JSON_DECODER = "orjson"
+except ImportError:
+    try:
+        import msgspec
+        _fast_loads = msgspec.json.decode
+        JSON_DECODER = "msgspec"
+    except ImportError:
+        _fast_loads = None
+        JSON_DECODER = "json"
+
+# Logger, secrets en instrumentatie wonen in de lichte app_core (ook gebruikt door Home/ui
+# zonder pandas te laden); hier her-exporteerd zodat bestaande imports blijven werken.
+from app_core import (  # noqa: F401
+    METRICS,
+    Metrics,
+    _FRESHNESS,
+    _TRACE,
+    _get_secret,
+    current_trace,
+    logger,
+    span,
+    start_trace,
+    timed,
+)
 
 # Helper: derive https://host/live-inside from API_URL secret
 def _derive_live_url_from_api() -> str:
@@ -23,13 +65,6 @@ def _derive_live_url_from_api() -> str:
     base = f"{p.scheme}://{p.netloc}".rstrip("/")
     return base + "/live-inside"
 
-def _get_secret(key: str, default: Optional[str] = None) -> Optional[str]:
-    try:
-        import streamlit as st
-        return st.secrets.get(key, default)  # type: ignore[attr-defined]
-    except Exception:
-        return os.getenv(key, default)
-
 API_URL = _get_secret("API_URL", "https://vemcount-agent.onrender.com/get-report")
 LIVE_URL = _get_secret("LIVE_URL", "")  # optional
 
@@ -47,17 +82,269 @@ def _flatten_params(params: Dict[str, Union[str, int, float, List, Tuple, None]]
             flat.append((k, str(v)))
     return flat
 
-def _safe_post(url: str, params_tuples: List[Tuple[str, str]], timeout: int = 30) -> requests.Response:
+# -------------------- Metrics export --------------------
+# Spans/tellers zelf staan in app_core; hier komen cache- en HTTP-statistieken erbij.
+
+def metrics_text() -> str:
+    """Prometheus/OpenMetrics tekstformaat van spans, tellers, cache en HTTP stats."""
+    spans, counters = METRICS.snapshot()
+    lines = [
+        "# TYPE pfm_span_seconds summary",
+    ]
+    for name, s in sorted(spans.items()):
+        lines.append(f'pfm_span_seconds_count{{span="{name}"}} {s["count"]}')
+        lines.append(f'pfm_span_seconds_sum{{span="{name}"}} {s["sum"]:.6f}')
+    lines.append("# TYPE pfm_span_seconds_max gauge")
+    for name, s in sorted(spans.items()):
+        lines.append(f'pfm_span_seconds_max{{span="{name}"}} {s["max"]:.6f}')
+    for counter in sorted({c for c, _ in counters}):
+        lines.append(f"# TYPE pfm_{counter[:-len('_total')]} counter")
+        for (c, name), value in sorted(counters.items()):
+            if c == counter:
+                lines.append(f'pfm_{c}{{span="{name}"}} {value:g}')
+    cache = report_cache_stats()
+    lines.append("# TYPE pfm_report_cache_bytes gauge")
+    lines.append(f"pfm_report_cache_bytes {cache['bytes']}")
+    lines.append("# TYPE pfm_report_cache_entries gauge")
+    lines.append(f"pfm_report_cache_entries {cache['entries']}")
+    http = http_stats()
+    lines.append("# TYPE pfm_http_retries counter")
+    lines.append(f"pfm_http_retries_total {http['retries']}")
+    lines.append("# TYPE pfm_http_failures counter")
+    lines.append(f"pfm_http_failures_total {http['failures']}")
+    sf = single_flight_stats()
+    lines.append("# TYPE pfm_single_flight_coalesced counter")
+    lines.append(f"pfm_single_flight_coalesced_total {sf['coalesced']}")
+    lines.append("# EOF")
+    return "\n".join(lines) + "\n"
+
+_metrics_server: Optional[Any] = None
+_metrics_server_lock = threading.Lock()
+_metrics_server_failed = False
+
+def start_metrics_server(port: int, host: str = "0.0.0.0") -> None:
+    """Optioneel: serveer metrics_text() op http://host:port/metrics (idempotent, thread-safe)."""
+    global _metrics_server, _metrics_server_failed
+    if _metrics_server is not None or _metrics_server_failed:
+        return
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = metrics_text().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/openmetrics-text; version=1.0.0; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    # Gelijktijdige sessies roepen dit tegelijk aan (inject()); maar één mag binden
+    with _metrics_server_lock:
+        if _metrics_server is not None or _metrics_server_failed:
+            return
+        try:
+            server = ThreadingHTTPServer((host, port), Handler)
+        except OSError as e:
+            # Poort bezet (bv. ander proces): metrics zijn optioneel, de pagina mag niet falen
+            _metrics_server_failed = True
+            logger.warning("Metrics-server op poort %d niet gestart: %s", port, e)
+            return
+        _metrics_server = server
+    threading.Thread(target=server.serve_forever, name="pfm-metrics", daemon=True).start()
+    logger.info("Metrics op http://%s:%d/metrics", host, port)
+
+# -------------------- HTTP session --------------------
+# Eén gedeelde keep-alive sessie per proces: scheelt per call een TCP+TLS
+# handshake naar de render.com host. Alle endpoints zijn read-only POSTs,
+# dus opnieuw proberen bij transiënte fouten is veilig. Een read timeout wordt niet
+# herhaald (dan zou één hangende call de rerun nog eens de volle read timeout kosten),
+# Retry-After wordt gevolgd (begrensd) en alle pogingen samen vallen binnen een deadline.
+
+HTTP_POOL_SIZE = int(_get_secret("HTTP_POOL_SIZE", "20"))
+HTTP_MAX_RETRIES = int(_get_secret("HTTP_MAX_RETRIES", "3"))
+HTTP_BACKOFF_BASE = float(_get_secret("HTTP_BACKOFF_BASE", "0.5"))
+HTTP_BACKOFF_MAX = 8.0
+HTTP_RETRY_AFTER_MAX = float(_get_secret("HTTP_RETRY_AFTER_MAX", "15"))
+HTTP_RETRY_DEADLINE = float(_get_secret("HTTP_RETRY_DEADLINE", "40"))
+RETRY_STATUS = {429, 502, 503, 504}
+
+# (connect, read) timeouts per endpoint-pad; report calls mogen lang lezen
+ENDPOINT_TIMEOUTS: Dict[str, Tuple[float, float]] = {
+    "/get-report": (5.0, 30.0),
+    "/live-inside": (5.0, 10.0),
+}
+DEFAULT_TIMEOUT: Tuple[float, float] = (5.0, 30.0)
+
+# Max gelijktijdige requests per endpoint vanuit dit proces (bescherming tegen onze eigen burst)
+ENDPOINT_CONCURRENCY: Dict[str, int] = {
+    "/get-report": int(_get_secret("REPORT_CONCURRENCY", "6")),
+    "/live-inside": int(_get_secret("LIVE_CONCURRENCY", "2")),
+}
+DEFAULT_CONCURRENCY = 6
+_endpoint_sems: Dict[str, threading.BoundedSemaphore] = {}
+_endpoint_sems_lock = threading.Lock()
+
+def _endpoint_semaphore(url: str) -> threading.BoundedSemaphore:
+    path = urlsplit(url).path.rstrip("/")
+    with _endpoint_sems_lock:
+        sem = _endpoint_sems.get(path)
+        if sem is None:
+            sem = _endpoint_sems[path] = threading.BoundedSemaphore(ENDPOINT_CONCURRENCY.get(path, DEFAULT_CONCURRENCY))
+        return sem
+
+_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
+
+def _get_session() -> requests.Session:
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                s = requests.Session()
+                adapter = HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE, max_retries=0)
+                s.mount("https://", adapter)
+                s.mount("http://", adapter)
+                s.headers.update({
+                    "Content-Type": "application/x-www-form-urlencoded",
+                    "Accept-Encoding": "gzip, deflate",
+                    "Connection": "keep-alive",
+                })
+                _session = s
+    return _session
+
+def reset_http_session() -> None:
+    """Sluit de gedeelde sessie; de volgende call bouwt een nieuwe pool op."""
+    global _session
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+        _session = None
+
+def _timeout_for(url: str) -> Tuple[float, float]:
+    path = urlsplit(url).path.rstrip("/")
+    return ENDPOINT_TIMEOUTS.get(path, DEFAULT_TIMEOUT)
+
+def _backoff(attempt: int) -> float:
+    # Exponentieel met full jitter, zodat parallelle sessies niet synchroon herhalen
+    return random.uniform(0, min(HTTP_BACKOFF_MAX, HTTP_BACKOFF_BASE * (2 ** attempt)))
+
+def _retry_after(headers: Any) -> Optional[float]:
+    """Retry-After (seconden of HTTP-datum) als wachttijd, begrensd op HTTP_RETRY_AFTER_MAX."""
+    value = (headers or {}).get("Retry-After")
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        seconds = float(value)
+    except ValueError:
+        try:
+            seconds = (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds()
+        except (TypeError, ValueError):
+            return None
+    return min(max(seconds, 0.0), HTTP_RETRY_AFTER_MAX)
+
+def _retry_wait(attempt: int, headers: Any = None) -> float:
+    retry_after = _retry_after(headers)
+    return _backoff(attempt) if retry_after is None else retry_after
+
+def _past_deadline(start: float, wait: float) -> bool:
+    # Geen nieuwe poging als de wachttijd de totale retry-deadline overschrijdt
+    return time.perf_counter() - start + wait > HTTP_RETRY_DEADLINE
+
+class HttpStats:
+    """Latency/retry tellers van _safe_post (laatste 500 latencies voor percentielen)."""
+
+    def __init__(self, window: int = 500):
+        self._lock = threading.Lock()
+        self._latencies: "deque[float]" = deque(maxlen=window)
+        self.requests = 0
+        self.retries = 0
+        self.failures = 0
+
+    def record(self, latency: float, retries: int, ok: bool) -> None:
+        with self._lock:
+            self.requests += 1
+            self.retries += retries
+            if ok:
+                self._latencies.append(latency)
+            else:
+                self.failures += 1
+
+    def snapshot(self) -> Dict[str, float]:
+        with self._lock:
+            lat = sorted(self._latencies)
+            def pct(q: float) -> float:
+                return lat[min(len(lat) - 1, int(q * len(lat)))] if lat else 0.0
+            return {
+                "requests": self.requests,
+                "retries": self.retries,
+                "failures": self.failures,
+                "p50_s": pct(0.50),
+                "p95_s": pct(0.95),
+                "max_s": lat[-1] if lat else 0.0,
+            }
+
+HTTP_STATS = HttpStats()
+
+def http_stats() -> Dict[str, float]:
+    return HTTP_STATS.snapshot()
+
+def _safe_post(
+    url: str,
+    params_tuples: List[Tuple[str, str]],
+    timeout: Optional[Union[float, Tuple[float, float]]] = None,
+    max_retries: Optional[int] = None,
+) -> requests.Response:
     logger.info("POST %s", url)
     preview = "&".join([f"{k}={v}" for k, v in params_tuples[:12]])
     if len(params_tuples) > 12:
         preview += f"&...({len(params_tuples)-12} more)"
     logger.info("Body: %s", preview)
-    headers = {"Content-Type": "application/x-www-form-urlencoded"}
-    resp = requests.post(url, data=params_tuples, headers=headers, timeout=timeout)
+    with span("http.post", endpoint=urlsplit(url).path) as rec:
+        resp = _safe_post_inner(url, params_tuples, timeout, max_retries, rec)
+        rec["status"] = resp.status_code
+        rec["bytes"] = len(resp.content)
+    return resp
+
+def _safe_post_inner(
+    url: str,
+    params_tuples: List[Tuple[str, str]],
+    timeout: Optional[Union[float, Tuple[float, float]]],
+    max_retries: Optional[int],
+    rec: Dict[str, Any],
+) -> requests.Response:
+    timeout = timeout if timeout is not None else _timeout_for(url)
+    retries = HTTP_MAX_RETRIES if max_retries is None else max_retries
+    session = _get_session()
+    start = time.perf_counter()
+    attempt = 0
+    while True:
+        try:
+            with _endpoint_semaphore(url):
+                resp = session.post(url, data=params_tuples, timeout=timeout)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            wait = _retry_wait(attempt)
+            if attempt >= retries or isinstance(e, requests.ReadTimeout) or _past_deadline(start, wait):
+                HTTP_STATS.record(time.perf_counter() - start, attempt, ok=False)
+                raise
+            logger.warning("POST %s mislukt (%s); retry %d/%d over %.2fs", url, e.__class__.__name__, attempt + 1, retries, wait)
+        else:
+            if resp.status_code not in RETRY_STATUS or attempt >= retries:
+                break
+            wait = _retry_wait(attempt, resp.headers)
+            if _past_deadline(start, wait):
+                break
+            logger.warning("HTTP %s van %s; retry %d/%d over %.2fs", resp.status_code, url, attempt + 1, retries, wait)
+        attempt += 1
+        rec["retries"] = attempt
+        time.sleep(wait)
     try:
         resp.raise_for_status()
     except requests.HTTPError as e:
+        HTTP_STATS.record(time.perf_counter() - start, attempt, ok=False)
         detail = None
         try:
             detail = resp.json()
@@ -65,21 +352,625 @@ def _safe_post(url: str, params_tuples: List[Tuple[str, str]], timeout: int = 30
             detail = resp.text[:800]
         logger.error("HTTP %s: %s | Detail: %s", resp.status_code, e, detail)
         raise
+    HTTP_STATS.record(time.perf_counter() - start, attempt, ok=True)
     return resp
 
-def fetch_report(
+# -------------------- Report cache --------------------
+# Procesbrede cache onder fetch_report/fetch_report_hourly. Streamlit draait alle
+# sessies in één proces, dus identieke calls (zelfde shops/periode/outputs) van
+# verschillende gebruikers of reruns raken de agent maar één keer per TTL.
+
+# TTL in seconden per periode; afgesloten periodes veranderen niet meer.
+PERIOD_TTL: Dict[str, int] = {
+    "today": 60,
+    "this_week": 300,
+    "this_month": 900,
+    "this_quarter": 1800,
+    "this_year": 3600,
+    "yesterday": 6 * 3600,
+    "last_week": 12 * 3600,
+    "last_month": 24 * 3600,
+    "last_quarter": 24 * 3600,
+    "last_year": 24 * 3600,
+}
+DEFAULT_TTL = 300
+# Tellers en omzet van dag D komen vaak nog na middernacht binnen: een vaste range die
+# binnen deze marge eindigt is nog niet afgesloten (ook de marge van de Parquet-store)
+LATE_DATA_GRACE_DAYS = int(_get_secret("STORE_GRACE_DAYS", "2"))
+
+def _seconds_to_midnight() -> int:
+    now = datetime.now()
+    midnight = datetime.combine(now.date() + timedelta(days=1), datetime.min.time())
+    return max(1, int((midnight - now).total_seconds()))
+
+def _ttl_for_period(period: Optional[str], date_to: Optional[str] = None) -> int:
+    if period == "date":
+        # Vaste range van vóór de late-data marge is afgesloten. Eindigt hij binnen de marge
+        # (bv. gisteren), dan als 'yesterday'; loopt hij t/m vandaag, dan als 'today'.
+        today = date.today()
+        try:
+            end = date.fromisoformat(date_to) if date_to is not None else today
+        except ValueError:
+            end = today
+        if end < today - timedelta(days=LATE_DATA_GRACE_DAYS):
+            return PERIOD_TTL["last_month"]
+        return min(PERIOD_TTL["yesterday" if end < today else "today"], _seconds_to_midnight())
+    # Benoemde periodes schuiven om middernacht (yesterday, last_month op de 1e, ...):
+    # nooit langer cachen dan tot de eerstvolgende dag-grens
+    return min(PERIOD_TTL.get(period or "", DEFAULT_TTL), _seconds_to_midnight())
+
+def _cache_key(url: str, params_tuples: List[Tuple[str, str]]) -> Tuple[str, Tuple[Tuple[str, str], ...]]:
+    # Canoniek: volgorde van keys/waarden maakt voor de agent niet uit.
+    # Benoemde periodes krijgen het opgeloste venster in de key: 'last_month' van vandaag
+    # is een andere payload dan 'last_month' van gisteren.
+    params = sorted(params_tuples)
+    period = next((v for k, v in params if k == "period"), None)
+    if period is not None and period != "date":
+        try:
+            start, end = expand_period(period)
+            params.append(("_window", f"{start.isoformat()}..{end.isoformat()}"))
+        except ValueError:
+            params.append(("_day", date.today().isoformat()))
+    return (url, tuple(params))
+
+class ReportCache:
+    """
+    Thread-safe TTL + LRU cache voor geparste report payloads.
+    - grootte begrensd in bytes (gemeten op de response body)
+    - verlopen entries blijven tot stale_max_age bewaard voor stale-while-revalidate
+    - hit/miss/eviction tellers via stats()
+    """
+
+    def __init__(self, max_bytes: int = 256 * 1024 * 1024, stale_max_age: int = 24 * 3600):
+        self.max_bytes = max_bytes
+        self.stale_max_age = stale_max_age
+        self._lock = threading.Lock()
+        # key -> (expires_at (monotonic), size, payload, stored_at (epoch))
+        self._entries: "OrderedDict[Any, Tuple[float, int, Dict[str, Any], float]]" = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def lookup(self, key: Any) -> Optional[Tuple[Dict[str, Any], float, bool]]:
+        """(payload, stored_at, fresh) of None; telt als hit alleen als de entry vers is."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, size, payload, stored_at = entry
+            now = time.monotonic()
+            if expires_at < now:
+                self.misses += 1
+                if expires_at + self.stale_max_age < now:
+                    del self._entries[key]
+                    self._bytes -= size
+                    return None
+                return payload, stored_at, False
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return payload, stored_at, True
+
+    def get(self, key: Any) -> Optional[Dict[str, Any]]:
+        found = self.lookup(key)
+        return found[0] if found is not None and found[2] else None
+
+    def peek(self, key: Any) -> Optional[Dict[str, Any]]:
+        """Als get(), maar zonder hit/miss tellers of LRU-update."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                return None
+            return entry[2]
+
+    def stored_at(self, key: Any, payload: Dict[str, Any]) -> Optional[float]:
+        """stored_at van de entry als die (nog) precies deze payload bevat, anders None."""
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry[3] if entry is not None and entry[2] is payload else None
+
+    def put(self, key: Any, payload: Dict[str, Any], size: int, ttl: int) -> None:
+        if ttl <= 0 or size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._entries[key] = (time.monotonic() + ttl, size, payload, time.time())
+            self._bytes += size
+            while self._bytes > self.max_bytes and self._entries:
+                _, old_entry = self._entries.popitem(last=False)
+                self._bytes -= old_entry[1]
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+REPORT_CACHE = ReportCache(max_bytes=int(_get_secret("REPORT_CACHE_MAX_BYTES", str(256 * 1024 * 1024))))
+
+def load_report_json(raw: bytes) -> Any:
+    """Decodeer een JSON body met de snelste beschikbare decoder (stdlib als fallback)."""
+    if _fast_loads is not None:
+        try:
+            return _fast_loads(raw)
+        except Exception:
+            pass  # bv. niet-UTF-8 body: stdlib pad hieronder
+    return json.loads(raw)
+
+# -------------------- Single-flight --------------------
+# Gelijktijdige identieke calls (zelfde canonieke key) wachten op één request in
+# vlucht en delen het geparste resultaat, i.p.v. allemaal naar de agent te gaan.
+
+class _Call:
+    __slots__ = ("event", "result", "error", "waiters")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+        self.waiters = 0
+
+class SingleFlight:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[Any, _Call] = {}
+        self.leaders = 0
+        self.coalesced = 0
+
+    def _join(self, key: Any) -> Tuple[_Call, bool]:
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                self.coalesced += 1
+                return call, False
+            call = self._calls[key] = _Call()
+            self.leaders += 1
+            return call, True
+
+    def _finish(self, key: Any, call: _Call) -> None:
+        with self._lock:
+            self._calls.pop(key, None)
+        call.event.set()
+
+    @staticmethod
+    def _shared(call: _Call) -> Any:
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    def do(self, key: Any, fn: Callable[[], Any]) -> Any:
+        call, leader = self._join(key)
+        if not leader:
+            call.event.wait()
+            return self._shared(call)
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            self._finish(key, call)
+        return call.result
+
+    async def ado(self, key: Any, fn: Callable[[], Awaitable[Any]]) -> Any:
+        call, leader = self._join(key)
+        if not leader:
+            await asyncio.to_thread(call.event.wait)
+            return self._shared(call)
+        try:
+            call.result = await fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            self._finish(key, call)
+        return call.result
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"leaders": self.leaders, "coalesced": self.coalesced, "in_flight": len(self._calls)}
+
+SINGLE_FLIGHT = SingleFlight()
+
+def single_flight_stats() -> Dict[str, int]:
+    return SINGLE_FLIGHT.stats()
+
+def _decode_json(resp: Any) -> Any:
+    raw = resp.content
+    with span("json.decode", bytes=len(raw), decoder=JSON_DECODER):
+        try:
+            return load_report_json(raw)
+        except ValueError:
+            return resp.json()  # laat requests/httpx de encoding bepalen
+
+def _post_report(
+    url: str,
+    params_tuples: List[Tuple[str, str]],
+    ttl: int,
+    use_cache: bool = True,
+    stale_while_revalidate: bool = False,
+) -> Dict[str, Any]:
+    """
+    POST naar de report-endpoint met cache ervoor. De gecachte payload wordt
+    gedeeld tussen callers: behandel hem als read-only.
+    Met stale_while_revalidate krijgt de caller bij een verlopen entry direct de
+    oude payload terug en wordt op de achtergrond ververst.
+    """
+    key = _cache_key(url, params_tuples)
+    if use_cache:
+        with span("cache.lookup") as rec:
+            found = REPORT_CACHE.lookup(key)
+            rec["hit"] = found is not None and found[2]
+        if found is not None:
+            payload, stored_at, fresh = found
+            if fresh:
+                logger.info("Cache hit: %s", url)
+                _note_freshness(key, stored_at, stale=False)
+                return payload
+            if stale_while_revalidate:
+                logger.info("Stale cache hit, verversen op achtergrond: %s", url)
+                _schedule_refresh(key, url, params_tuples, ttl)
+                _note_freshness(key, stored_at, stale=True)
+                return payload
+
+    # use_cache hoort in de flight-key: een use_cache=False caller mag niet meeliften op
+    # een call die (via de cache-peek) een oudere payload kan teruggeven
+    payload = SINGLE_FLIGHT.do((key, use_cache), partial(_load_report, key, url, params_tuples, ttl, use_cache))
+    # stored_at van de cache-entry (als die er is), zodat served_version() bij de volgende
+    # rerun (cache hit) dezelfde versie geeft
+    _note_freshness(key, REPORT_CACHE.stored_at(key, payload) or time.time(), stale=False)
+    return payload
+
+def _load_report(key: Any, url: str, params_tuples: List[Tuple[str, str]], ttl: int, use_cache: bool, force: bool = False) -> Dict[str, Any]:
+    # Tweede cache-check: een vorige leader kan net klaar zijn
+    if use_cache and not force:
+        cached = REPORT_CACHE.peek(key)
+        if cached is not None:
+            return cached
+    resp = _safe_post(url, params_tuples)
+    payload = _decode_json(resp)
+    if use_cache:
+        REPORT_CACHE.put(key, payload, size=len(resp.content), ttl=ttl)
+    return payload
+
+# -------------------- Stale-while-revalidate --------------------
+SWR_RETRY_AFTER = 60  # s; na een mislukte refresh niet meteen opnieuw proberen
+
+_REFRESH_POOL = ThreadPoolExecutor(max_workers=2, thread_name_prefix="pfm-swr")
+_refreshing: Dict[Any, float] = {}
+_refresh_failed: Dict[Any, float] = {}
+_refresh_lock = threading.Lock()
+
+def _schedule_refresh(key: Any, url: str, params_tuples: List[Tuple[str, str]], ttl: int) -> None:
+    now = time.monotonic()
+    with _refresh_lock:
+        if key in _refreshing or now - _refresh_failed.get(key, -SWR_RETRY_AFTER) < SWR_RETRY_AFTER:
+            return
+        _refreshing[key] = now
+
+    def _run() -> None:
+        try:
+            SINGLE_FLIGHT.do((key, True), partial(_load_report, key, url, params_tuples, ttl, True, True))
+            with _refresh_lock:
+                _refresh_failed.pop(key, None)
+        except Exception as e:
+            logger.warning("Achtergrond-refresh mislukt: %s", e)
+            with _refresh_lock:
+                _refresh_failed[key] = time.monotonic()
+        finally:
+            with _refresh_lock:
+                _refreshing.pop(key, None)
+
+    _REFRESH_POOL.submit(_run)
+
+def _note_freshness(key: Any, stored_at: float, stale: bool) -> None:
+    notes = _FRESHNESS.get()
+    if notes is not None:
+        notes.append((key, stored_at, stale))
+
+def data_freshness() -> Dict[str, Any]:
+    """
+    Versheid van alle report payloads die in deze rerun zijn geserveerd:
+    as_of = oudste stored_at (epoch), stale = of er verlopen data tussen zat,
+    keys = cache keys die op de achtergrond ververst worden (voor refresh_pending).
+    """
+    notes = _FRESHNESS.get() or []
+    if not notes:
+        return {"as_of": None, "stale": False, "keys": []}
+    return {
+        "as_of": min(n[1] for n in notes),
+        "stale": any(n[2] for n in notes),
+        "keys": [n[0] for n in notes if n[2]],
+    }
+
+def served_version() -> Optional[Tuple[Tuple[Any, float], ...]]:
+    """
+    Versie van de report payloads die in deze rerun tot nu toe zijn geserveerd
+    ((cache key, stored_at) per payload), als memo-key voor frames die daaruit zijn
+    afgeleid (kpi_rollups.shop_kpis). None buiten een trace of zonder payloads.
+    """
+    notes = _FRESHNESS.get()
+    if not notes:
+        return None
+    return tuple((n[0], n[1]) for n in notes)
+
+def refresh_pending(keys: List[Any]) -> bool:
+    with _refresh_lock:
+        return any(k in _refreshing for k in keys)
+
+def report_cache_stats() -> Dict[str, int]:
+    return REPORT_CACHE.stats()
+
+def clear_report_cache() -> None:
+    REPORT_CACHE.clear()
+
+# -------------------- Periodes & fan-out --------------------
+FANOUT_MAX_WORKERS = int(_get_secret("FANOUT_MAX_WORKERS", "4"))
+
+def expand_period(period: str, today: Optional[date] = None) -> Tuple[date, date]:
+    """
+    Zet een benoemde periode om naar een expliciete (date_from, date_to), inclusief.
+    Weken starten op maandag; lopende periodes eindigen vandaag.
+    """
+    today = today or date.today()
+    if period == "today":
+        return today, today
+    if period == "yesterday":
+        d = today - timedelta(days=1)
+        return d, d
+    if period in ("this_week", "last_week"):
+        start = today - timedelta(days=today.weekday())
+        if period == "this_week":
+            return start, today
+        return start - timedelta(days=7), start - timedelta(days=1)
+    if period in ("this_month", "last_month"):
+        start = today.replace(day=1)
+        if period == "this_month":
+            return start, today
+        prev_end = start - timedelta(days=1)
+        return prev_end.replace(day=1), prev_end
+    if period in ("this_quarter", "last_quarter"):
+        start = date(today.year, 3 * ((today.month - 1) // 3) + 1, 1)
+        if period == "this_quarter":
+            return start, today
+        prev_end = start - timedelta(days=1)
+        return date(prev_end.year, 3 * ((prev_end.month - 1) // 3) + 1, 1), prev_end
+    if period == "this_year":
+        return date(today.year, 1, 1), today
+    if period == "last_year":
+        return date(today.year - 1, 1, 1), date(today.year - 1, 12, 31)
+    raise ValueError(f"Onbekende periode: {period!r}")
+
+def _date_windows(start: date, end: date, window_days: int) -> List[Tuple[date, date]]:
+    windows = []
+    cur = start
+    while cur <= end:
+        stop = min(end, cur + timedelta(days=window_days - 1))
+        windows.append((cur, stop))
+        cur = stop + timedelta(days=1)
+    return windows
+
+def _split_report_params(
+    base_params: Dict[str, Any],
+    shop_batch_size: Optional[int],
+    window_days: Optional[int],
+) -> List[Dict[str, Any]]:
+    shop_ids = list(base_params.get("data") or [])
+    if shop_batch_size and len(shop_ids) > shop_batch_size:
+        batches = [shop_ids[i:i + shop_batch_size] for i in range(0, len(shop_ids), shop_batch_size)]
+    else:
+        batches = [shop_ids]
+
+    windows: List[Optional[Tuple[date, date]]] = [None]
+    if window_days:
+        period = base_params.get("period")
+        if period == "date":
+            span = (date.fromisoformat(str(base_params["date_from"])), date.fromisoformat(str(base_params["date_to"])))
+        else:
+            try:
+                span = expand_period(str(period))
+            except ValueError:
+                span = None  # onbekende periode: niet in tijd splitsen
+        if span is not None and (span[1] - span[0]).days + 1 > window_days:
+            windows = list(_date_windows(span[0], span[1], window_days))
+
+    chunks = []
+    for batch in batches:
+        for window in windows:
+            p = dict(base_params)
+            if batch:
+                p["data"] = batch
+            if window is not None:
+                p["period"] = "date"
+                p["date_from"] = window[0].isoformat()
+                p["date_to"] = window[1].isoformat()
+            chunks.append(p)
+    return chunks
+
+def merge_report_payloads(payloads: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Voeg deelpayloads samen tot één payload met dezelfde data[date][shop_id] vorm.
+    Inputs worden niet gemuteerd (ze kunnen uit de cache komen).
+    """
+    def _merge(a: Dict[str, Any], b: Dict[str, Any]) -> Dict[str, Any]:
+        out = dict(a)
+        for k, v in b.items():
+            cur = out.get(k)
+            out[k] = _merge(cur, v) if isinstance(cur, dict) and isinstance(v, dict) else v
+        return out
+
+    merged: Dict[str, Any] = {}
+    for p in payloads:
+        if isinstance(p, dict):
+            merged = _merge(merged, p)
+    return merged
+
+def _fetch_report_params(
+    base_params: Dict[str, Any],
+    *,
+    use_cache: bool,
+    shop_batch_size: Optional[int] = None,
+    window_days: Optional[int] = None,
+    max_workers: Optional[int] = None,
+    stale_while_revalidate: bool = False,
+) -> Dict[str, Any]:
+    chunks = _split_report_params(base_params, shop_batch_size, window_days)
+
+    def _one(p: Dict[str, Any]) -> Dict[str, Any]:
+        ttl = _ttl_for_period(p.get("period"), p.get("date_to"))
+        return _post_report(API_URL, _flatten_params(p), ttl=ttl, use_cache=use_cache,
+                            stale_while_revalidate=stale_while_revalidate)
+
+    if len(chunks) == 1:
+        return _one(chunks[0])
+    workers = max(1, min(max_workers or FANOUT_MAX_WORKERS, len(chunks)))
+    logger.info("Fan-out: %d deelcalls, %d parallel", len(chunks), workers)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        # Context meegeven zodat spans van de workers in de trace van deze rerun landen
+        futures = [pool.submit(copy_context().run, _one, p) for p in chunks]
+        payloads = [f.result() for f in futures]
+    return merge_report_payloads(payloads)
+
+# -------------------- Incrementele refresh (lopende periodes) --------------------
+# Voor periodes die t/m vandaag lopen (today, this_week, ...) houden we de samengevoegde
+# payload in het geheugen, met per shop de laatste timestamp die we hebben. Een refresh
+# vraagt alleen de dagen vanaf het laatste (mogelijk onvolledige) uur/dag van de shops op
+# en merget die delta erin. De agent filtert op datum, dus de delta is minimaal één dag:
+# een constante payload per refresh i.p.v. een die met de periode meegroeit.
+INCREMENTAL_MAX_LAG_DAYS = int(_get_secret("INCREMENTAL_MAX_LAG_DAYS", "1"))  # shops die langer stil zijn tellen niet mee
+INCREMENTAL_MAX_KEYS = 32
+
+class _IncrementalState:
+    __slots__ = ("payload", "high_water", "refreshes", "as_of")
+
+    def __init__(self, payload: Dict[str, Any], high_water: Dict[str, str], as_of: date):
+        self.payload = payload
+        self.high_water = high_water
+        self.refreshes = 0
+        self.as_of = as_of  # 'today' van de laatste (delta-)fetch; die dag kan onvolledig zijn
+
+_INCREMENTAL: "OrderedDict[Tuple, _IncrementalState]" = OrderedDict()
+_incremental_lock = threading.Lock()
+
+def _shop_high_water(payload: Dict[str, Any], period_step: str) -> Dict[str, str]:
+    """Per shop de hoogste timestamp ('YYYY-MM-DD' of 'YYYY-MM-DD HH:MM') in de payload."""
+    data_block = payload.get("data") if isinstance(payload, dict) else None
+    hw: Dict[str, str] = {}
+    if not isinstance(data_block, dict):
+        return hw
+    if period_step == "hour":
+        groups = _iter_hourly_groups(data_block)
+    else:
+        groups = ((str(d), level) for d, level in data_block.items() if isinstance(level, dict))
+    for ts, shops in groups:
+        for shop in shops:
+            shop = str(shop)
+            if ts > hw.get(shop, ""):
+                hw[shop] = ts
+    return hw
+
+def _delta_start(state: _IncrementalState, shop_ids: List[str], start: date, today: date) -> date:
+    # Vanaf de dag van de oudste "laatste timestamp" over de actieve shops (dat uur/die dag
+    # kan onvolledig zijn), maar nooit later dan de vorige fetch: alles daarna ontbreekt nog,
+    # ook als de state dagen oud is. Shops die al INCREMENTAL_MAX_LAG_DAYS vóór de vorige
+    # fetch stil waren tellen niet mee, zodat een dichte shop het venster niet terugtrekt.
+    active_from = state.as_of - timedelta(days=INCREMENTAL_MAX_LAG_DAYS)
+    marks = [date.fromisoformat(state.high_water[s][:10]) for s in (shop_ids or state.high_water)
+             if s in state.high_water]
+    marks = [d for d in marks if d >= active_from]
+    delta_from = min([state.as_of, *marks])
+    return min(today, max(start, delta_from))
+
+def _fetch_incremental(
+    base_params: Dict[str, Any],
+    *,
+    use_cache: bool,
+    shop_batch_size: Optional[int] = None,
+    max_workers: Optional[int] = None,
+    stale_while_revalidate: bool = False,
+    today: Optional[date] = None,
+) -> Dict[str, Any]:
+    today = today or date.today()
+    period = str(base_params.get("period"))
+    try:
+        if period == "date":
+            start, end = date.fromisoformat(str(base_params["date_from"])), date.fromisoformat(str(base_params["date_to"]))
+        else:
+            start, end = expand_period(period, today)
+    except (KeyError, ValueError):
+        start = end = None
+    fetch = partial(_fetch_report_params, use_cache=use_cache, shop_batch_size=shop_batch_size,
+                    max_workers=max_workers, stale_while_revalidate=stale_while_revalidate)
+    if start is None or end < today:
+        return fetch(base_params)  # afgesloten (of onbekende) periode: gewone cache volstaat
+
+    step = str(base_params.get("period_step") or "day")
+    # Sleutel bevat de start van de periode: om middernacht / op maandag begint een nieuwe state
+    key = (_cache_key(API_URL, _flatten_params(base_params)), start.isoformat())
+    with _incremental_lock:
+        state = _INCREMENTAL.get(key)
+        if state is not None:
+            _INCREMENTAL.move_to_end(key)
+
+    with span("report.incremental") as rec:
+        if state is None:
+            payload = fetch(base_params)
+            state = _IncrementalState(payload, _shop_high_water(payload, step), today)
+            rec["delta_days"] = (today - start).days + 1
+        else:
+            shops = [str(s) for s in base_params.get("data") or []]
+            delta_from = _delta_start(state, shops, start, today)
+            delta = fetch(dict(base_params, period="date", date_from=delta_from.isoformat(), date_to=today.isoformat()))
+            # Alleen data mergen; meta (period, ...) van de oorspronkelijke call blijft staan
+            payload = merge_report_payloads([state.payload, {"data": delta.get("data") or {}}])
+            high_water = dict(state.high_water)
+            for shop, ts in _shop_high_water(delta, step).items():
+                if ts > high_water.get(shop, ""):
+                    high_water[shop] = ts
+            refreshes = state.refreshes + 1
+            state = _IncrementalState(payload, high_water, today)
+            state.refreshes = refreshes
+            rec["delta_days"] = (today - delta_from).days + 1
+        rec["refreshes"] = state.refreshes
+    with _incremental_lock:
+        _INCREMENTAL[key] = state
+        _INCREMENTAL.move_to_end(key)
+        while len(_INCREMENTAL) > INCREMENTAL_MAX_KEYS:
+            _INCREMENTAL.popitem(last=False)
+    return state.payload
+
+def clear_incremental_state() -> None:
+    with _incremental_lock:
+        _INCREMENTAL.clear()
+
+def _build_report_params(
     *,
     data: List[int],
     data_output: List[str],
-    source: str = "shops",
-    period: str = "this_month",
-    period_step: str = "day",
-    company: Optional[int] = None,
-    date_from: Optional[str] = None,
-    date_to: Optional[str] = None,
-    group_by: Optional[str] = None,
-    extra: Optional[Dict[str, Union[str, int, float]]] = None
-) -> Dict[str, Any]:
+    source: str,
+    period: str,
+    period_step: str,
+    company: Optional[int],
+    date_from: Optional[str],
+    date_to: Optional[str],
+    group_by: Optional[str],
+    extra: Optional[Dict[str, Union[str, int, float]]],
+) -> Dict[str, Union[str, int, float, List, None]]:
     if not API_URL:
         raise RuntimeError("API_URL ontbreekt (zet in .streamlit/secrets.toml).")
     if data and company:
@@ -102,9 +993,70 @@ def fetch_report(
         base_params["group_by"] = group_by
     if extra:
         base_params.update(extra)
-    params_tuples = _flatten_params(base_params)
-    resp = _safe_post(API_URL, params_tuples)
-    return resp.json()
+    return base_params
+
+def _build_live_params(
+    shop_ids: List[int],
+    source: str,
+    extra: Optional[Dict[str, Union[str, int, float]]],
+) -> List[Tuple[str, str]]:
+    base_params: Dict[str, Union[str, int, float, List, None]] = {
+        "source": source,   # 'locations'
+        "data": shop_ids
+    }
+    if extra:
+        base_params.update(extra)
+    return _flatten_params(base_params)
+
+def fetch_report(
+    *,
+    data: List[int],
+    data_output: List[str],
+    source: str = "shops",
+    period: str = "this_month",
+    period_step: str = "day",
+    company: Optional[int] = None,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    group_by: Optional[str] = None,
+    extra: Optional[Dict[str, Union[str, int, float]]] = None,
+    use_cache: bool = True,
+    shop_batch_size: Optional[int] = None,
+    window_days: Optional[int] = None,
+    max_workers: Optional[int] = None,
+    stale_while_revalidate: bool = False,
+    incremental: bool = False
+) -> Dict[str, Any]:
+    """
+    Report call (POST, herhaalde keys zonder []).
+    Opt-in fan-out: met shop_batch_size en/of window_days wordt de request
+    opgesplitst in shop-batches x datumvensters, parallel opgehaald (max_workers)
+    en samengevoegd tot dezelfde data[date][shop_id] vorm.
+    stale_while_revalidate: verlopen cache direct teruggeven en op de achtergrond
+    verversen (zie data_freshness() voor de "as of" tijd).
+    incremental: voor periodes t/m vandaag alleen de nieuwe dagen ophalen en in de
+    vorige payload mergen (window_days wordt dan genegeerd).
+    """
+    base_params = _build_report_params(
+        data=data, data_output=data_output, source=source, period=period, period_step=period_step,
+        company=company, date_from=date_from, date_to=date_to, group_by=group_by, extra=extra,
+    )
+    if incremental:
+        return _fetch_incremental(
+            base_params,
+            use_cache=use_cache,
+            shop_batch_size=shop_batch_size,
+            max_workers=max_workers,
+            stale_while_revalidate=stale_while_revalidate,
+        )
+    return _fetch_report_params(
+        base_params,
+        use_cache=use_cache,
+        shop_batch_size=shop_batch_size,
+        window_days=window_days,
+        max_workers=max_workers,
+        stale_while_revalidate=stale_while_revalidate,
+    )
 
 def fetch_live_locations(
     *,
@@ -119,36 +1071,154 @@ def fetch_live_locations(
     url = _derive_live_url_from_api()  # <— altijd host + /live-inside
     logger.info("Live URL resolved to: %s", url)
 
-    base_params: Dict[str, Union[str, int, float, List, None]] = {
-        "source": source,   # 'locations'
-        "data": shop_ids
-    }
-    if extra:
-        base_params.update(extra)
-
-    params_tuples = _flatten_params(base_params)
+    params_tuples = _build_live_params(shop_ids, source, extra)
     resp = _safe_post(url, params_tuples)  # POST met x-www-form-urlencoded
-    return resp.json()
+    return _decode_json(resp)
 
-def normalize_report_days_to_df(payload: Dict[str, Any]) -> pd.DataFrame:
-    rows = []
+def _numeric_column(values: List[Any], float_dtype: str) -> Any:
+    # Snel pad: alles numeriek (None -> NaN). Anders coerce, maar tekstkolommen heel laten.
+    try:
+        return np.asarray(values, dtype=float_dtype)
+    except (TypeError, ValueError):
+        col = pd.Series(values, dtype=object)
+        num = pd.to_numeric(col, errors="coerce")
+        if num.isna().sum() > col.isna().sum():
+            return col
+        return num.astype(float_dtype).to_numpy()
+
+def _collect_shop_columns(
+    groups: Any,
+) -> Tuple[List[str], List[int], List[int], Dict[str, List[Any]], int]:
+    """
+    Verzamelt (key, {shop_id: entry}) groepen in kolom-lijsten.
+    Geeft (group_keys, rows_per_group, shop_ids, metrics, n_rows) terug.
+    """
+    group_keys: List[str] = []
+    group_counts: List[int] = []
+    shop_ids: List[int] = []
+    metrics: Dict[str, List[Any]] = {}
+    seen: set = set()
+    n = 0
+    for group_key, shop_map in groups:
+        if not isinstance(shop_map, dict) or not shop_map:
+            continue
+        # Per groep met comprehensions werken i.p.v. een Python-loop per rij
+        vals = [e.get("data", e) if isinstance(e, dict) else {} for e in shop_map.values()]
+        try:
+            seen.update(*vals)
+        except TypeError:
+            vals = [d if isinstance(d, dict) else {} for d in vals]
+            seen.update(*vals)
+        if len(seen) > len(metrics):
+            # Nieuwe metric-keys in volgorde van voorkomen toevoegen (met None aanvullen)
+            for d in vals:
+                for k in d:
+                    if k not in metrics:
+                        metrics[k] = [None] * n
+        for k, col in metrics.items():
+            col.extend([d.get(k) for d in vals])
+        shop_ids.extend(map(int, shop_map.keys()))
+        group_keys.append(group_key)
+        group_counts.append(len(vals))
+        n += len(vals)
+    return group_keys, group_counts, shop_ids, metrics, n
+
+@timed("normalize.days")
+def normalize_report_days_to_df(payload: Dict[str, Any], float_dtype: str = "float64") -> pd.DataFrame:
+    """
+    Report payload data[date][shop_id] -> long DataFrame (date, shop_id, metrics...).
+    Bouwt in één pass getypeerde kolommen i.p.v. een dict per rij:
+    date als datetime64, shop_id als int32 en metrics als float_dtype.
+    Gesorteerd op (shop_id, date); sorteren wordt overgeslagen als de input al op volgorde is.
+    """
     data_block = payload.get("data") if isinstance(payload, dict) else None
     if not isinstance(data_block, dict):
         return pd.DataFrame()
-    for date_key, shop_map in data_block.items():
-        if not isinstance(shop_map, dict):
+
+    date_keys, date_counts, shop_ids, metrics, n = _collect_shop_columns(data_block.items())
+    if n == 0:
+        return pd.DataFrame()
+
+    # Datums één keer per unieke key parsen en daarna herhalen
+    dates = np.repeat(
+        pd.to_datetime(pd.Index(date_keys), format="ISO8601", errors="coerce").to_numpy(),
+        date_counts,
+    )
+    shops = np.asarray(shop_ids, dtype=np.int32)
+
+    columns: Dict[str, Any] = {"date": dates, "shop_id": shops}
+    for k, col in metrics.items():
+        if k not in columns:
+            columns[k] = _numeric_column(col, float_dtype)
+
+    date_i8 = dates.view("i8")
+    ordered = n < 2 or bool(np.all(
+        (shops[1:] > shops[:-1]) | ((shops[1:] == shops[:-1]) & (date_i8[1:] >= date_i8[:-1]))
+    ))
+    if not ordered:
+        order = np.lexsort((date_i8, shops))
+        columns = {k: v[order] if isinstance(v, np.ndarray) else v.iloc[order].reset_index(drop=True) for k, v in columns.items()}
+    return pd.DataFrame(columns)
+
+def _hour_timestamp(date_key: str, hour_key: Any) -> str:
+    hour = str(hour_key).strip()
+    if "-" in hour:          # al een volledige datetime
+        return hour
+    if hour.isdigit():       # '8' -> '08:00'
+        hour = f"{int(hour):02d}:00"
+    return f"{date_key} {hour}"
+
+def _iter_hourly_groups(data_block: Dict[str, Any]) -> Any:
+    # Twee vormen: data[date][hour][shop_id] (standaard) en data[date][shop_id]["dates"][hour]
+    for date_key, level in data_block.items():
+        if not isinstance(level, dict):
             continue
-        for shop_id, entry in shop_map.items():
-            data_dict = entry.get("data", entry) if isinstance(entry, dict) else {}
-            row = {"date": date_key, "shop_id": int(shop_id)}
-            if isinstance(data_dict, dict):
-                row.update({k: v for k, v in data_dict.items()})
-            rows.append(row)
-    df = pd.DataFrame(rows)
-    if not df.empty:
-        df = df.sort_values(["shop_id", "date"]).reset_index(drop=True)
-    return df
+        for key, value in level.items():
+            if not isinstance(value, dict):
+                continue
+            if str(key).isdigit() and isinstance(value.get("dates"), dict):
+                for hour_key, entry in value["dates"].items():
+                    yield _hour_timestamp(date_key, hour_key), {key: entry}
+            else:
+                yield _hour_timestamp(date_key, key), value
+
+@timed("normalize.hourly")
+def normalize_report_hourly_to_df(payload: Dict[str, Any], float_dtype: str = "float64") -> pd.DataFrame:
+    """
+    Hourly report payload -> DataFrame met MultiIndex (shop_id, timestamp).
+    - timestamp is één datetime64 kolom (datum + uur), geen losse date/uur strings
+    - shop_id is categorical; metrics als float_dtype
+    - index is gesorteerd, dus hdf.loc[shop_id] en tijd-slices zijn binary search
+    Gebruik .reset_index() om shop_id/timestamp als kolommen te krijgen (bv. voor plots).
+    """
+    data_block = payload.get("data") if isinstance(payload, dict) else None
+    if not isinstance(data_block, dict):
+        return pd.DataFrame()
+
+    ts_keys, ts_counts, shop_ids, metrics, n = _collect_shop_columns(_iter_hourly_groups(data_block))
+    if n == 0:
+        return pd.DataFrame()
+
+    stamps = np.repeat(
+        pd.to_datetime(pd.Index(ts_keys), format="ISO8601", errors="coerce").to_numpy(),
+        ts_counts,
+    )
+    shops = np.asarray(shop_ids, dtype=np.int32)
+    order = np.lexsort((stamps.view("i8"), shops))
+
+    columns = {}
+    for k, col in metrics.items():
+        if k in ("shop_id", "timestamp", "date"):
+            continue
+        values = _numeric_column(col, float_dtype)
+        columns[k] = values[order] if isinstance(values, np.ndarray) else values.iloc[order].to_numpy()
+    index = pd.MultiIndex.from_arrays(
+        [pd.Categorical(shops[order]), stamps[order]],
+        names=["shop_id", "timestamp"],
+    )
+    return pd.DataFrame(columns, index=index)
 
+@timed("normalize.live")
 def normalize_live_to_df(payload: Dict[str, Any]) -> pd.DataFrame:
     rows = []
     data_block = payload.get("data") if isinstance(payload, dict) else None
@@ -175,36 +1245,327 @@ def fetch_report_hourly(
     date_from: Optional[str] = None,
     date_to: Optional[str] = None,
     group_by: Optional[str] = None,
-    extra: Optional[Dict[str, Union[str, int, float]]] = None
+    extra: Optional[Dict[str, Union[str, int, float]]] = None,
+    use_cache: bool = True,
+    shop_batch_size: Optional[int] = None,
+    window_days: Optional[int] = None,
+    max_workers: Optional[int] = None,
+    stale_while_revalidate: bool = False,
+    incremental: bool = False
 ) -> Dict[str, Any]:
     """
     Shortcut voor hourly report calls.
     - period_step is altijd 'hour'
     - POST met herhaalde keys zonder []
     - Werkt hetzelfde als fetch_report maar geforceerd naar hourly granulariteit
+    - Resultaat gaat via dezelfde procesbrede cache (use_cache=False om te omzeilen)
+    - Ondersteunt dezelfde opt-in fan-out (shop_batch_size/window_days) en
+      stale_while_revalidate als fetch_report
+    - incremental=True: alleen de uren vanaf de laatste (onvolledige) dag opnieuw ophalen
     """
-    if not API_URL:
-        raise RuntimeError("API_URL ontbreekt (zet in .streamlit/secrets.toml).")
-    if data and company:
-        logger.info("`company` genegeerd omdat `data` is opgegeven.")
-    base_params: Dict[str, Union[str, int, float, List, None]] = {
-        "source": source,
-        "period": period,
-        "period_step": "hour",
-        "data": data,
-        "data_output": data_output,
-    }
-    if not data:
-        base_params["company"] = company
-    if period == "date":
-        if not date_from or not date_to:
-            raise ValueError("Voor period='date' zijn 'date_from' en 'date_to' verplicht (YYYY-MM-DD).")
-        base_params["date_from"] = date_from
-        base_params["date_to"] = date_to
-    if group_by:
-        base_params["group_by"] = group_by
-    if extra:
-        base_params.update(extra)
-    params_tuples = _flatten_params(base_params)
-    resp = _safe_post(API_URL, params_tuples)
-    return resp.json()
+    base_params = _build_report_params(
+        data=data, data_output=data_output, source=source, period=period, period_step="hour",
+        company=company, date_from=date_from, date_to=date_to, group_by=group_by, extra=extra,
+    )
+    if incremental:
+        return _fetch_incremental(
+            base_params,
+            use_cache=use_cache,
+            shop_batch_size=shop_batch_size,
+            max_workers=max_workers,
+            stale_while_revalidate=stale_while_revalidate,
+        )
+    return _fetch_report_params(
+        base_params,
+        use_cache=use_cache,
+        shop_batch_size=shop_batch_size,
+        window_days=window_days,
+        max_workers=max_workers,
+        stale_while_revalidate=stale_while_revalidate,
+    )
+
+# -------------------- Async varianten --------------------
+# Async tegenhangers van de fetch functies, zodat een pagina meerdere calls
+# tegelijk kan afvuren (latency = max i.p.v. som). gather_fetches draait op één
+# procesbrede event loop (daemon thread) met één langlevende httpx.AsyncClient, zodat
+# keep-alive verbindingen over reruns heen blijven; cache en retry-regels zijn gelijk aan sync.
+
+_ASYNC_CLIENT: "ContextVar[Optional[Any]]" = ContextVar("pfm_async_client", default=None)
+
+def _new_async_client() -> Any:
+    connect, read = DEFAULT_TIMEOUT
+    return httpx.AsyncClient(
+        limits=httpx.Limits(max_connections=HTTP_POOL_SIZE, max_keepalive_connections=HTTP_POOL_SIZE),
+        headers={"Content-Type": "application/x-www-form-urlencoded", "Accept-Encoding": "gzip, deflate"},
+        timeout=httpx.Timeout(read, connect=connect),
+    )
+
+class _AsyncRunner:
+    """Eén event loop in een daemon thread per proces, met één gedeelde AsyncClient."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._client: Optional[Any] = None
+
+    @property
+    def loop(self) -> Optional[asyncio.AbstractEventLoop]:
+        return self._loop
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="pfm-async", daemon=True).start()
+                self._loop = loop
+            return self._loop
+
+    def client(self) -> Any:
+        # Alleen vanuit de runner-loop aanroepen: de verbindingen horen bij die loop
+        if self._client is None:
+            self._client = _new_async_client()
+        return self._client
+
+    def run(self, coro: Awaitable[Any]) -> Any:
+        """Voer coro uit op de runner-loop met de context van de caller (spans/versheid)."""
+        loop = self._ensure_loop()
+        ctx = copy_context()
+
+        async def _in_caller_context() -> Any:
+            # De task neemt de context over die actief is bij create_task
+            return await ctx.run(loop.create_task, coro)
+
+        return asyncio.run_coroutine_threadsafe(_in_caller_context(), loop).result()
+
+_ASYNC_RUNNER = _AsyncRunner()
+
+@asynccontextmanager
+async def _async_client_scope() -> AsyncIterator[Any]:
+    client = _ASYNC_CLIENT.get()
+    if client is not None:
+        yield client
+        return
+    if HAS_HTTPX and asyncio.get_running_loop() is _ASYNC_RUNNER.loop:
+        yield _ASYNC_RUNNER.client()
+        return
+    async with _new_async_client() as client:
+        yield client
+
+async def _asafe_post(url: str, params_tuples: List[Tuple[str, str]]) -> Any:
+    logger.info("POST (async) %s", url)
+    with span("http.post.async", endpoint=urlsplit(url).path) as rec:
+        resp = await _asafe_post_inner(url, params_tuples)
+        rec["status"] = resp.status_code
+        rec["bytes"] = len(resp.content)
+    return resp
+
+# Per event loop een asyncio.Semaphore per endpoint: async calls wachten daarop zonder
+# te pollen; daarnaast geldt de procesbrede (threading) limiet die ook de sync calls delen
+_loop_sems: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, asyncio.Semaphore]]" = weakref.WeakKeyDictionary()
+
+def _async_endpoint_semaphore(url: str) -> asyncio.Semaphore:
+    path = urlsplit(url).path.rstrip("/")
+    loop = asyncio.get_running_loop()
+    with _endpoint_sems_lock:
+        sems = _loop_sems.setdefault(loop, {})
+        sem = sems.get(path)
+        if sem is None:
+            sem = sems[path] = asyncio.Semaphore(ENDPOINT_CONCURRENCY.get(path, DEFAULT_CONCURRENCY))
+        return sem
+
+async def _acquire_thread_sem(sem: threading.BoundedSemaphore) -> None:
+    if sem.acquire(blocking=False):
+        return
+    # Procesbreed vol (sync calls): in een thread wachten. Bij een cancel pakt die thread
+    # de slot mogelijk alsnog; dan meteen weer vrijgeven zodat de limiet niet krimpt.
+    fut = asyncio.get_running_loop().run_in_executor(None, sem.acquire)
+    try:
+        await asyncio.shield(fut)
+    except asyncio.CancelledError:
+        fut.add_done_callback(lambda f: sem.release() if not f.cancelled() and f.exception() is None else None)
+        raise
+
+async def _apost_limited(client: Any, url: str, body: str, timeout: Any) -> Any:
+    sem = _endpoint_semaphore(url)
+    async with _async_endpoint_semaphore(url):
+        await _acquire_thread_sem(sem)
+        try:
+            return await client.post(url, content=body, timeout=timeout)
+        finally:
+            sem.release()
+
+async def _asafe_post_inner(url: str, params_tuples: List[Tuple[str, str]]) -> Any:
+    connect, read = _timeout_for(url)
+    timeout = httpx.Timeout(read, connect=connect)
+    body = urlencode(params_tuples)
+    start = time.perf_counter()
+    attempt = 0
+    async with _async_client_scope() as client:
+        while True:
+            try:
+                resp = await _apost_limited(client, url, body, timeout)
+            except httpx.TransportError as e:
+                wait = _retry_wait(attempt)
+                if attempt >= HTTP_MAX_RETRIES or isinstance(e, httpx.ReadTimeout) or _past_deadline(start, wait):
+                    HTTP_STATS.record(time.perf_counter() - start, attempt, ok=False)
+                    raise
+                logger.warning("POST %s mislukt (%s); retry %d/%d over %.2fs", url, e.__class__.__name__, attempt + 1, HTTP_MAX_RETRIES, wait)
+            else:
+                if resp.status_code not in RETRY_STATUS or attempt >= HTTP_MAX_RETRIES:
+                    break
+                wait = _retry_wait(attempt, resp.headers)
+                if _past_deadline(start, wait):
+                    break
+                logger.warning("HTTP %s van %s; retry %d/%d over %.2fs", resp.status_code, url, attempt + 1, HTTP_MAX_RETRIES, wait)
+            attempt += 1
+            await asyncio.sleep(wait)
+    try:
+        resp.raise_for_status()
+    except httpx.HTTPStatusError as e:
+        HTTP_STATS.record(time.perf_counter() - start, attempt, ok=False)
+        logger.error("HTTP %s: %s | Detail: %s", resp.status_code, e, resp.text[:800])
+        raise
+    HTTP_STATS.record(time.perf_counter() - start, attempt, ok=True)
+    return resp
+
+async def _apost_report(url: str, params_tuples: List[Tuple[str, str]], ttl: int, use_cache: bool = True) -> Dict[str, Any]:
+    key = _cache_key(url, params_tuples)
+    if use_cache:
+        with span("cache.lookup") as rec:
+            cached = REPORT_CACHE.get(key)
+            rec["hit"] = cached is not None
+        if cached is not None:
+            logger.info("Cache hit: %s", url)
+            return cached
+
+    async def _load() -> Dict[str, Any]:
+        if use_cache:
+            cached = REPORT_CACHE.peek(key)
+            if cached is not None:
+                return cached
+        resp = await _asafe_post(url, params_tuples)
+        payload = _decode_json(resp)
+        if use_cache:
+            REPORT_CACHE.put(key, payload, size=len(resp.content), ttl=ttl)
+        return payload
+
+    return await SINGLE_FLIGHT.ado((key, use_cache), _load)
+
+async def _afetch_report_params(
+    base_params: Dict[str, Any],
+    *,
+    use_cache: bool,
+    shop_batch_size: Optional[int] = None,
+    window_days: Optional[int] = None,
+    max_workers: Optional[int] = None,
+) -> Dict[str, Any]:
+    chunks = _split_report_params(base_params, shop_batch_size, window_days)
+    sem = asyncio.Semaphore(max(1, max_workers or FANOUT_MAX_WORKERS))
+
+    async def _one(p: Dict[str, Any]) -> Dict[str, Any]:
+        async with sem:
+            ttl = _ttl_for_period(p.get("period"), p.get("date_to"))
+            return await _apost_report(API_URL, _flatten_params(p), ttl=ttl, use_cache=use_cache)
+
+    if len(chunks) == 1:
+        return await _one(chunks[0])
+    payloads = await asyncio.gather(*(_one(p) for p in chunks))
+    return merge_report_payloads(list(payloads))
+
+async def afetch_report(
+    *,
+    data: List[int],
+    data_output: List[str],
+    source: str = "shops",
+    period: str = "this_month",
+    period_step: str = "day",
+    company: Optional[int] = None,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    group_by: Optional[str] = None,
+    extra: Optional[Dict[str, Union[str, int, float]]] = None,
+    use_cache: bool = True,
+    shop_batch_size: Optional[int] = None,
+    window_days: Optional[int] = None,
+    max_workers: Optional[int] = None
+) -> Dict[str, Any]:
+    """Async variant van fetch_report (zelfde parameters en payload)."""
+    kwargs = dict(
+        data=data, data_output=data_output, source=source, period=period, period_step=period_step,
+        company=company, date_from=date_from, date_to=date_to, group_by=group_by, extra=extra,
+    )
+    fanout = dict(shop_batch_size=shop_batch_size, window_days=window_days, max_workers=max_workers)
+    if not HAS_HTTPX:
+        return await asyncio.to_thread(partial(fetch_report, use_cache=use_cache, **kwargs, **fanout))
+    return await _afetch_report_params(_build_report_params(**kwargs), use_cache=use_cache, **fanout)
+
+async def afetch_report_hourly(
+    *,
+    data: List[int],
+    data_output: List[str],
+    source: str = "shops",
+    period: str = "last_week",
+    company: Optional[int] = None,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    group_by: Optional[str] = None,
+    extra: Optional[Dict[str, Union[str, int, float]]] = None,
+    use_cache: bool = True,
+    shop_batch_size: Optional[int] = None,
+    window_days: Optional[int] = None,
+    max_workers: Optional[int] = None
+) -> Dict[str, Any]:
+    """Async variant van fetch_report_hourly (period_step altijd 'hour')."""
+    return await afetch_report(
+        data=data, data_output=data_output, source=source, period=period, period_step="hour",
+        company=company, date_from=date_from, date_to=date_to, group_by=group_by, extra=extra,
+        use_cache=use_cache, shop_batch_size=shop_batch_size, window_days=window_days, max_workers=max_workers,
+    )
+
+async def afetch_live_locations(
+    *,
+    shop_ids: List[int],
+    source: str = "locations",
+    extra: Optional[Dict[str, Union[str, int, float]]] = None
+) -> Dict[str, Any]:
+    """Async variant van fetch_live_locations (nooit gecachet)."""
+    if not HAS_HTTPX:
+        return await asyncio.to_thread(partial(fetch_live_locations, shop_ids=shop_ids, source=source, extra=extra))
+    url = _derive_live_url_from_api()
+    resp = await _asafe_post(url, _build_live_params(shop_ids, source, extra))
+    return _decode_json(resp)
+
+def _run_sync(coro: Awaitable[Any]) -> Any:
+    try:
+        running = asyncio.get_running_loop()
+    except RuntimeError:
+        running = None
+    if running is None or running is not _ASYNC_RUNNER.loop:
+        return _ASYNC_RUNNER.run(coro)
+    # Aangeroepen vanuit de runner-loop zelf (blokkeren zou die loop vastzetten): eigen
+    # loop in een eigen thread, met de context van de caller
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        return pool.submit(copy_context().run, asyncio.run, coro).result()
+
+def gather_fetches(*calls: Awaitable[Any], return_exceptions: bool = False) -> List[Any]:
+    """
+    Synchroon aan te roepen vanuit een Streamlit pagina: voert de gegeven
+    afetch_* coroutines gelijktijdig uit over één gedeelde client en geeft
+    de resultaten in dezelfde volgorde terug.
+
+        live, day = gather_fetches(
+            afetch_live_locations(shop_ids=[shop_id]),
+            afetch_report(data=[shop_id], data_output=["count_in"], period="today"),
+        )
+    """
+    async def _main() -> List[Any]:
+        # Op de runner-loop pakt _async_client_scope vanzelf de gedeelde client
+        if not HAS_HTTPX or asyncio.get_running_loop() is _ASYNC_RUNNER.loop:
+            return list(await asyncio.gather(*calls, return_exceptions=return_exceptions))
+        async with _new_async_client() as client:
+            token = _ASYNC_CLIENT.set(client)
+            try:
+                return list(await asyncio.gather(*calls, return_exceptions=return_exceptions))
+            finally:
+                _ASYNC_CLIENT.reset(token)
+    return _run_sync(_main())